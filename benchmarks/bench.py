@@ -0,0 +1,234 @@
+import argparse
+import hashlib
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from magic_carpet.embedders import Embedder
+from magic_carpet.evaluators import Evaluator
+from magic_carpet.models import NamedModel
+from magic_carpet.models.model_containers import ModelList, NamedModelDict
+from magic_carpet.utils import generate, make_requests
+
+class SyntheticEmbedder(Embedder):
+    # deterministic unit vectors seeded by the text, so runs are reproducible offline
+    def __init__(self, d: int = 256, **kwargs):
+        self.d = d
+
+    def embed(self, inputs: list[str], **kwargs):
+        vectors = np.empty((len(inputs), self.d), dtype=np.float32)
+        for i, input in enumerate(inputs):
+            seed = int.from_bytes(hashlib.blake2b(input.encode(), digest_size=8).digest(), "little")
+            vectors[i] = np.random.default_rng(seed).standard_normal(self.d)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def stub_model(name: str, latency: float = 0.0) -> NamedModel:
+    def run(input, **kwargs):
+        if latency > 0:
+            time.sleep(latency)
+        return f"{name}:{input}"
+    return NamedModel(name=name, function=run)
+
+def stub_evaluator(i: int) -> Evaluator:
+    def evaluate(input, response):
+        return float(len(response) % (i + 2))
+    return Evaluator(evaluate)
+
+def synthetic_data(num_rows: int, num_models: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    data = {"prompt": [f"prompt {i}" for i in range(num_rows)]}
+    for m in range(num_models):
+        data[f"model_{m}"] = rng.random(num_rows)
+    return pd.DataFrame(data)
+
+def measure(function, repeat: int = 5, warmup: int = 1) -> dict:
+    for _ in range(warmup):
+        function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    # tracing slows allocation down, so peak memory comes from one separate run
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    times = np.array(times)
+    return {
+        "repeat": repeat,
+        "mean": float(times.mean()),
+        "min": float(times.min()),
+        "p50": float(np.quantile(times, 0.5)),
+        "p95": float(np.quantile(times, 0.95)),
+        "peak_memory_bytes": int(peak),
+    }
+
+def bench_generate(quick: bool, repeat: int) -> list[dict]:
+    results = []
+    grid = [(1, 10, 1), (4, 10, 1), (4, 100, 1), (4, 100, 4)] if quick else \
+        [(1, 10, 1), (4, 10, 1), (16, 10, 1), (4, 100, 1), (4, 1000, 1), (4, 100, 4), (16, 100, 4)]
+    for num_models, num_inputs, num_evaluators in grid:
+        for executor, latency in (("serial", 0.0), ("thread", 0.001)):
+            models = [stub_model(f"model_{m}", latency) for m in range(num_models)]
+            evaluators = [stub_evaluator(e) for e in range(num_evaluators)]
+            requests, model_container, eval_container = make_requests([([f"input {i}" for i in range(num_inputs)], models, evaluators)])
+            stats = measure(lambda: generate(requests, model_container, eval_container, executor=executor), repeat=repeat)
+            stats["throughput"] = num_models * num_inputs / stats["mean"]
+            results.append({
+                "benchmark": "generate",
+                "params": {"models": num_models, "inputs": num_inputs, "evaluators": num_evaluators, "executor": executor, "model_latency": latency},
+                **stats,
+            })
+    return results
+
+def bench_nn_router(quick: bool, repeat: int) -> list[dict]:
+    from magic_carpet.routers.nn_router import NNRouter
+    results = []
+    embedder = SyntheticEmbedder(256)
+    queries = [f"query {i}" for i in range(64)]
+    for corpus in ([1000, 10000] if quick else [1000, 10000, 100000]):
+        data = synthetic_data(corpus, 4)
+        model_cols = [col for col in data.columns if col != "prompt"]
+        models = [stub_model(col) for col in model_cols]
+        for k in [1, 10, 100]:
+            router = NNRouter(models, data, model_cols=model_cols, embedder=embedder, k=k)
+            single = measure(lambda: router.route(queries[0]), repeat=repeat * 10)
+            batch = measure(lambda: router.route_batch(queries), repeat=repeat)
+            batch["throughput"] = len(queries) / batch["mean"]
+            results.append({"benchmark": "nn_router.route", "params": {"corpus": corpus, "k": k}, **single})
+            results.append({"benchmark": "nn_router.route_batch", "params": {"corpus": corpus, "k": k, "batch": len(queries)}, **batch})
+    return results
+
+def bench_model_map_router(quick: bool, repeat: int) -> list[dict]:
+    from magic_carpet.routers.model_map_router import ModelMapRouter
+    results = []
+    queries = [f"query {i}" for i in range(64)]
+    for d in ([128, 512] if quick else [128, 512, 1536]):
+        data = synthetic_data(2000, 4)
+        model_cols = [col for col in data.columns if col != "prompt"]
+        models = [stub_model(col) for col in model_cols]
+        router = ModelMapRouter(models, data, model_cols=model_cols, embedder=SyntheticEmbedder(d), model_dim=min(64, d // 2))
+        single = measure(lambda: router.route(queries[0]), repeat=repeat * 10)
+        batch = measure(lambda: router.route_batch(queries), repeat=repeat)
+        batch["throughput"] = len(queries) / batch["mean"]
+        results.append({"benchmark": "model_map_router.route", "params": {"dim": d}, **single})
+        results.append({"benchmark": "model_map_router.route_batch", "params": {"dim": d, "batch": len(queries)}, **batch})
+    return results
+
+def bench_containers(quick: bool, repeat: int) -> list[dict]:
+    results = []
+    for n in ([100, 1000] if quick else [100, 1000, 10000]):
+        models = [stub_model(f"model_{i}") for i in range(n)]
+        for container_type in (ModelList, NamedModelDict):
+            def add():
+                container = container_type()
+                for model in models:
+                    container.add(model)
+                return container
+            container = add()
+            stats = measure(add, repeat=repeat)
+            results.append({"benchmark": "container.add", "params": {"container": container_type.__name__, "n": n}, **stats})
+            stats = measure(lambda: [container.has(model) for model in models], repeat=repeat)
+            results.append({"benchmark": "container.has", "params": {"container": container_type.__name__, "n": n}, **stats})
+    return results
+
+IMPORT_BUDGET = 0.25
+HEAVY_MODULES = ("requests", "numpy", "pandas", "faiss", "sklearn", "openai")
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import magic_carpet
+from magic_carpet import NamedModel, NamedRouter
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "heavy_modules": [m for m in %r if m in sys.modules]}))
+"""
+
+def bench_import(quick: bool, repeat: int) -> list[dict]:
+    # each run uses a fresh interpreter so nothing is already in sys.modules
+    times, heavy = [], set()
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, "-c", IMPORT_SCRIPT % (HEAVY_MODULES,)], capture_output=True, text=True, check=True).stdout
+        run = json.loads(output.strip().splitlines()[-1])
+        times.append(run["seconds"])
+        heavy.update(run["heavy_modules"])
+    times = np.array(times)
+    return [{
+        "benchmark": "import",
+        "params": {"modules": "magic_carpet"},
+        "repeat": repeat,
+        "mean": float(times.mean()),
+        "min": float(times.min()),
+        "p50": float(np.quantile(times, 0.5)),
+        "p95": float(np.quantile(times, 0.95)),
+        "heavy_modules": sorted(heavy),
+    }]
+
+def check_import_budget(results: list[dict], budget: float) -> list[str]:
+    failures = []
+    for result in results:
+        if result["benchmark"] != "import":
+            continue
+        if result["p50"] > budget:
+            failures.append(f"import magic_carpet took {result['p50']:.3f}s (p50), over the {budget:.3f}s budget.")
+        if len(result["heavy_modules"]) > 0:
+            failures.append(f"import magic_carpet loaded optional dependencies {result['heavy_modules']}.")
+    return failures
+
+BENCHMARKS = {
+    "import": bench_import,
+    "generate": bench_generate,
+    "nn_router": bench_nn_router,
+    "model_map_router": bench_model_map_router,
+    "containers": bench_containers,
+}
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "commit": commit,
+        "timestamp": time.time(),
+    }
+
+def run(benchmarks: list[str] = None, quick: bool = False, repeat: int = 5) -> dict:
+    results = []
+    for name in (list(BENCHMARKS) if benchmarks is None else benchmarks):
+        if name not in BENCHMARKS:
+            raise ValueError(f"Unknown benchmark {name}, expected one of {list(BENCHMARKS)}.")
+        print(f"running {name}", file=sys.stderr)
+        results.extend(BENCHMARKS[name](quick, repeat))
+    return {"environment": environment(), "results": results}
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for magic-carpet routing and generation.")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=None)
+    parser.add_argument("--quick", action="store_true", help="smaller grids, for CI")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=None, help="write JSON results here instead of stdout")
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET, help="fail if import magic_carpet is slower than this many seconds")
+    args = parser.parse_args()
+    report = run(args.only, quick=args.quick, repeat=args.repeat)
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    failures = check_import_budget(report["results"], args.import_budget)
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    if len(failures) > 0:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,21 @@
-from magic_carpet.carpet_client import CarpetClient
-from magic_carpet.evaluators import Evaluator, NamedEvaluator
-from magic_carpet.models import Model, NamedModel
-from magic_carpet.routers import Router, NamedRouter
+from typing import TYPE_CHECKING
+from magic_carpet.common.imports import lazy_exports
+
+if TYPE_CHECKING:
+    from magic_carpet.carpet_client import CarpetClient
+    from magic_carpet.evaluators import Evaluator, NamedEvaluator
+    from magic_carpet.models import Model, NamedModel
+    from magic_carpet.routers import Router, NamedRouter
+
+__getattr__, __dir__ = lazy_exports(__name__, {
+    "CarpetClient": "magic_carpet.carpet_client",
+    "Evaluator": "magic_carpet.evaluators.evaluator",
+    "NamedEvaluator": "magic_carpet.evaluators.evaluator",
+    "Model": "magic_carpet.models.model",
+    "NamedModel": "magic_carpet.models.model",
+    "Router": "magic_carpet.routers.router",
+    "NamedRouter": "magic_carpet.routers.router"
+})
 
 __all__ = [
     "CarpetClient",
@@ -11,4 +25,4 @@ __all__ = [
     "NamedEvaluator",
     "NamedModel",
     "NamedRouter"
-]
\ No newline at end of file
+]
@@ -1,17 +1,131 @@
-import requests
+import gzip
 import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, Union
+from magic_carpet.common.imports import require
+
+requests = require("requests", "client")
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 class CarpetClient:
-    def __init__(self, url, api_key, *args, **kwargs):
+    def __init__(
+            self,
+            url,
+            api_key,
+            *args,
+            pool_size: int = 8,
+            max_retries: int = 3,
+            backoff: float = 0.5,
+            timeout: float = 60.0,
+            compress: bool = True,
+            session: requests.Session = None,
+            **kwargs
+        ):
         self.url = url
         self.api_key = api_key
-        
-    def load_generations(self, file_path, dataset_name):
-        params = {
-            'datasetName': dataset_name,
-            'apiKey': self.api_key
-        }
-        with open(file_path, 'r') as f:
-            data = json.load(f)
-        response = requests.post(self.url + "/api/eval", params=params, json=data, headers={'Content-Type': 'application/json'})
-        return response
\ No newline at end of file
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.compress = compress
+        self.session = session if session is not None else self.make_session(pool_size, max_retries, backoff)
+
+    @staticmethod
+    def make_session(pool_size: int, max_retries: int, backoff: float) -> requests.Session:
+        # uploads are idempotent per chunk, so POSTs are retried on connection errors and transient statuses
+        retry = Retry(total=max_retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=None, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def post(self, body: bytes, params: dict) -> requests.Response:
+        headers = {'Content-Type': 'application/json'}
+        if self.compress:
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        return self.session.post(self.url + "/api/eval", params=params, data=body, headers=headers, timeout=self.timeout)
+
+    def load_generations(self, file_path, dataset_name, **kwargs) -> Union[requests.Response, list[requests.Response]]:
+        # a single JSON document is still sent in one request and returns its response; JSONL dumps are streamed in
+        # chunks and return one response per chunk, in chunk order
+        if str(file_path).endswith(".jsonl"):
+            return self.upload_generations(file_path, dataset_name, **kwargs)
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        return self.post(data, {'datasetName': dataset_name, 'apiKey': self.api_key})
+
+    def upload_generations(
+            self,
+            generations: Union[str, os.PathLike, Iterable[dict]],
+            dataset_name: str,
+            max_chunk_bytes: int = 8 * 1024 * 1024,
+            max_chunk_records: int = 10000,
+            max_concurrency: int = None
+        ) -> list[requests.Response]:
+        # generations is a JSONL path or any iterable of records, e.g. generate() or generate_stream() output. Chunks
+        # are posted concurrently and may arrive in any order, so each carries its index as chunk and the last one also
+        # carries the total as chunks, which lets the server reassemble them
+        max_concurrency = self.pool_size if max_concurrency is None else max_concurrency
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be at least 1, got {max_concurrency}.")
+        chunks = chunk_records(iter_lines(generations), max_chunk_bytes, max_chunk_records)
+        responses = {}
+        with ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+            futures = {}
+            # at most max_concurrency encoded chunks are held in memory at a time
+            for i, (chunk, last) in enumerate(mark_last(chunks)):
+                if len(futures) >= max_concurrency:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        responses[futures.pop(future)] = future.result()
+                params = {'datasetName': dataset_name, 'apiKey': self.api_key, 'chunk': i}
+                if last:
+                    params['chunks'] = i + 1
+                futures[pool.submit(self.post, chunk, params)] = i
+            for future in futures:
+                responses[futures[future]] = future.result()
+        return [responses[i] for i in range(len(responses))]
+
+def iter_lines(generations: Union[str, os.PathLike, Iterable[dict]]) -> Iterator[bytes]:
+    if isinstance(generations, (str, os.PathLike)):
+        with open(generations, 'rb') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+    else:
+        for record in generations:
+            yield json.dumps(record).encode()
+
+def mark_last(items: Iterable) -> Iterator[tuple]:
+    # yields (item, is_last), reading one item ahead
+    end = object()
+    items = iter(items)
+    current = next(items, end)
+    while current is not end:
+        following = next(items, end)
+        yield current, following is end
+        current = following
+
+def chunk_records(lines: Iterable[bytes], max_chunk_bytes: int, max_chunk_records: int) -> Iterator[bytes]:
+    # each chunk is a JSON array of records, the same payload load_generations has always sent
+    chunk, size = [], 0
+    for line in lines:
+        if chunk and (size + len(line) > max_chunk_bytes or len(chunk) >= max_chunk_records):
+            yield b"[" + b",".join(chunk) + b"]"
+            chunk, size = [], 0
+        chunk.append(line)
+        size += len(line) + 1
+    if chunk:
+        yield b"[" + b",".join(chunk) + b"]"
@@ -0,0 +1,103 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from typing import Callable
+from magic_carpet.common.metrics import METRICS
+
+_batchers = weakref.WeakSet()
+
+def _reset_after_fork():
+    # a forked child inherits the parent's queue and worker handle but not its thread
+    for batcher in list(_batchers):
+        batcher._reset()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+class DynamicBatcher:
+    def __init__(self, function: Callable[[list], list], max_batch_size: int = 64, max_wait: float = 0.0, name=None, **kwargs):
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be at least 1, got {max_batch_size}.")
+        self.function = function
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.name = function if name is None else name
+        self.batches = 0
+        self.items = 0
+        self._reset()
+        _batchers.add(self)
+
+    def _reset(self):
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    def __getstate__(self):
+        # the queue, lock and worker thread belong to this process and are recreated on unpickling
+        state = dict(self.__dict__)
+        for key in ("_queue", "_lock", "_worker"):
+            state.pop(key, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+        _batchers.add(self)
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        self._queue.put((item, future))
+        self.start()
+        return future
+
+    def submit_many(self, items: list) -> list[Future]:
+        return [self.submit(item) for item in items]
+
+    async def asubmit(self, item):
+        return await asyncio.wrap_future(self.submit(item))
+
+    def start(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self.work, daemon=True)
+                self._worker.start()
+
+    def collect(self) -> list:
+        # block for the first item, then take whatever else arrives before the batch is full or max_wait elapses
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def work(self):
+        while True:
+            batch = [(item, future) for item, future in self.collect() if future.set_running_or_notify_cancel()]
+            if len(batch) == 0:
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            METRICS.batch("batch", self.name, len(batch))
+            try:
+                results = list(self.function([item for item, _ in batch]))
+                if len(results) != len(batch):
+                    raise ValueError(f"Batch function returned {len(results)} results for {len(batch)} items.")
+            except BaseException as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
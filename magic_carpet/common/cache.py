@@ -0,0 +1,183 @@
+import hashlib
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+
+MISSING = object()
+
+def hash_key(name: str, args: tuple = (), kwargs: dict = None) -> str:
+    kwargs = {} if kwargs is None else kwargs
+    payload = (name, tuple(args), sorted(kwargs.items()))
+    try:
+        data = pickle.dumps(payload, protocol=4)
+    except Exception:
+        data = repr(payload).encode()
+    return hashlib.sha256(data).hexdigest()
+
+def callable_name(function: Callable) -> str:
+    name = getattr(function, "name", None)
+    if isinstance(name, str):
+        return name
+    function = getattr(function, "run", getattr(function, "evaluate", function))
+    qualname = getattr(function, "__qualname__", None)
+    if qualname is None or "<lambda>" in qualname or "<locals>" in qualname:
+        raise ValueError(f"Cannot derive a stable cache name for {function}, pass name explicitly.")
+    return f"{function.__module__}.{qualname}"
+
+class ResponseCache:
+    def __init__(self, path: str = None, max_entries: int = 1024, max_disk_entries: int = None, ttl: float = None, flush_every: int = 256, **kwargs):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.ttl = ttl
+        self.flush_every = flush_every
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self._memory = OrderedDict()
+        # access times of hits not yet written to disk, flushed in one batch rather than one commit per hit
+        self._touched = {}
+        self._lock = threading.RLock()
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value BLOB, created REAL, accessed REAL)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+            self._db.commit()
+            self._disk_count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def __len__(self):
+        if self._db is not None:
+            return self._disk_count
+        return len(self._memory)
+
+    def __contains__(self, key):
+        return self.get(key, record=False) is not MISSING
+
+    def expired(self, created: float, now: float = None):
+        return (self.ttl is not None) and (created + self.ttl < (time.time() if now is None else now))
+
+    def get(self, key: str, default=MISSING, record: bool = True):
+        now = time.time()
+        with self._lock:
+            if key in self._memory:
+                value, created = self._memory[key]
+                if not self.expired(created, now):
+                    self._memory.move_to_end(key)
+                    self.touch(key, now)
+                    if record:
+                        self.hits += 1
+                        self.memory_hits += 1
+                    return value
+                self.delete(key)
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    if not self.expired(row[1], now):
+                        value = pickle.loads(row[0])
+                        self.remember(key, value, row[1])
+                        self.touch(key, now)
+                        if record:
+                            self.hits += 1
+                            self.disk_hits += 1
+                        return value
+                    self.delete(key)
+
+            if record:
+                self.misses += 1
+            return default
+
+    def set(self, key: str, value):
+        now = time.time()
+        with self._lock:
+            self.remember(key, value, now)
+            if self._db is not None:
+                self._touched.pop(key, None)
+                # pending access times go in first so eviction below sees the true recency order
+                self.flush(commit=False)
+                exists = self._db.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone() is not None
+                self._db.execute("INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)", (key, pickle.dumps(value, protocol=4), now, now))
+                self._disk_count += (not exists)
+                if (self.max_disk_entries is not None) and (self._disk_count > self.max_disk_entries):
+                    overflow = self._disk_count - self.max_disk_entries
+                    self._db.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses ORDER BY accessed LIMIT ?)", (overflow,))
+                    self._disk_count -= overflow
+                    self.evictions += overflow
+                self._db.commit()
+
+    def remember(self, key: str, value, created: float):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while (self.max_entries is not None) and (len(self._memory) > self.max_entries):
+            self._memory.popitem(last=False)
+            if self._db is None:
+                self.evictions += 1
+
+    def touch(self, key: str, now: float):
+        if self._db is None:
+            return
+        self._touched[key] = now
+        if len(self._touched) >= self.flush_every:
+            self.flush()
+
+    def flush(self, commit: bool = True):
+        with self._lock:
+            if (self._db is None) or (not self._touched):
+                return
+            self._db.executemany("UPDATE responses SET accessed = ? WHERE key = ?", [(now, key) for key, now in self._touched.items()])
+            self._touched.clear()
+            if commit:
+                self._db.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            self._memory.pop(key, None)
+            self._touched.pop(key, None)
+            if self._db is not None:
+                deleted = self._db.execute("DELETE FROM responses WHERE key = ?", (key,)).rowcount
+                self._disk_count -= deleted
+                self._db.commit()
+
+    def expire(self):
+        if self.ttl is None:
+            return
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for key in [key for key, (_, created) in self._memory.items() if created < cutoff]:
+                del self._memory[key]
+            if self._db is not None:
+                self._disk_count -= self._db.execute("DELETE FROM responses WHERE created < ?", (cutoff,)).rowcount
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+                self._disk_count = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+        }
+
+    def close(self):
+        if self._db is not None:
+            self.flush()
+            self._db.close()
+            self._db = None
@@ -1,3 +1,5 @@
+from collections.abc import Sequence
+
 class BaseContainer:
     def __init__(self, objects: list = [], **kwargs):
         self.objects = objects
@@ -66,24 +68,46 @@ class FormatContainer(BaseContainer):
     def add(self, object):
         raise NotImplementedError
     
+class ListView(Sequence):
+    def __init__(self, objects: list):
+        self._objects = objects
+
+    def __getitem__(self, i):
+        return self._objects[i]
+
+    def __len__(self):
+        return len(self._objects)
+
+    def __repr__(self) -> str:
+        return f"ListView({self._objects})"
+
 class KeyedContainer(FormatContainer):
     def __len__(self):
         return len(self.objects)
     
+    def __contains__(self, key):
+        return self.has_key(key)
+    
     def __getitem__(self, key):
         try:
             return self.objects[key]
-        except KeyError:
+        except (KeyError, IndexError):
             raise KeyError(f"Container has no object at key {key}.")
     
     def __setitem__(self, key, object):
         self.objects[key] = self.format(object)
+        self.reindex()
     
     def __delitem__(self, key):
         del self.objects[key]
+        self.reindex()
     
     def has(self, object):
-        return (self.get_key(object) in self)
+        key = self.get_key(object)
+        return (key is not None) and self.has_key(key)
+    
+    def has_key(self, key):
+        raise NotImplementedError
     
     def keys(self):
         raise NotImplementedError
@@ -91,44 +115,82 @@ class KeyedContainer(FormatContainer):
     def values(self):
         return [self[key] for key in self]
     
+    def items(self):
+        return list(zip(self.keys(), self.values()))
+    
     def get_key(self, object):
         object = self.format(object)
         try:
             return self.extract_key(object)
         except NotImplementedError:
-            if not (object in self.values()):
-                return None
-            return self.keys()[self.values().index(object)]
+            pass
+        try:
+            return self._index.get(object)
+        except TypeError:
+            # unhashable objects cannot be in the reverse index, so fall back to a scan
+            for key, value in self.items():
+                if value == object:
+                    return key
+            return None
     
     def extract_key(self, object):
         raise NotImplementedError
     
+    def index(self, key, object):
+        # reverse index of object -> first key holding an equal object
+        try:
+            self._index.setdefault(object, key)
+        except TypeError:
+            pass
+    
+    def reindex(self):
+        self._index = {}
+        for key, object in self.items():
+            self.index(key, object)
+    
 class ListContainer(KeyedContainer):
+    def has_key(self, key):
+        return isinstance(key, int) and (0 <= key < len(self._objects))
+    
     def keys(self):
-        return list(range(len(self._objects)))
+        return range(len(self._objects))
+    
+    def values(self):
+        return ListView(self._objects)
+    
+    def items(self):
+        return list(enumerate(self._objects))
     
     def add(self, object):
         self._objects.append(object)
+        self.index(len(self._objects) - 1, object)
 
     def clear(self):
         self._objects = []
+        self._index = {}
 
 class DictContainer(KeyedContainer):
     def __init__(self, *args, key_attr, **kwargs):
         self.key_attr = key_attr
         KeyedContainer.__init__(self, *args, **kwargs)
 
-    def __contains__(self, key):
-        return (key in self.keys())
-
     def __iter__(self):
-        return iter(self.keys())
+        return iter(self._objects)
+    
+    def has_key(self, key):
+        try:
+            return key in self._objects
+        except TypeError:
+            return False
         
     def keys(self):
-        return list(self._objects.keys())
+        return self._objects.keys()
+    
+    def values(self):
+        return self._objects.values()
     
     def items(self):
-        return list(zip(self.keys(), self.values()))
+        return self._objects.items()
     
     def extract_key(self, object):
         if not hasattr(object, self.key_attr):
@@ -140,9 +202,4 @@ class DictContainer(KeyedContainer):
 
     def clear(self):
         self._objects = {}
-
-    
-
-    
-
-
+        self._index = {}
@@ -0,0 +1,154 @@
+import asyncio
+import inspect
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from typing import Callable, Union
+
+class Call:
+    def __init__(self, function: Callable, args: tuple = (), kwargs: dict = None, key=None):
+        self.function = function
+        self.args = tuple(args)
+        self.kwargs = {} if kwargs is None else kwargs
+        self.key = key
+
+    def __call__(self):
+        return self.function(*self.args, **self.kwargs)
+
+    def __repr__(self) -> str:
+        return f"Call({self.function}, key={self.key})"
+
+async def acall(function: Callable, *args, **kwargs):
+    # coroutine functions are awaited directly, anything else runs in the loop's default executor
+    if inspect.iscoroutinefunction(function):
+        return await function(*args, **kwargs)
+    result = await asyncio.to_thread(function, *args, **kwargs)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+class Executor:
+    def __init__(self, max_concurrency: int = None, max_concurrency_per_key: Union[int, dict] = None, **kwargs):
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be at least 1, got {max_concurrency}.")
+        self.max_concurrency = max_concurrency
+        self.max_concurrency_per_key = max_concurrency_per_key
+
+    def key_limit(self, key):
+        if isinstance(self.max_concurrency_per_key, dict):
+            return self.max_concurrency_per_key.get(key)
+        return self.max_concurrency_per_key
+
+    def map(self, calls: list[Call]) -> list:
+        raise NotImplementedError
+
+class SerialExecutor(Executor):
+    def map(self, calls: list[Call]) -> list:
+        return [call() for call in calls]
+
+class PoolExecutor(Executor):
+    pool_type = None
+
+    def __init__(self, *args, pool=None, **kwargs):
+        Executor.__init__(self, *args, **kwargs)
+        self.pool = pool
+
+    def map(self, calls: list[Call]) -> list:
+        if self.pool is not None:
+            return self.schedule(self.pool, list(calls))
+        with self.pool_type(max_workers=self.max_concurrency) as pool:
+            return self.schedule(pool, list(calls))
+
+    def schedule(self, pool, calls: list[Call]) -> list:
+        results = [None] * len(calls)
+        queues = defaultdict(deque)
+        for i, call in enumerate(calls):
+            queues[call.key].append(i)
+        running = defaultdict(int)
+        futures = {}
+        while queues or futures:
+            # submit in call order, skipping keys that are already at their concurrency limit
+            for key in sorted(queues, key=lambda key: queues[key][0]):
+                limit = self.key_limit(key)
+                while queues[key] and (limit is None or running[key] < limit) \
+                        and (self.max_concurrency is None or len(futures) < self.max_concurrency):
+                    i = queues[key].popleft()
+                    futures[pool.submit(calls[i].function, *calls[i].args, **calls[i].kwargs)] = i
+                    running[key] += 1
+                if not queues[key]:
+                    del queues[key]
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = futures.pop(future)
+                running[calls[i].key] -= 1
+                try:
+                    results[i] = future.result()
+                except BaseException:
+                    for other in futures:
+                        other.cancel()
+                    raise
+        return results
+
+class ThreadExecutor(PoolExecutor):
+    pool_type = ThreadPoolExecutor
+
+class ProcessExecutor(PoolExecutor):
+    # functions and arguments must be picklable to cross the process boundary
+    pool_type = ProcessPoolExecutor
+
+class AsyncioExecutor(Executor):
+    async def amap(self, calls: list[Call]) -> list:
+        overall = asyncio.Semaphore(self.max_concurrency) if self.max_concurrency is not None else nullcontext()
+        per_key = {}
+        for call in calls:
+            if call.key not in per_key:
+                limit = self.key_limit(call.key)
+                per_key[call.key] = asyncio.Semaphore(limit) if limit is not None else nullcontext()
+
+        async def run(call: Call):
+            async with per_key[call.key]:
+                async with overall:
+                    return await acall(call.function, *call.args, **call.kwargs)
+
+        return list(await asyncio.gather(*[run(call) for call in calls]))
+
+    def map(self, calls: list[Call]) -> list:
+        calls = list(calls)
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.amap(calls))
+
+        # already inside an event loop, so run on a private loop in a helper thread
+        outcome = {}
+        def target():
+            try:
+                outcome["result"] = asyncio.run(self.amap(calls))
+            except BaseException as e:
+                outcome["error"] = e
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+        if "error" in outcome:
+            raise outcome["error"]
+        return outcome["result"]
+
+EXECUTORS = {
+    "serial": SerialExecutor,
+    "thread": ThreadExecutor,
+    "process": ProcessExecutor,
+    "asyncio": AsyncioExecutor,
+}
+
+def get_executor(executor: Union[Executor, str] = None, **kwargs) -> Executor:
+    if executor is None:
+        return SerialExecutor(**kwargs)
+    if isinstance(executor, Executor):
+        return executor
+    if isinstance(executor, str):
+        if executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor {executor}, expected one of {list(EXECUTORS)}.")
+        return EXECUTORS[executor](**kwargs)
+    raise TypeError(f"Executor {executor} is not an Executor or a string.")
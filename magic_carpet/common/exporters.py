@@ -0,0 +1,99 @@
+import json
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from magic_carpet.common.metrics import METRICS, Metrics
+
+PREFIX = "magic_carpet"
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_labels(phase: str, name: str, **extra) -> str:
+    labels = {"phase": phase, "name": name, **extra}
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+def format_histogram(lines: list, metric: str, histogram: dict, phase: str, name: str):
+    cumulative = 0
+    for bound, count in zip(histogram["buckets"] + [math.inf], histogram["counts"]):
+        cumulative += count
+        le = "+Inf" if bound == math.inf else repr(float(bound))
+        lines.append(f"{metric}_bucket{format_labels(phase, name, le=le)} {cumulative}")
+    lines.append(f"{metric}_sum{format_labels(phase, name)} {histogram['sum']}")
+    lines.append(f"{metric}_count{format_labels(phase, name)} {histogram['count']}")
+
+def to_prometheus(metrics: Metrics = None) -> str:
+    snapshot = (METRICS if metrics is None else metrics).snapshot()
+    lines = [
+        f"# HELP {PREFIX}_calls_total Completed calls.",
+        f"# TYPE {PREFIX}_calls_total counter",
+    ]
+    lines += [f"{PREFIX}_calls_total{format_labels(s['phase'], s['name'])} {s['calls']}" for s in snapshot]
+    lines += [f"# HELP {PREFIX}_errors_total Calls that raised.", f"# TYPE {PREFIX}_errors_total counter"]
+    lines += [f"{PREFIX}_errors_total{format_labels(s['phase'], s['name'])} {s['errors']}" for s in snapshot]
+    lines += [f"# HELP {PREFIX}_in_flight Calls currently running.", f"# TYPE {PREFIX}_in_flight gauge"]
+    lines += [f"{PREFIX}_in_flight{format_labels(s['phase'], s['name'])} {s['in_flight']}" for s in snapshot]
+    lines += [f"# HELP {PREFIX}_latency_seconds Call latency.", f"# TYPE {PREFIX}_latency_seconds histogram"]
+    for s in snapshot:
+        if s["latency"] is not None:
+            format_histogram(lines, f"{PREFIX}_latency_seconds", s["latency"], s["phase"], s["name"])
+    lines += [f"# HELP {PREFIX}_batch_size Items per batch call.", f"# TYPE {PREFIX}_batch_size histogram"]
+    for s in snapshot:
+        if s["batch_size"] is not None:
+            format_histogram(lines, f"{PREFIX}_batch_size", s["batch_size"], s["phase"], s["name"])
+    return "\n".join(lines) + "\n"
+
+def serve_prometheus(port: int = 9464, host: str = "", metrics: Metrics = None) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = to_prometheus(metrics).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def write_json(path: str, metrics: Metrics = None):
+    def clean(value):
+        # NaN quantiles of empty histograms are not valid JSON
+        return None if isinstance(value, float) and math.isnan(value) else value
+    snapshot = (METRICS if metrics is None else metrics).snapshot()
+    for series in snapshot:
+        for key in ("latency", "batch_size"):
+            if series[key] is not None:
+                series[key] = {k: clean(v) for k, v in series[key].items()}
+    with open(path, "w") as f:
+        json.dump(snapshot, f, indent=2)
+
+class OpenTelemetryExporter:
+    # forwards each observation to OpenTelemetry instruments, the configured MeterProvider handles export
+    def __init__(self, meter=None, **kwargs):
+        if meter is None:
+            try:
+                from opentelemetry import metrics as otel_metrics
+            except ImportError as e:
+                raise ImportError("OpenTelemetryExporter requires the opentelemetry-api package.") from e
+            meter = otel_metrics.get_meter(PREFIX)
+        self.meter = meter
+        self.instruments = {
+            "calls": meter.create_counter(f"{PREFIX}.calls", description="Completed calls."),
+            "errors": meter.create_counter(f"{PREFIX}.errors", description="Calls that raised."),
+            "in_flight": meter.create_up_down_counter(f"{PREFIX}.in_flight", description="Calls currently running."),
+            "latency": meter.create_histogram(f"{PREFIX}.latency", unit="s", description="Call latency."),
+            "batch_size": meter.create_histogram(f"{PREFIX}.batch_size", description="Items per batch call."),
+        }
+
+    def record(self, metric: str, value, phase: str, name: str):
+        instrument = self.instruments[metric]
+        attributes = {"phase": phase, "name": name}
+        if metric in ("latency", "batch_size"):
+            instrument.record(value, attributes=attributes)
+        else:
+            instrument.add(value, attributes=attributes)
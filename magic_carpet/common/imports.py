@@ -0,0 +1,23 @@
+import importlib
+import sys
+
+def require(module: str, extra: str):
+    # optional dependencies are imported on first use and name the extra that provides them
+    try:
+        return importlib.import_module(module)
+    except ImportError as e:
+        raise ImportError(f"{module} is required for this feature, install it with `pip install magic-carpet[{extra}]`.") from e
+
+def lazy_exports(package: str, exports: dict):
+    # PEP 562 hooks that import the defining submodule the first time one of its names is accessed
+    def __getattr__(name: str):
+        if name not in exports:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(exports[name]), name)
+        setattr(sys.modules[package], name, value)
+        return value
+
+    def __dir__():
+        return sorted(set(vars(sys.modules[package])) | set(exports))
+
+    return __getattr__, __dir__
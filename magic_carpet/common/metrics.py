@@ -0,0 +1,194 @@
+import bisect
+import functools
+import inspect
+import math
+import threading
+import time
+from collections import defaultdict
+from typing import Callable
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096)
+
+def label(obj) -> str:
+    if isinstance(obj, str):
+        return obj
+    name = getattr(obj, "name", None)
+    if isinstance(name, str):
+        return name
+    # wrapped functions are named after the function, subclasses after the class
+    attributes = getattr(obj, "__dict__", {})
+    for attribute in ("run", "run_batch", "evaluate", "embed"):
+        if attribute in attributes:
+            return getattr(attributes[attribute], "__qualname__", obj.__class__.__name__)
+    if callable(obj) and hasattr(obj, "__qualname__"):
+        return obj.__qualname__
+    return obj.__class__.__name__
+
+class Histogram:
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        # linear interpolation inside the bucket holding the q-th observation, as Prometheus' histogram_quantile does
+        if self.count == 0:
+            return math.nan
+        rank, seen = q * self.count, 0
+        for i, count in enumerate(self.counts):
+            if count > 0 and seen + count >= rank:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+    def to_dict(self) -> dict:
+        return {
+            "buckets": list(self.buckets),
+            "counts": list(self.counts),
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+        }
+
+class Span:
+    def __init__(self, metrics: "Metrics", phase: str, name):
+        self.metrics = metrics
+        self.phase = phase
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        if self.metrics.enabled:
+            self.name = label(self.name)
+            self.metrics.enter(self.phase, self.name)
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self.start is not None:
+            self.metrics.exit(self.phase, self.name, time.perf_counter() - self.start, error=exc_type is not None)
+            self.start = None
+        return False
+
+    def __call__(self, function: Callable):
+        metrics, phase, name = self.metrics, self.phase, self.name
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                if not metrics.enabled:
+                    return await function(*args, **kwargs)
+                with Span(metrics, phase, name):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return function(*args, **kwargs)
+            with Span(metrics, phase, name):
+                return function(*args, **kwargs)
+        return wrapper
+
+class Metrics:
+    def __init__(self, enabled: bool = False, latency_buckets: tuple = LATENCY_BUCKETS, batch_buckets: tuple = BATCH_BUCKETS, **kwargs):
+        self.enabled = enabled
+        self.latency_buckets = latency_buckets
+        self.batch_buckets = batch_buckets
+        self.exporters = []
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.latency = {}
+            self.batch_sizes = {}
+            self.calls = defaultdict(int)
+            self.errors = defaultdict(int)
+            self.in_flight = defaultdict(int)
+
+    def enable(self):
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+        return exporter
+
+    def span(self, phase: str, name) -> Span:
+        return Span(self, phase, name)
+
+    def enter(self, phase: str, name: str):
+        with self._lock:
+            self.in_flight[(phase, name)] += 1
+        for exporter in self.exporters:
+            exporter.record("in_flight", 1, phase, name)
+
+    def exit(self, phase: str, name: str, latency: float, error: bool = False):
+        key = (phase, name)
+        with self._lock:
+            self.in_flight[key] -= 1
+            self.calls[key] += 1
+            if error:
+                self.errors[key] += 1
+            if key not in self.latency:
+                self.latency[key] = Histogram(self.latency_buckets)
+            self.latency[key].observe(latency)
+        for exporter in self.exporters:
+            exporter.record("in_flight", -1, phase, name)
+            exporter.record("calls", 1, phase, name)
+            exporter.record("latency", latency, phase, name)
+            if error:
+                exporter.record("errors", 1, phase, name)
+
+    def batch(self, phase: str, name, size: int):
+        if not self.enabled:
+            return
+        key = (phase, label(name))
+        with self._lock:
+            if key not in self.batch_sizes:
+                self.batch_sizes[key] = Histogram(self.batch_buckets)
+            self.batch_sizes[key].observe(size)
+        for exporter in self.exporters:
+            exporter.record("batch_size", size, *key)
+
+    def snapshot(self) -> list[dict]:
+        with self._lock:
+            keys = sorted(set(self.latency) | set(self.batch_sizes) | set(self.in_flight))
+            return [{
+                "phase": phase,
+                "name": name,
+                "calls": self.calls.get((phase, name), 0),
+                "errors": self.errors.get((phase, name), 0),
+                "in_flight": self.in_flight.get((phase, name), 0),
+                "latency": self.latency[(phase, name)].to_dict() if (phase, name) in self.latency else None,
+                "batch_size": self.batch_sizes[(phase, name)].to_dict() if (phase, name) in self.batch_sizes else None,
+            } for phase, name in keys]
+
+METRICS = Metrics()
+
+def get_metrics() -> Metrics:
+    return METRICS
+
+def enable_metrics() -> Metrics:
+    METRICS.enable()
+    return METRICS
+
+def disable_metrics() -> Metrics:
+    METRICS.disable()
+    return METRICS
+
+def span(phase: str, name) -> Span:
+    return METRICS.span(phase, name)
@@ -0,0 +1,16 @@
+from magic_carpet.embedders.embedder import Embedder, HashEmbedder, OpenAIEmbedder, as_embedder, default_embedder, openai_embedder
+from magic_carpet.embedders.batching_embedder import BatchingEmbedder
+from magic_carpet.embedders.cached_embedder import CachedEmbedder
+from magic_carpet.embedders.corpus_embedder import CorpusEmbedder
+
+__all__ = [
+    "Embedder",
+    "HashEmbedder",
+    "OpenAIEmbedder",
+    "BatchingEmbedder",
+    "CachedEmbedder",
+    "CorpusEmbedder",
+    "as_embedder",
+    "default_embedder",
+    "openai_embedder"
+]
@@ -0,0 +1,21 @@
+from typing import Callable, Union
+from magic_carpet.common.batcher import DynamicBatcher
+from magic_carpet.common.imports import require
+from magic_carpet.embedders.embedder import Embedder, as_embedder
+
+np = require("numpy", "openai")
+
+class BatchingEmbedder(Embedder):
+    # concurrent calls are coalesced into one request to the wrapped embedder
+    def __init__(self, embedder: Union[Embedder, Callable], max_batch_size: int = 2048, max_wait: float = 0.0, **kwargs):
+        self.embedder = as_embedder(embedder)
+        self.batcher = DynamicBatcher(self.embed_batch, max_batch_size=max_batch_size, max_wait=max_wait, name=self)
+
+    def embed_batch(self, inputs: list[str]) -> list:
+        # a bound method rather than a closure, so the embedder can be pickled to worker processes
+        return list(self.embedder(inputs))
+
+    def embed(self, inputs: list[str], **kwargs):
+        if len(kwargs) > 0:
+            return self.embedder(inputs, **kwargs)
+        return np.stack([future.result() for future in self.batcher.submit_many(inputs)])
@@ -0,0 +1,26 @@
+from typing import Callable, Union
+from magic_carpet.common.cache import MISSING, ResponseCache, hash_key
+from magic_carpet.common.imports import require
+from magic_carpet.embedders.embedder import Embedder, as_embedder, embedder_fingerprint
+
+np = require("numpy", "openai")
+
+class CachedEmbedder(Embedder):
+    def __init__(self, embedder: Union[Embedder, Callable], cache: ResponseCache = None, name: str = None, **kwargs):
+        self.embedder = as_embedder(embedder)
+        self.cache = ResponseCache(**kwargs) if cache is None else cache
+        # keys default to the wrapped embedder's configuration, so embedders sharing a cache never see each other's vectors
+        self.name = f"embedder:{embedder_fingerprint(self.embedder)}" if name is None else name
+
+    def embed(self, inputs: list[str], **kwargs):
+        keys = [hash_key(self.name, (input,), kwargs) for input in inputs]
+        vectors = [self.cache.get(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is MISSING]
+        if len(missing) > 0:
+            # only texts that missed the cache are sent, deduplicated, in a single call
+            unique = list(dict.fromkeys(inputs[i] for i in missing))
+            embeddings = dict(zip(unique, self.embedder(unique, **kwargs)))
+            for i in missing:
+                vectors[i] = embeddings[inputs[i]]
+                self.cache.set(keys[i], vectors[i])
+        return np.stack(vectors)
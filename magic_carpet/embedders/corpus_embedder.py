@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Iterable, Union
+from magic_carpet.common.imports import require
+from magic_carpet.embedders.batching_embedder import BatchingEmbedder
+from magic_carpet.embedders.embedder import Embedder, as_embedder, embedder_fingerprint
+
+np = require("numpy", "openai")
+
+def prompt_hashes(prompts: list[str]) -> np.ndarray:
+    return np.array([int.from_bytes(hashlib.blake2b(prompt.encode(), digest_size=8).digest(), "little") for prompt in prompts], dtype=np.uint64)
+
+class RateLimiter:
+    # spaces request starts at least 1 / requests_per_second apart across all threads
+    def __init__(self, requests_per_second: float = None):
+        self.interval = 0.0 if requests_per_second is None else 1.0 / requests_per_second
+        self.next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.interval == 0.0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self.next)
+            self.next = start + self.interval
+        time.sleep(start - now)
+
+class CorpusEmbedder:
+    # embeds a corpus chunk by chunk into path/embeddings.npy, a float32 (rows, d) matrix on disk, and marks finished
+    # rows in path/done.npy so that a build interrupted at any point resumes without re-embedding them. Each row's prompt
+    # hash is kept in path/prompts.npy, so rows whose prompt has changed are embedded again rather than reused
+    def __init__(
+            self,
+            embedder: Union[Embedder, Callable],
+            path: str,
+            chunk_size: int = 1024,
+            max_concurrency: int = 4,
+            requests_per_second: float = None,
+            max_retries: int = 3,
+            backoff: float = 1.0,
+            **kwargs
+        ):
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be at least 1, got {max_concurrency}.")
+        self.embedder = as_embedder(embedder)
+        # chunks are already sized and run concurrently here, a batching wrapper would only serialize them again
+        if isinstance(self.embedder, BatchingEmbedder):
+            self.embedder = self.embedder.embedder
+        self.path = path
+        self.chunk_size = chunk_size
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = RateLimiter(requests_per_second)
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    @property
+    def embeddings_path(self) -> str:
+        return os.path.join(self.path, "embeddings.npy")
+
+    @property
+    def done_path(self) -> str:
+        return os.path.join(self.path, "done.npy")
+
+    def embed_chunk(self, prompts: list[str], **kwargs) -> np.ndarray:
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                return self.embedder(prompts, **kwargs)
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+
+    @property
+    def hashes_path(self) -> str:
+        return os.path.join(self.path, "prompts.npy")
+
+    def open_state(self, num_rows: int, fingerprint: str) -> tuple[np.ndarray, np.ndarray]:
+        # a different embedder or embedding kwargs invalidates every row, so the build starts over
+        meta_path = os.path.join(self.path, "corpus.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if meta["rows"] != num_rows:
+                raise ValueError(f"Embeddings in {self.path} are for {meta['rows']} rows, not {num_rows}; remove them to start over.")
+            if meta.get("embedder") == fingerprint and os.path.exists(self.done_path) and os.path.exists(self.hashes_path):
+                return np.load(self.done_path, mmap_mode="r+"), np.load(self.hashes_path, mmap_mode="r+")
+        os.makedirs(self.path, exist_ok=True)
+        done = np.lib.format.open_memmap(self.done_path, mode="w+", dtype=np.bool_, shape=(num_rows,))
+        done.flush()
+        hashes = np.lib.format.open_memmap(self.hashes_path, mode="w+", dtype=np.uint64, shape=(num_rows,))
+        hashes.flush()
+        with open(meta_path, 'w') as f:
+            json.dump({"rows": num_rows, "embedder": fingerprint}, f)
+        return done, hashes
+
+    def embed(self, chunks: Iterable[list[str]], num_rows: int, **kwargs) -> np.ndarray:
+        # chunks are lists of prompts covering rows 0..num_rows in order; returns the finished matrix memory-mapped read-only
+        if num_rows == 0:
+            raise ValueError("Cannot embed an empty corpus.")
+        done, hashes = self.open_state(num_rows, embedder_fingerprint(self.embedder, **kwargs))
+        embeddings = np.load(self.embeddings_path, mmap_mode="r+") if os.path.exists(self.embeddings_path) and done.any() else None
+
+        def write(start: int, piece_hashes: np.ndarray, vectors: np.ndarray):
+            nonlocal embeddings
+            if embeddings is None:
+                embeddings = np.lib.format.open_memmap(self.embeddings_path, mode="w+", dtype=np.float32, shape=(num_rows, vectors.shape[1]))
+            elif vectors.shape[1] != embeddings.shape[1]:
+                raise ValueError(f"Embedder returned {vectors.shape[1]}-dimensional vectors but {self.embeddings_path} holds {embeddings.shape[1]}-dimensional ones; remove it to start over.")
+            embeddings[start:start + len(vectors)] = vectors
+            embeddings.flush()
+            # rows only count as done once their vectors are on disk
+            hashes[start:start + len(vectors)] = piece_hashes
+            hashes.flush()
+            done[start:start + len(vectors)] = True
+            done.flush()
+
+        def pieces():
+            start = 0
+            for prompts in chunks:
+                prompts = list(prompts)
+                for offset in range(0, len(prompts), self.chunk_size):
+                    piece = prompts[offset:offset + self.chunk_size]
+                    piece_hashes = prompt_hashes(piece)
+                    end = start + len(piece)
+                    if not (done[start:end] & (hashes[start:end] == piece_hashes)).all():
+                        yield start, piece_hashes, piece
+                    start = end
+            if start != num_rows:
+                raise ValueError(f"Got {start} rows to embed, expected {num_rows}.")
+
+        error = None
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            futures = {}
+            try:
+                # at most max_concurrency chunks are in flight, so prompts are read no faster than they are embedded
+                for start, piece_hashes, piece in pieces():
+                    if len(futures) >= self.max_concurrency:
+                        finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            write(*futures.pop(future), future.result())
+                    futures[pool.submit(self.embed_chunk, piece, **kwargs)] = (start, piece_hashes)
+            except Exception as e:
+                error = e
+            # on failure the chunks that did finish are still written, so a rerun only redoes the rest
+            for future in futures:
+                try:
+                    write(*futures[future], future.result())
+                except Exception as e:
+                    error = e if error is None else error
+        if error is not None:
+            raise error
+        del embeddings, done, hashes
+        return np.load(self.embeddings_path, mmap_mode="r")
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import re
+from functools import lru_cache, partial
+from typing import Callable, Union
+from magic_carpet.common.imports import require
+from magic_carpet.common.metrics import METRICS
+
+np = require("numpy", "openai")
+
+class Embedder:
+    def __init__(self, function: Callable = None, **kwargs):
+        if function is not None:
+            self.embed = function
+
+    def __call__(self, inputs, **kwargs) -> np.ndarray:
+        inputs = [inputs] if isinstance(inputs, str) else list(inputs)
+        if len(inputs) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+        if not METRICS.enabled:
+            return np.asarray(self.embed(inputs, **kwargs), dtype=np.float32).reshape(len(inputs), -1)
+        METRICS.batch("embed", self, len(inputs))
+        with METRICS.span("embed", self):
+            return np.asarray(self.embed(inputs, **kwargs), dtype=np.float32).reshape(len(inputs), -1)
+
+    def embed(self, inputs: list[str], **kwargs):
+        raise NotImplementedError
+
+@lru_cache(maxsize=None)
+def openai_client(api_key: str = None):
+    return require("openai", "openai").OpenAI(api_key=api_key)
+
+def openai_embedder(inputs, model: str = "text-embedding-ada-002", api_key: str = None, batch_size: int = 2048, **kwargs):
+    client = openai_client(api_key if api_key is not None else os.getenv("OPENAI_API_KEY"))
+    inputs = list(inputs)
+    embeddings = []
+    for start in range(0, len(inputs), batch_size):
+        embeddings.extend(d.embedding for d in client.embeddings.create(input=inputs[start:start + batch_size], model=model).data)
+    return embeddings
+
+class OpenAIEmbedder(Embedder):
+    def __init__(self, model: str = "text-embedding-ada-002", api_key: str = None, batch_size: int = 2048, **kwargs):
+        self.model = model
+        self.api_key = api_key
+        self.batch_size = batch_size
+
+    def embed(self, inputs: list[str], **kwargs):
+        return openai_embedder(inputs, model=self.model, api_key=self.api_key, batch_size=self.batch_size, **kwargs)
+
+class HashEmbedder(Embedder):
+    # deterministic bag-of-words feature hashing, useful offline and in tests
+    def __init__(self, d: int = 256, **kwargs):
+        self.d = d
+
+    def embed(self, inputs: list[str], **kwargs):
+        vectors = np.zeros((len(inputs), self.d), dtype=np.float32)
+        for i, input in enumerate(inputs):
+            for token in re.findall(r"\w+", input.lower()):
+                digest = hashlib.blake2b(token.encode(), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.d
+                vectors[i, bucket] += 1.0 if digest[4] & 1 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-10)
+
+def embedder_config(value):
+    # a JSON description of what determines an embedder's vectors: nested embedders and partial arguments are described
+    # in full, credentials and state such as caches or batchers are left out
+    if isinstance(value, Embedder):
+        config = {"type": f"{type(value).__module__}.{type(value).__qualname__}"}
+        for name, attribute in sorted(vars(value).items()):
+            if "key" in name or name.startswith("_"):
+                continue
+            attribute = embedder_config(attribute)
+            if attribute is not None:
+                config[name] = attribute
+        return config
+    if isinstance(value, partial):
+        return {
+            "function": embedder_config(value.func),
+            "args": [embedder_config(arg) for arg in value.args],
+            "keywords": {name: embedder_config(arg) for name, arg in sorted(value.keywords.items()) if "key" not in name},
+        }
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [embedder_config(item) for item in value]
+    if isinstance(value, dict):
+        return {str(name): embedder_config(item) for name, item in sorted(value.items(), key=lambda item: str(item[0])) if "key" not in str(name)}
+    if callable(value):
+        return f"{getattr(value, '__module__', '')}.{getattr(value, '__qualname__', type(value).__qualname__)}"
+    return None
+
+def embedder_fingerprint(embedder: Embedder, **kwargs) -> str:
+    config = {"embedder": embedder_config(embedder), "kwargs": embedder_config(kwargs)}
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+def as_embedder(embedder: Union[Embedder, Callable] = None) -> Embedder:
+    if embedder is None:
+        return default_embedder()
+    if isinstance(embedder, Embedder):
+        return embedder
+    if not isinstance(embedder, Callable):
+        raise ValueError(f"Embedder {embedder} is not callable.")
+    return Embedder(embedder)
+
+@lru_cache(maxsize=None)
+def default_embedder() -> Embedder:
+    from magic_carpet.embedders.batching_embedder import BatchingEmbedder
+    return BatchingEmbedder(OpenAIEmbedder())
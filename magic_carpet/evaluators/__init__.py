@@ -1,6 +1,16 @@
+from typing import TYPE_CHECKING
+from magic_carpet.common.imports import lazy_exports
 from magic_carpet.evaluators.evaluator import Evaluator, NamedEvaluator
 
+if TYPE_CHECKING:
+    from magic_carpet.evaluators.cached_evaluator import CachedEvaluator
+
+__getattr__, __dir__ = lazy_exports(__name__, {
+    "CachedEvaluator": "magic_carpet.evaluators.cached_evaluator"
+})
+
 __all__ = [
     "Evaluator",
-    "NamedEvaluator"
-]
\ No newline at end of file
+    "NamedEvaluator",
+    "CachedEvaluator"
+]
@@ -0,0 +1,34 @@
+from typing import Callable, Union
+from magic_carpet.common.cache import MISSING, ResponseCache, callable_name, hash_key
+from magic_carpet.evaluators.evaluator import Evaluator, NamedEvaluator
+
+class CachedEvaluator(NamedEvaluator):
+    def __init__(self, evaluator: Union[Evaluator, Callable], cache: ResponseCache = None, name: str = None, description: str = None, **kwargs):
+        if not isinstance(evaluator, Evaluator):
+            if not isinstance(evaluator, Callable):
+                raise ValueError(f"Evaluator {evaluator} is not callable.")
+            evaluator = Evaluator(evaluator)
+        self.evaluator = evaluator
+        self.cache = ResponseCache(**kwargs) if cache is None else cache
+        NamedEvaluator.__init__(self, name=name if name is not None else callable_name(evaluator), description=description)
+
+    def evaluate(self, *args, **kwargs):
+        key = hash_key(self.name, args, kwargs)
+        score = self.cache.get(key)
+        if score is MISSING:
+            score = self.evaluator(*args, **kwargs)
+            self.cache.set(key, score)
+        return score
+
+    async def aevaluate(self, *args, **kwargs):
+        key = hash_key(self.name, args, kwargs)
+        score = self.cache.get(key)
+        if score is MISSING:
+            score = await self.evaluator.aevaluate(*args, **kwargs)
+            self.cache.set(key, score)
+        return score
+
+    def description_default(self):
+        if isinstance(self.evaluator, NamedEvaluator):
+            return self.evaluator.description
+        return NamedEvaluator.description_default(self)
@@ -1,13 +1,20 @@
+import asyncio
 from typing import Callable, Union
 from magic_carpet.common.container import BaseContainer, DictContainer, SetContainer, ListContainer, KeyedContainer
+from magic_carpet.common.executor import Call, Executor, acall, get_executor
 from magic_carpet.evaluators.evaluator import Evaluator, NamedEvaluator
 
 class EvalContainer(Evaluator, BaseContainer):
     def __init__(self, evaluators: list[Union[Evaluator, Callable]] = [], **kwargs):
         BaseContainer.__init__(self, objects=evaluators, **kwargs)
 
-    def run(self, *args, **kwargs):
+    def evaluate(self, *args, **kwargs):
         return [evaluator(*args, **kwargs) for evaluator in self]
+
+    async def aevaluate(self, *args, **kwargs):
+        return list(await asyncio.gather(*[
+            evaluator.aevaluate(*args, **kwargs) if isinstance(evaluator, Evaluator) else acall(evaluator, *args, **kwargs) for evaluator in self
+        ]))
     
 class EvalSet(EvalContainer, SetContainer):
     pass
@@ -20,10 +27,19 @@ class KeyedEvalContainer(EvalContainer, KeyedContainer):
             evaluator = Evaluator(evaluator)
         return evaluator
     
-    def run(self, *args, keys=None, **kwargs):
+    def evaluate(self, *args, keys=None, executor: Union[Executor, str] = None, **kwargs):
+        if keys is None:
+            keys = self.keys()
+        keys = list(keys)
+        results = get_executor(executor).map([Call(self[key], args, kwargs, key=key) for key in keys])
+        return dict(zip(keys, results))
+
+    async def aevaluate(self, *args, keys=None, **kwargs):
         if keys is None:
-            keys = self.keys
-        return {key: self[key](*args, **kwargs) for key in keys}
+            keys = self.keys()
+        keys = list(keys)
+        results = await asyncio.gather(*[self[key].aevaluate(*args, **kwargs) for key in keys])
+        return dict(zip(keys, results))
 
 class EvalList(KeyedEvalContainer, ListContainer):
     pass
@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
 import inspect
 from typing import Callable 
+from magic_carpet.common.executor import acall
+from magic_carpet.common.metrics import METRICS
 
 class BaseEvaluator(ABC):
     @abstractmethod
@@ -11,18 +13,42 @@ class BaseEvaluator(ABC):
         raise NotImplementedError
     
 class Evaluator(BaseEvaluator):
-    def __init__(self, function: Callable = None, **kwargs):
+    def __init__(self, function: Callable = None, batch_function: Callable = None, **kwargs):
         if function is not None:
             self.evaluate = function
+        if batch_function is not None:
+            self.evaluate_batch = batch_function
 
     def __call__(self, *args, **kwargs):
-        return self.evaluate(*args, **kwargs)
+        if not METRICS.enabled:
+            return self.evaluate(*args, **kwargs)
+        with METRICS.span("evaluate", self):
+            return self.evaluate(*args, **kwargs)
     
     def __eq__(self, other):
+        if not isinstance(other, Evaluator):
+            return NotImplemented
         return self.evaluate == other.evaluate
+
+    def __hash__(self):
+        return hash(self.evaluate)
     
     def evaluate(self, *args, **kwargs):
         raise NotImplementedError
+
+    async def aevaluate(self, *args, **kwargs):
+        if not METRICS.enabled:
+            return await acall(self.evaluate, *args, **kwargs)
+        with METRICS.span("evaluate", self):
+            return await acall(self.evaluate, *args, **kwargs)
+
+    def evaluate_batch(self, inputs: list, responses: list, **kwargs):
+        return [self(input, response, **kwargs) for input, response in zip(inputs, responses)]
+
+    @property
+    def batched(self):
+        # True when evaluate_batch is vectorised rather than the per-item fallback
+        return getattr(self.evaluate_batch, "__func__", None) is not Evaluator.evaluate_batch
     
 class NamedEvaluator(Evaluator):
     def __init__(self, name: str = None, description: str = None, **kwargs):
@@ -36,7 +62,12 @@ class NamedEvaluator(Evaluator):
         return f"NAME: {self.name}\nDESCRIPTION: {self.description}"
     
     def __eq__(self, other):
+        if not isinstance(other, Evaluator):
+            return NotImplemented
         return Evaluator.__eq__(self, other) and repr(self) == repr(other)
+
+    def __hash__(self):
+        return Evaluator.__hash__(self)
     
     @property
     def name(self):
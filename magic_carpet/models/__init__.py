@@ -1,6 +1,19 @@
+from typing import TYPE_CHECKING
+from magic_carpet.common.imports import lazy_exports
 from magic_carpet.models.model import Model, NamedModel
+from magic_carpet.models.batched_model import BatchedModel, NamedBatchedModel
+
+if TYPE_CHECKING:
+    from magic_carpet.models.cached_model import CachedModel
+
+__getattr__, __dir__ = lazy_exports(__name__, {
+    "CachedModel": "magic_carpet.models.cached_model"
+})
 
 __all__ = [
     "Model",
-    "NamedModel"
-]
\ No newline at end of file
+    "NamedModel",
+    "BatchedModel",
+    "NamedBatchedModel",
+    "CachedModel"
+]
@@ -0,0 +1,42 @@
+import inspect
+from typing import Callable
+from magic_carpet.common.batcher import DynamicBatcher
+from magic_carpet.models.model import Model, NamedModel
+
+class BatchedModel(Model):
+    def __init__(self, function: Callable = None, max_batch_size: int = 32, max_wait: float = 0.005, **kwargs):
+        if function is not None:
+            self.run_batch = function
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.batcher = DynamicBatcher(self.run_pending, max_batch_size=max_batch_size, max_wait=max_wait, name=self)
+
+    def run_pending(self, inputs: list) -> list:
+        # a bound method rather than a closure, so the model can be pickled to worker processes
+        return self.run_batch(inputs)
+
+    def run(self, input, **kwargs):
+        # calls with extra kwargs cannot share a batch with other callers
+        if len(kwargs) > 0:
+            return self.run_batch([input], **kwargs)[0]
+        return self.batcher(input)
+
+    async def arun(self, input, **kwargs):
+        if len(kwargs) > 0:
+            return await Model.arun(self, input, **kwargs)
+        return await self.batcher.asubmit(input)
+
+    def run_batch(self, inputs: list, **kwargs):
+        raise NotImplementedError
+
+    def map(self, inputs: list):
+        # like run_batch, but split into batches of at most max_batch_size and shared with concurrent callers
+        return [future.result() for future in self.batcher.submit_many(inputs)]
+
+class NamedBatchedModel(NamedModel, BatchedModel):
+    def __init__(self, name: str = None, description: str = None, **kwargs):
+        BatchedModel.__init__(self, **kwargs)
+        NamedModel.__init__(self, name=name, description=description)
+
+    def description_default(self):
+        return "This model executes the following batch function code\n```\n" + inspect.getsource(self.run_batch) + "\n```\n"
@@ -0,0 +1,34 @@
+from typing import Callable, Union
+from magic_carpet.common.cache import MISSING, ResponseCache, callable_name, hash_key
+from magic_carpet.models.model import Model, NamedModel
+
+class CachedModel(NamedModel):
+    def __init__(self, model: Union[Model, Callable], cache: ResponseCache = None, name: str = None, description: str = None, **kwargs):
+        if not isinstance(model, Model):
+            if not isinstance(model, Callable):
+                raise ValueError(f"Model {model} is not callable.")
+            model = Model(model)
+        self.model = model
+        self.cache = ResponseCache(**kwargs) if cache is None else cache
+        NamedModel.__init__(self, name=name if name is not None else callable_name(model), description=description)
+
+    def run(self, *args, **kwargs):
+        key = hash_key(self.name, args, kwargs)
+        response = self.cache.get(key)
+        if response is MISSING:
+            response = self.model(*args, **kwargs)
+            self.cache.set(key, response)
+        return response
+
+    async def arun(self, *args, **kwargs):
+        key = hash_key(self.name, args, kwargs)
+        response = self.cache.get(key)
+        if response is MISSING:
+            response = await self.model.arun(*args, **kwargs)
+            self.cache.set(key, response)
+        return response
+
+    def description_default(self):
+        if isinstance(self.model, NamedModel):
+            return self.model.description
+        return NamedModel.description_default(self)
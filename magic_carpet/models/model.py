@@ -1,6 +1,8 @@
 import inspect
 from abc import ABC, abstractmethod
 from typing import Callable
+from magic_carpet.common.executor import acall
+from magic_carpet.common.metrics import METRICS
 
 class BaseModel(ABC):
     @abstractmethod
@@ -17,14 +19,31 @@ class Model(BaseModel):
             self.run = function
 
     def __call__(self, *args, **kwargs):
-        return self.run(*args, **kwargs)
+        if not METRICS.enabled:
+            return self.run(*args, **kwargs)
+        with METRICS.span("model", self):
+            return self.run(*args, **kwargs)
     
     def __eq__(self, other):
+        if not isinstance(other, Model):
+            return NotImplemented
         return self.run == other.run
+
+    def __hash__(self):
+        return hash(self.run)
     
     def run(self, *args, **kwargs):
         raise NotImplementedError
 
+    async def arun(self, *args, **kwargs):
+        if not METRICS.enabled:
+            return await acall(self.run, *args, **kwargs)
+        with METRICS.span("model", self):
+            return await acall(self.run, *args, **kwargs)
+
+    def run_batch(self, inputs: list, **kwargs):
+        return [self(input, **kwargs) for input in inputs]
+
 class NamedModel(Model):
     def __init__(self, name: str = None, description: str = None, **kwargs):
         Model.__init__(self, **kwargs)
@@ -38,7 +57,12 @@ class NamedModel(Model):
         return f"NAME: {self.name}\nDESCRIPTION: {self.description}"
     
     def __eq__(self, other):
+        if not isinstance(other, Model):
+            return NotImplemented
         return Model.__eq__(self, other) and repr(self) == repr(other)
+
+    def __hash__(self):
+        return Model.__hash__(self)
     
     @property
     def name(self):
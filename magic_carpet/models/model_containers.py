@@ -1,5 +1,7 @@
+import asyncio
 from typing import Callable, Union
 from magic_carpet.common.container import BaseContainer, DictContainer, SetContainer, ListContainer, KeyedContainer
+from magic_carpet.common.executor import Call, Executor, acall, get_executor
 from magic_carpet.models.model import Model, NamedModel
 
 class ModelContainer(Model, BaseContainer):
@@ -8,6 +10,11 @@ class ModelContainer(Model, BaseContainer):
 
     def run(self, *args, **kwargs):
         return [model(*args, **kwargs) for model in self]
+
+    async def arun(self, *args, **kwargs):
+        return list(await asyncio.gather(*[
+            model.arun(*args, **kwargs) if isinstance(model, Model) else acall(model, *args, **kwargs) for model in self
+        ]))
     
 class ModelSet(ModelContainer, SetContainer):
     pass
@@ -20,10 +27,19 @@ class KeyedModelContainer(ModelContainer, KeyedContainer):
             model = Model(model)
         return model
     
-    def run(self, *args, keys=None, **kwargs):
+    def run(self, *args, keys=None, executor: Union[Executor, str] = None, **kwargs):
+        if keys is None:
+            keys = self.keys()
+        keys = list(keys)
+        results = get_executor(executor).map([Call(self[key], args, kwargs, key=key) for key in keys])
+        return dict(zip(keys, results))
+
+    async def arun(self, *args, keys=None, **kwargs):
         if keys is None:
-            keys = self.keys
-        return {key: self[key](*args, **kwargs) for key in keys}
+            keys = self.keys()
+        keys = list(keys)
+        results = await asyncio.gather(*[self[key].arun(*args, **kwargs) for key in keys])
+        return dict(zip(keys, results))
 
 class ModelList(KeyedModelContainer, ListContainer):
     pass
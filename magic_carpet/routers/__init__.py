@@ -1,6 +1,39 @@
+from typing import TYPE_CHECKING
+from magic_carpet.common.imports import lazy_exports
 from magic_carpet.routers.router import Router, NamedRouter
 
+if TYPE_CHECKING:
+    from magic_carpet.routers.cascade_router import CascadeRouter
+    from magic_carpet.routers.execution import ExecutionPolicy
+    from magic_carpet.routers.model_map_router import ModelMapRouter
+    from magic_carpet.routers.nn_router import NNRouter
+    from magic_carpet.routers.objective import RoutingObjective
+    from magic_carpet.routers.semantic_cache import SemanticCache, SemanticCacheRouter
+    from magic_carpet.routers.serving import RouterPool, ServedRouter
+
+# routers with heavy optional dependencies (faiss, pandas, sklearn, numpy) load on first access
+__getattr__, __dir__ = lazy_exports(__name__, {
+    "CascadeRouter": "magic_carpet.routers.cascade_router",
+    "ExecutionPolicy": "magic_carpet.routers.execution",
+    "ModelMapRouter": "magic_carpet.routers.model_map_router",
+    "NNRouter": "magic_carpet.routers.nn_router",
+    "RoutingObjective": "magic_carpet.routers.objective",
+    "SemanticCache": "magic_carpet.routers.semantic_cache",
+    "SemanticCacheRouter": "magic_carpet.routers.semantic_cache",
+    "RouterPool": "magic_carpet.routers.serving",
+    "ServedRouter": "magic_carpet.routers.serving"
+})
+
 __all__ = [
     "Router",
-    "NamedRouter"
-]
\ No newline at end of file
+    "NamedRouter",
+    "CascadeRouter",
+    "ExecutionPolicy",
+    "ModelMapRouter",
+    "NNRouter",
+    "RoutingObjective",
+    "SemanticCache",
+    "SemanticCacheRouter",
+    "RouterPool",
+    "ServedRouter"
+]
@@ -1,9 +1,158 @@
-from magic_carpet.routers.router import NamedRouter 
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Union
+from magic_carpet.common.executor import Call, Executor, get_executor
+from magic_carpet.evaluators.evaluator import Evaluator
+from magic_carpet.routers.router import NamedRouter
 
 class CascadeRouter(NamedRouter):
-    def __init__(self, model_tiers: list[list[str]], **kwargs):
+    def __init__(
+            self,
+            model_tiers: list[list[str]],
+            acceptor: Union[Evaluator, Callable] = None,
+            threshold: float = 0.5,
+            tier_budgets: list[float] = None,
+            **kwargs
+        ):
         super().__init__(**kwargs)
         self.model_tiers = [[self[key] for key in tier] for tier in model_tiers]
-    
+        if (acceptor is not None) and not isinstance(acceptor, Evaluator):
+            if not isinstance(acceptor, Callable):
+                raise ValueError(f"Acceptor {acceptor} is not callable.")
+            acceptor = Evaluator(acceptor)
+        self.acceptor = acceptor
+        self.threshold = threshold
+        if tier_budgets is None:
+            tier_budgets = [None] * len(self.model_tiers)
+        if len(tier_budgets) != len(self.model_tiers):
+            raise ValueError(f"Got {len(tier_budgets)} tier budgets for {len(self.model_tiers)} tiers.")
+        self.tier_budgets = tier_budgets
+
     def route(self, input):
-        return self.model_tiers
\ No newline at end of file
+        return self.model_tiers
+
+    def accepts(self, score):
+        return (self.acceptor is None) or (score is not None and score >= self.threshold)
+
+    def attempt(self, model, args: tuple, kwargs: dict):
+        start = time.perf_counter()
+        try:
+            output = model(*args, **kwargs)
+            score = None if self.acceptor is None else self.acceptor(*args, output)
+        except Exception as e:
+            return {"model": str(model), "status": "error", "error": repr(e), "latency": time.perf_counter() - start}
+        status = "accepted" if self.accepts(score) else "rejected"
+        return {"model": str(model), "status": status, "score": score, "output": output, "latency": time.perf_counter() - start}
+
+    async def aattempt(self, model, args: tuple, kwargs: dict):
+        start = time.perf_counter()
+        try:
+            output = await model.arun(*args, **kwargs)
+            score = None if self.acceptor is None else await self.acceptor.aevaluate(*args, output)
+        except Exception as e:
+            return {"model": str(model), "status": "error", "error": repr(e), "latency": time.perf_counter() - start}
+        status = "accepted" if self.accepts(score) else "rejected"
+        return {"model": str(model), "status": status, "score": score, "output": output, "latency": time.perf_counter() - start}
+
+    def run_tier(self, tier: list, budget: float, args: tuple, kwargs: dict, attempts: list):
+        if len(tier) == 1 and budget is None:
+            attempts.append(self.attempt(tier[0], args, kwargs))
+            return attempts[-1] if attempts[-1]["status"] == "accepted" else None
+
+        # first accepted answer wins, the rest of the tier is abandoned without waiting on it
+        pool = ThreadPoolExecutor(max_workers=len(tier))
+        futures = {pool.submit(self.attempt, model, args, kwargs): model for model in tier}
+        accepted = None
+        try:
+            for future in as_completed(futures, timeout=budget):
+                attempts.append(future.result())
+                if attempts[-1]["status"] == "accepted":
+                    accepted = attempts[-1]
+                    break
+        except TimeoutError:
+            pass
+        finally:
+            for future, model in futures.items():
+                if not future.done():
+                    future.cancel()
+                    attempts.append({"model": str(model), "status": "timeout" if accepted is None else "cancelled"})
+            pool.shutdown(wait=False, cancel_futures=True)
+        return accepted
+
+    async def arun_tier(self, tier: list, budget: float, args: tuple, kwargs: dict, attempts: list):
+        tasks = {asyncio.create_task(self.aattempt(model, args, kwargs)): model for model in tier}
+        pending = set(tasks)
+        deadline = None if budget is None else time.perf_counter() + budget
+        accepted = None
+        try:
+            while pending and accepted is None:
+                timeout = None if deadline is None else max(deadline - time.perf_counter(), 0)
+                done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if len(done) == 0:
+                    break
+                for task in done:
+                    attempts.append(task.result())
+                    if attempts[-1]["status"] == "accepted" and accepted is None:
+                        accepted = attempts[-1]
+        finally:
+            for task in pending:
+                task.cancel()
+                attempts.append({"model": str(tasks[task]), "status": "timeout" if accepted is None else "cancelled"})
+        return accepted
+
+    def finish(self, attempts: list, accepted: dict, tier_latencies: list, return_metadata: bool):
+        if accepted is None:
+            # no tier accepted, so fall back to the best scoring answer seen
+            answered = [attempt for attempt in attempts if "output" in attempt]
+            if len(answered) == 0:
+                raise RuntimeError(f"Every model in {self} failed or timed out.")
+            accepted = max(answered, key=lambda attempt: float("-inf") if attempt["score"] is None else attempt["score"])
+        output = accepted["output"]
+        if not return_metadata:
+            return output
+        return output, {
+            "tier": accepted["tier"],
+            "model": accepted["model"],
+            "score": accepted["score"],
+            "accepted": accepted["status"] == "accepted",
+            "tier_latencies": tier_latencies,
+            "attempts": [{key: value for key, value in attempt.items() if key != "output"} for attempt in attempts],
+        }
+
+    def run(self, *args, return_metadata: bool = False, metadata_only: bool = False, **kwargs):
+        if metadata_only:
+            return {"model_tiers": [[str(model) for model in tier] for tier in self.model_tiers]}
+        attempts, tier_latencies, accepted = [], [], None
+        for tier_idx, (tier, budget) in enumerate(zip(self.model_tiers, self.tier_budgets)):
+            start, count = time.perf_counter(), len(attempts)
+            accepted = self.run_tier(tier, budget, args, kwargs, attempts)
+            for attempt in attempts[count:]:
+                attempt["tier"] = tier_idx
+            tier_latencies.append(time.perf_counter() - start)
+            if accepted is not None:
+                break
+        return self.finish(attempts, accepted, tier_latencies, return_metadata)
+
+    async def arun(self, *args, return_metadata: bool = False, metadata_only: bool = False, **kwargs):
+        if metadata_only:
+            return {"model_tiers": [[str(model) for model in tier] for tier in self.model_tiers]}
+        attempts, tier_latencies, accepted = [], [], None
+        for tier_idx, (tier, budget) in enumerate(zip(self.model_tiers, self.tier_budgets)):
+            start, count = time.perf_counter(), len(attempts)
+            accepted = await self.arun_tier(tier, budget, args, kwargs, attempts)
+            for attempt in attempts[count:]:
+                attempt["tier"] = tier_idx
+            tier_latencies.append(time.perf_counter() - start)
+            if accepted is not None:
+                break
+        return self.finish(attempts, accepted, tier_latencies, return_metadata)
+
+    def run_batch(self, inputs: list, return_metadata: bool = False, metadata_only: bool = False, executor: Union[Executor, str] = None, **kwargs):
+        if metadata_only:
+            return [self.run(input, metadata_only=True) for input in inputs]
+        results = get_executor(executor).map([Call(self.run, (input,), {"return_metadata": True, **kwargs}) for input in inputs])
+        outputs = [output for output, _ in results]
+        if return_metadata:
+            return outputs, [metadata for _, metadata in results]
+        return outputs
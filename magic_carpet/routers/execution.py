@@ -0,0 +1,344 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Union
+from magic_carpet.routers.profiles import ModelProfile
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+class CircuitBreaker:
+    # opens after failure_threshold consecutive failures, lets one trial call through after reset_timeout
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, **kwargs):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.trial or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.trial = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial = False
+
+class SaturatedError(RuntimeError):
+    pass
+
+class Attempt:
+    # started is set by the worker when the call begins, so time spent waiting for a thread never counts as latency
+    def __init__(self, model, attempt: int):
+        self.model = model
+        self.attempt = attempt
+        self.started = None
+
+    def elapsed(self) -> float:
+        return 0.0 if self.started is None else time.monotonic() - self.started
+
+class Dispatch:
+    # bookkeeping for one request, shared by the thread and asyncio drivers
+    def __init__(self, policy: "ExecutionPolicy", candidates: list):
+        self.policy = policy
+        self.candidates = iter(candidates)
+        self.pending = {}
+        self.retries = []
+        self.attempts = []
+        self.launched = []
+        self.error = None
+        self.hedged = 0
+        self.hedge_after = None
+        self.hedge_at = None
+
+    def next_candidate(self):
+        # failover takes every remaining candidate, only hedges fired while an attempt is still running count against max_hedges
+        for model in self.candidates:
+            if self.policy.breaker(model).allow():
+                self.launched.append(model)
+                if len(self.launched) == 1:
+                    self.hedge_after = self.policy.hedge_delay(model)
+                    self.hedge_at = None if self.hedge_after is None else time.monotonic() + self.hedge_after
+                return model
+            self.attempts.append({"model": str(model), "status": "circuit_open"})
+        return None
+
+    def timeout(self):
+        now = time.monotonic()
+        events = [when for when, _, _ in self.retries]
+        if self.hedge_at is not None:
+            events.append(self.hedge_at)
+        for attempt in self.pending.values():
+            timeout = self.policy.timeout_for(attempt.model)
+            if timeout is not None:
+                # an attempt whose thread has not picked it up yet is checked again shortly
+                events.append(attempt.started + timeout if attempt.started is not None else now + min(timeout, 0.01))
+        return None if len(events) == 0 else max(min(events) - now, 0)
+
+    def succeed(self, attempt: Attempt, output):
+        latency = attempt.elapsed()
+        self.policy.breaker(attempt.model).record_success()
+        self.policy.profile(attempt.model).observe(latency)
+        self.attempts.append({"model": str(attempt.model), "attempt": attempt.attempt, "status": "ok", "latency": latency})
+        for other in self.pending.values():
+            self.attempts.append({"model": str(other.model), "attempt": other.attempt, "status": "cancelled"})
+        return output, {"model": str(attempt.model), "hedged": self.hedged > 0, "attempts": self.attempts}
+
+    def fail(self, attempt: Attempt, error: BaseException, status: str = "error"):
+        self.policy.breaker(attempt.model).record_failure()
+        self.attempts.append({"model": str(attempt.model), "attempt": attempt.attempt, "status": status, "latency": attempt.elapsed(), "error": repr(error)})
+        self.error = error
+        if attempt.attempt <= self.policy.retries and isinstance(error, self.policy.retry_on):
+            self.retries.append((time.monotonic() + self.policy.backoff(attempt.attempt), attempt.model, attempt.attempt + 1))
+
+    def expired(self) -> list:
+        expired = []
+        for handle, attempt in list(self.pending.items()):
+            timeout = self.policy.timeout_for(attempt.model)
+            if timeout is not None and attempt.started is not None and attempt.elapsed() >= timeout:
+                del self.pending[handle]
+                self.fail(attempt, TimeoutError(f"{attempt.model} did not answer within {timeout}s."), status="timeout")
+                expired.append(handle)
+        return expired
+
+    def due(self) -> list:
+        now = time.monotonic()
+        due = [(model, attempt) for when, model, attempt in self.retries if when <= now]
+        self.retries = [retry for retry in self.retries if retry[0] > now]
+        return [(model, attempt) for model, attempt in due if self.policy.breaker(model).allow()]
+
+    def hedges(self) -> list:
+        # fire the next-best candidate each time the primary's latency quantile passes again, up to max_hedges, or fail
+        # over when nothing is left running
+        now = time.monotonic()
+        if self.hedge_at is not None and now >= self.hedge_at:
+            self.hedge_at = None
+            model = self.next_candidate()
+            if model is None:
+                return []
+            self.hedged += 1
+            if self.hedged < self.policy.max_hedges:
+                self.hedge_at = now + self.hedge_after
+            return [model]
+        if len(self.pending) == 0 and len(self.retries) == 0:
+            model = self.next_candidate()
+            return [] if model is None else [model]
+        return []
+
+    def finished(self) -> bool:
+        return len(self.pending) == 0 and len(self.retries) == 0
+
+    def raise_error(self):
+        if self.error is None:
+            raise CircuitOpenError(f"Every candidate model has an open circuit: {[attempt['model'] for attempt in self.attempts]}.")
+        raise self.error
+
+class ExecutionPolicy:
+    def __init__(
+            self,
+            timeout: Union[float, dict] = None,
+            hedge_quantile: float = 0.95,
+            hedge_delay: float = None,
+            max_hedges: int = 1,
+            retries: int = 0,
+            backoff: float = 0.05,
+            backoff_multiplier: float = 2.0,
+            max_backoff: float = 2.0,
+            retry_on: tuple = (Exception,),
+            failure_threshold: int = 5,
+            reset_timeout: float = 30.0,
+            min_observations: int = 20,
+            max_workers: int = 32,
+            window: int = 256,
+            **kwargs
+        ):
+        self.timeout = timeout
+        self.hedge_quantile = hedge_quantile
+        self.fixed_hedge_delay = hedge_delay
+        self.max_hedges = max_hedges
+        self.retries = retries
+        self.initial_backoff = backoff
+        self.backoff_multiplier = backoff_multiplier
+        self.max_backoff = max_backoff
+        self.retry_on = retry_on
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.min_observations = min_observations
+        # per model: calls abandoned after a timeout or lost hedge keep their slot until they actually return
+        self.max_workers = max_workers
+        self.window = window
+        self.profiles = {}
+        self.breakers = {}
+        self.pools = {}
+        self.in_flight = {}
+        self._lock = threading.Lock()
+
+    def profile(self, model) -> ModelProfile:
+        model = str(model)
+        if model not in self.profiles:
+            with self._lock:
+                self.profiles.setdefault(model, ModelProfile(window=self.window))
+        return self.profiles[model]
+
+    def breaker(self, model) -> CircuitBreaker:
+        model = str(model)
+        if model not in self.breakers:
+            with self._lock:
+                self.breakers.setdefault(model, CircuitBreaker(self.failure_threshold, self.reset_timeout))
+        return self.breakers[model]
+
+    def timeout_for(self, model):
+        if isinstance(self.timeout, dict):
+            return self.timeout.get(str(model))
+        return self.timeout
+
+    def hedge_delay(self, model):
+        if self.max_hedges < 1:
+            return None
+        if self.fixed_hedge_delay is not None:
+            return self.fixed_hedge_delay
+        profile = self.profile(model)
+        if len(profile.observations) < self.min_observations:
+            return None
+        return profile.latency(self.hedge_quantile)
+
+    def backoff(self, attempt: int) -> float:
+        delay = min(self.initial_backoff * self.backoff_multiplier ** (attempt - 1), self.max_backoff)
+        return delay * (0.5 + random.random() / 2)
+
+    def pool(self, model) -> ThreadPoolExecutor:
+        # one pool per model, so models that hang cannot hold the threads other models' calls need
+        model = str(model)
+        if model not in self.pools:
+            with self._lock:
+                if model not in self.pools:
+                    self.pools[model] = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self.pools[model]
+
+    def acquire(self, model) -> bool:
+        with self._lock:
+            count = self.in_flight.get(str(model), 0)
+            if count >= self.max_workers:
+                return False
+            self.in_flight[str(model)] = count + 1
+            return True
+
+    def release(self, model):
+        with self._lock:
+            self.in_flight[str(model)] -= 1
+
+    def launch(self, dispatch: Dispatch, model, attempt: int, start: Callable):
+        # a model with every slot taken fails the attempt right away, which counts against its circuit breaker
+        record = Attempt(model, attempt)
+        if not self.acquire(model):
+            dispatch.fail(record, SaturatedError(f"{model} has {self.max_workers} calls in flight."), status="saturated")
+            return
+        handle = start(record)
+        handle.add_done_callback(lambda _: self.release(model))
+        dispatch.pending[handle] = record
+
+    def failover(self, dispatch: Dispatch, start: Callable):
+        while dispatch.finished():
+            model = dispatch.next_candidate()
+            if model is None:
+                return
+            self.launch(dispatch, model, 1, start)
+
+    def run(self, candidates: list, call: Callable):
+        def timed(record: Attempt):
+            record.started = time.monotonic()
+            return call(record.model)
+
+        start = lambda record: self.pool(record.model).submit(timed, record)
+        dispatch = Dispatch(self, candidates)
+        self.failover(dispatch, start)
+        while not dispatch.finished():
+            timeout = dispatch.timeout()
+            if len(dispatch.pending) > 0:
+                done, _ = wait(dispatch.pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            else:
+                time.sleep(timeout or 0)
+                done = set()
+            for future in done:
+                attempt = dispatch.pending.pop(future)
+                try:
+                    output = future.result()
+                except Exception as e:
+                    dispatch.fail(attempt, e)
+                    continue
+                for other in dispatch.pending:
+                    other.cancel()
+                return dispatch.succeed(attempt, output)
+            for future in dispatch.expired():
+                future.cancel()
+            for model, attempt in dispatch.due():
+                self.launch(dispatch, model, attempt, start)
+            for model in dispatch.hedges():
+                self.launch(dispatch, model, 1, start)
+            self.failover(dispatch, start)
+        dispatch.raise_error()
+
+    async def arun(self, candidates: list, call: Callable):
+        async def timed(record: Attempt):
+            record.started = time.monotonic()
+            return await call(record.model)
+
+        start = lambda record: asyncio.ensure_future(timed(record))
+        dispatch = Dispatch(self, candidates)
+        self.failover(dispatch, start)
+        try:
+            while not dispatch.finished():
+                timeout = dispatch.timeout()
+                if len(dispatch.pending) > 0:
+                    done, _ = await asyncio.wait(dispatch.pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                else:
+                    await asyncio.sleep(timeout or 0)
+                    done = set()
+                for task in done:
+                    attempt = dispatch.pending.pop(task)
+                    try:
+                        output = task.result()
+                    except Exception as e:
+                        dispatch.fail(attempt, e)
+                        continue
+                    return dispatch.succeed(attempt, output)
+                for task in dispatch.expired():
+                    task.cancel()
+                for model, attempt in dispatch.due():
+                    self.launch(dispatch, model, attempt, start)
+                for model in dispatch.hedges():
+                    self.launch(dispatch, model, 1, start)
+                self.failover(dispatch, start)
+            dispatch.raise_error()
+        finally:
+            for task in dispatch.pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            model: {**self.profile(model).to_dict(), "circuit": self.breaker(model).state, "in_flight": self.in_flight.get(model, 0)}
+            for model in sorted(set(self.profiles) | set(self.breakers))
+        }
@@ -1,36 +1,110 @@
-import pandas as pd
-from openai import OpenAI
-from magic_carpet.routers.router import Router
-import numpy as np
+import json
 import os
-from sklearn.decomposition import PCA
+import threading
+from typing import Callable, Union
+from magic_carpet.common.imports import require
 
+np = require("numpy", "map")
+pd = require("pandas", "map")
+PCA = require("sklearn.decomposition", "map").PCA
 
+from magic_carpet.embedders import CorpusEmbedder, Embedder, as_embedder, openai_embedder
+from magic_carpet.routers.objective import RoutingObjective
+from magic_carpet.routers.online import OnlineRouter
+from magic_carpet.routers.router import NamedRouter
+from magic_carpet.routers.training_store import TrainingStore, as_store
 
-def openai_embedder(df, model="text-embedding-ada-002", api_key=os.getenv("OPENAI_API_KEY"), **kwargs):
-    client = OpenAI(
-        # This is the default and can be omitted
-        api_key=api_key,
-    )
-    # convert df to list of strings assuming that df is just a series of Strings 
-    return [d.embedding for d in client.embeddings.create(input = df.values.tolist(), model=model).data]
+SCORER_ARRAYS = ("components", "mean_coefs", "offsets", "embeds_t", "embed_norms", "dist_means", "dist_stds")
 
-class ModelMapRouter(Router):
-    def __init__(self, model_cols: list[str], embedder=openai_embedder, model_dim=384, **kwargs):
-        super().__init__(**kwargs)
-        self.train_df["best_model"] = self.train_df[model_cols].idxmin(axis=1)
-        self.embedder = embedder
+def embedding_stats(vectors: np.ndarray) -> dict:
+    vectors = np.asarray(vectors, dtype=np.float64)
+    mean = vectors.mean(axis=0)
+    centered = vectors - mean
+    return {"count": len(vectors), "mean": mean, "scatter": centered.T @ centered}
+
+def merge_stats(a: dict, b: dict) -> dict:
+    # Chan et al. pairwise update of count, mean and scatter matrix
+    if a is None:
+        return b
+    count = a["count"] + b["count"]
+    delta = b["mean"] - a["mean"]
+    return {
+        "count": count,
+        "mean": a["mean"] + delta * b["count"] / count,
+        "scatter": a["scatter"] + b["scatter"] + np.outer(delta, delta) * a["count"] * b["count"] / count,
+    }
+
+def sample_rows(sample: np.ndarray, seen: int, rows: np.ndarray, size: int, rng: np.random.Generator) -> np.ndarray:
+    # reservoir sampling (Algorithm R): a uniform sample of at most size rows out of the seen + len(rows) so far
+    if sample is None:
+        sample = rows[:0].copy()
+    fill = min(size - len(sample), len(rows))
+    sample = np.concatenate([sample, rows[:fill]])
+    positions = seen + np.arange(fill, len(rows))
+    slots = rng.integers(0, positions + 1)
+    keep = slots < size
+    # later rows overwrite earlier ones drawing the same slot, as they would one at a time
+    sample[slots[keep]] = rows[fill:][keep]
+    return sample
+
+def principal_components(stats: dict, num_components: int) -> np.ndarray:
+    eigenvalues, eigenvectors = np.linalg.eigh(stats["scatter"])
+    return np.ascontiguousarray(eigenvectors[:, ::-1][:, :num_components].T, dtype=np.float32)
+
+def residual_distances(vectors: np.ndarray, components: np.ndarray, mean: np.ndarray) -> np.ndarray:
+    # a group's mean embedding projects onto itself, so it is the model embedding the residuals are measured from
+    residuals = vectors - ((vectors - mean) @ components.T) @ components
+    return np.linalg.norm(mean - residuals, axis=1)
+
+def merge_moments(count: int, mean: float, std: float, values: np.ndarray) -> dict:
+    total = count + len(values)
+    delta = values.mean() - mean
+    m2 = std ** 2 * count + ((values - values.mean()) ** 2).sum() + delta ** 2 * count * len(values) / total
+    return {"mean": mean + delta * len(values) / total, "std": np.sqrt(m2 / total)}
+
+
+class ModelMapRouter(OnlineRouter, NamedRouter):
+    accepts_embeddings = True
+    # distances below this fraction of ||v||^2 + ||e||^2 are recomputed directly, see model_scores
+    cancellation_tolerance = 1e-3
+    # rows per model kept while streaming, to estimate the mean and spread of distances to its map
+    distance_sample_size = 4096
+    def __init__(
+            self,
+            models,
+            data: Union[pd.DataFrame, str, TrainingStore],
+            model_cols: list[str] = None,
+            input_col: str = "prompt",
+            embedder: Union[Embedder, Callable] = None,
+            model_dim: int = 384,
+            objective: RoutingObjective = None,
+            chunk_size: int = 8192,
+            embeddings_path: str = None,
+            embeddings_params: dict = {},
+            **kwargs
+        ):
+        super().__init__(models, **kwargs)
+        self.objective = objective
+        store = as_store(data, input_col=input_col, model_cols=model_cols)
+        self.input_col = input_col
+        self.model_cols = store.model_cols
+        self.embedder = as_embedder(embedder)
         self.model_dim = model_dim
 
         self.model_embeds = {}
         self.pcas = {}
+        self.components = {}
+        self.means = {}
         self.model_embed_info = {}
-        self.create_model_maps()
+        self.model_stats = {}
+        if embeddings_path is None:
+            self.create_model_maps(store, chunk_size)
+        else:
+            self.create_model_maps_from_corpus(store, CorpusEmbedder(self.embedder, embeddings_path, **embeddings_params), chunk_size)
 
     def model_projection(self, model, vectors):
-        pca = self.pcas[model]
-        coefs = pca.transform(vectors)
-        return vectors - (coefs.reshape(*coefs.shape, 1) * pca.components_.reshape(1, *pca.components_.shape)).sum(axis=1)
+        components = self.components[model]
+        return vectors - ((vectors - self.means[model]) @ components.T) @ components
     
     def projection_distance(self, model, vectors):
         model_embedding = self.model_embeds[model]
@@ -40,25 +114,236 @@ class ModelMapRouter(Router):
         assert (model in self.model_embed_info)
         return (self.projection_distance(model, vectors) - self.model_embed_info[model]["mean"]) / max(self.model_embed_info[model]["std"], 1e-10)
 
-    def create_model_maps(self):
-        assert ("best_model" in self.train_df.columns)
-        for model, group in self.train_df.groupby("best_model"):
-            group_embeds = np.array(self.embedder(group.prompt)).astype(np.float32)
-            pca = PCA(n_components=group_embeds.shape[1] - self.model_dim)
-            pca.fit(group_embeds)
-            self.pcas[model] = pca
-            self.model_embeds[model] = self.model_projection(model, group_embeds).mean(axis=0)
-            group_proj_dists = self.projection_distance(model, group_embeds)
-            self.model_embed_info[model] = {
-                "mean": group_proj_dists.mean(),
-                "std": group_proj_dists.std()
-            }
+    def create_model_maps(self, store: TrainingStore, chunk_size: int = 8192):
+        # the training data is streamed once. Each model's map is fit exactly from its running count, mean and scatter
+        # matrix, and its distance statistics from a uniform sample of distance_sample_size rows, so memory does not
+        # grow with the corpus
+        stats, samples = {}, {}
+        rng = np.random.default_rng(0)
+        for prompts, scores in store.chunks(chunk_size):
+            best = np.array(self.model_cols, dtype=object)[np.nanargmin(scores, axis=1)]
+            vectors = self.embedder(prompts)
+            for model in np.unique(best):
+                group_embeds = vectors[best == model]
+                seen = 0 if model not in stats else stats[model]["count"]
+                samples[model] = sample_rows(samples.get(model), seen, group_embeds, self.distance_sample_size, rng)
+                stats[model] = merge_stats(stats.get(model), embedding_stats(group_embeds))
+        for model in sorted(stats):
+            components = principal_components(stats[model], stats[model]["mean"].shape[0] - self.model_dim)
+            self.components[model] = components
+            self.means[model] = mean = stats[model]["mean"].astype(np.float32)
+            self.model_embeds[model] = mean.copy()
+            group_proj_dists = residual_distances(samples.pop(model), components, mean)
+            self.model_embed_info[model] = {"mean": group_proj_dists.mean(), "std": group_proj_dists.std()}
+            self.model_stats[model] = stats[model]
+        self.build_scorer()
+
+    def create_model_maps_from_corpus(self, store: TrainingStore, corpus: CorpusEmbedder, chunk_size: int = 8192):
+        # every row is embedded to disk first, resuming an interrupted build, then each model's rows are read back
+        best = []
+        def prompts():
+            for prompts, scores in store.chunks(chunk_size):
+                best.append(np.array(self.model_cols, dtype=object)[np.nanargmin(scores, axis=1)])
+                yield prompts
+        vectors = corpus.embed(prompts(), len(store))
+        best = np.concatenate(best)
+        for model in sorted(np.unique(best)):
+            self.fit_model_map(model, np.asarray(vectors[best == model]))
+        self.build_scorer()
+
+    def fit_model_map(self, model, group_embeds: np.ndarray):
+        pca = PCA(n_components=group_embeds.shape[1] - self.model_dim)
+        pca.fit(group_embeds)
+        self.pcas[model] = pca
+        self.components[model] = pca.components_.astype(np.float32)
+        self.means[model] = pca.mean_.astype(np.float32)
+        self.model_embeds[model] = self.model_projection(model, group_embeds).mean(axis=0)
+        group_proj_dists = self.projection_distance(model, group_embeds)
+        self.model_embed_info[model] = {
+            "mean": group_proj_dists.mean(),
+            "std": group_proj_dists.std()
+        }
+        self.model_stats[model] = embedding_stats(group_embeds)
+
+    def refit(self, vectors: np.ndarray, scores: np.ndarray):
+        # PCA is refit exactly from each model's running count, mean and scatter matrix; the distance statistics are
+        # running estimates, so earlier examples keep the distances they had under the projection at the time
+        if self.model_stats is None:
+            raise ValueError("This router was saved without update statistics, rebuild it to enable update().")
+        best = np.array(self.model_cols, dtype=object)[np.nanargmin(scores, axis=1)]
+        components, means, model_embeds = dict(self.components), dict(self.means), dict(self.model_embeds)
+        model_embed_info, model_stats = dict(self.model_embed_info), dict(self.model_stats)
+        for model in np.unique(best):
+            if model not in self.models:
+                raise ValueError(f"Model {model} not found in router's models but is in the update.")
+            group_embeds = np.asarray(vectors[best == model], dtype=np.float64)
+            stats = merge_stats(model_stats.get(model), embedding_stats(group_embeds))
+            components[model] = principal_components(stats, group_embeds.shape[1] - self.model_dim)
+            means[model] = mean = stats["mean"].astype(np.float32)
+            model_embeds[model] = mean.copy()
+            group_proj_dists = residual_distances(group_embeds, components[model], mean)
+            previous = model_embed_info.get(model)
+            if previous is None:
+                model_embed_info[model] = {"mean": group_proj_dists.mean(), "std": group_proj_dists.std()}
+            else:
+                model_embed_info[model] = merge_moments(model_stats[model]["count"], previous["mean"], previous["std"], group_proj_dists)
+            model_stats[model] = stats
+            self.pcas.pop(model, None)
+        self.components, self.means, self.model_embeds = components, means, model_embeds
+        self.model_embed_info, self.model_stats = model_embed_info, model_stats
+        self.build_scorer()
+
+    def build_scorer(self):
+        # With orthonormal components C, mean mu and model embedding e, the residual distance of v is
+        #   ||e - v + ((v - mu) C^T) C||^2 = ||v||^2 - 2 v.e + ||e||^2 + 2 (eC^T - muC^T).w - ||w||^2,  w = vC^T - muC^T
+        # so every model is scored from one (N, d) x (d, models * r) matmul. The scorer is replaced as a single
+        # attribute so routing during a refit always sees one consistent state.
+        models = list(self.model_embeds)
+        components = np.stack([self.components[model] for model in models])
+        means = np.stack([self.means[model] for model in models])
+        embeds = np.stack([self.model_embeds[model] for model in models]).astype(np.float32)
+        num_models, r, d = components.shape
+        mean_coefs = np.einsum("md,mrd->mr", means, components)
+        self.scorer = {
+            "models": models,
+            "components": np.ascontiguousarray(components.reshape(num_models * r, d).T),
+            "mean_coefs": mean_coefs,
+            "offsets": np.einsum("md,mrd->mr", embeds, components) - mean_coefs,
+            "embeds_t": np.ascontiguousarray(embeds.T),
+            "embed_norms": (embeds ** 2).sum(axis=1),
+            "dist_means": np.array([self.model_embed_info[model]["mean"] for model in models], dtype=np.float32),
+            "dist_stds": np.maximum(np.array([self.model_embed_info[model]["std"] for model in models], dtype=np.float32), 1e-10),
+            **self.residual_arrays(models),
+        }
+        self.scorer_buffers = threading.local()
+
+    def residual_arrays(self, models: list) -> dict:
+        # float64 copies for recomputing, directly, the residuals the float32 expansion cannot resolve; they are
+        # derived from the model maps rather than saved, so a loaded scorer rebuilds them the same way
+        return {
+            "model_components": np.stack([self.components[model] for model in models]).astype(np.float64),
+            "means": np.stack([self.means[model] for model in models]).astype(np.float64),
+            "embeds": np.stack([self.model_embeds[model] for model in models]).astype(np.float64),
+        }
+
+    def model_scores(self, vectors):
+        scorer = self.scorer
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        n, num_models = vectors.shape[0], len(scorer["models"])
+        # coefficient buffers are reused per thread so concurrent route calls never share one
+        buffer = getattr(self.scorer_buffers, "coefs", None)
+        if buffer is None or buffer.shape[0] < n or buffer.shape[1] != scorer["components"].shape[1]:
+            buffer = self.scorer_buffers.coefs = np.empty((n, scorer["components"].shape[1]), dtype=np.float32)
+        coefs = np.matmul(vectors, scorer["components"], out=buffer[:n]).reshape(n, num_models, -1)
+        coefs -= scorer["mean_coefs"]
+        scale = (vectors ** 2).sum(axis=1, keepdims=True) + scorer["embed_norms"]
+        dists = scale - 2 * (vectors @ scorer["embeds_t"])
+        dists += 2 * np.einsum("nmr,mr->nm", coefs, scorer["offsets"]) - np.einsum("nmr,nmr->nm", coefs, coefs)
+        # the expansion subtracts terms of size ~scale, so in float32 residuals far below that are lost to
+        # cancellation; those few entries get the direct residual norm in float64 instead
+        rows, cols = np.nonzero(dists <= self.cancellation_tolerance * scale)
+        for model in np.unique(cols):
+            model_rows = rows[cols == model]
+            components = scorer["model_components"][model]
+            points = vectors[model_rows].astype(np.float64)
+            residuals = scorer["embeds"][model] - points + ((points - scorer["means"][model]) @ components.T) @ components
+            dists[model_rows, model] = (residuals ** 2).sum(axis=1)
+        z_scores = (np.sqrt(np.maximum(dists, 0)) - scorer["dist_means"]) / scorer["dist_stds"]
+        return scorer["models"], z_scores
 
     def route(self, input: str, **kwargs):
-        input_embedding = np.array(self.embedder(pd.Series(input), **kwargs)).astype(np.float32)
-        model_z_scores = {model: self.normalized_projection_distance(model, input_embedding) for model in self.model_embeds}
-        return self[min(model_z_scores, key=model_z_scores.get)], {"model_scores": model_z_scores}
+        return self.route_batch([input], **kwargs)[0]
+
+    def candidates(self, selection, metadata: dict) -> list:
+        if "objective" in metadata:
+            ranking = list(metadata["objective"])
+        else:
+            ranking = sorted(metadata["model_scores"], key=metadata["model_scores"].get)
+        return [selection] + [self[model] for model in ranking if self[model] is not selection]
 
+    def route_batch(self, inputs: list[str], embeddings: np.ndarray = None, **kwargs):
+        # callers that already embedded the inputs with this router's embedder pass the vectors as embeddings
+        input_embeddings = self.embedder(list(inputs), **kwargs) if embeddings is None else np.asarray(embeddings, dtype=np.float32).reshape(len(inputs), -1)
+        models, z_scores = self.model_scores(input_embeddings)
+        if self.objective is None:
+            best = z_scores.argmin(axis=1)
+            return [
+                (self[models[j]], {"model_scores": dict(zip(models, row.tolist()))})
+                for j, row in zip(best, z_scores)
+            ]
+        # lower z-scores are better, so their negation is the quality term
+        best, breakdowns = self.objective.select(-z_scores, models)
+        return [
+            (self[models[j]], {"model_scores": dict(zip(models, row.tolist())), "objective": breakdown})
+            for j, row, breakdown in zip(best, z_scores, breakdowns)
+        ]
+
+    def save(self, path: str):
+        # every array is written as its own .npy file so that load(mmap=True) can map it read-only
+        os.makedirs(path, exist_ok=True)
+        models = list(self.model_embeds)
+        arrays = {
+            "components": np.stack([self.components[model] for model in models]),
+            "means": np.stack([self.means[model] for model in models]),
+            "model_embeds": np.stack([self.model_embeds[model] for model in models]),
+            "dist_means": np.array([self.model_embed_info[model]["mean"] for model in models]),
+            "dist_stds": np.array([self.model_embed_info[model]["std"] for model in models]),
+            **{f"scorer_{name}": self.scorer[name] for name in SCORER_ARRAYS},
+        }
+        if self.model_stats is not None:
+            arrays["stat_counts"] = np.array([self.model_stats[model]["count"] for model in models])
+            arrays["stat_means"] = np.stack([self.model_stats[model]["mean"] for model in models])
+            arrays["stat_scatters"] = np.stack([self.model_stats[model]["scatter"] for model in models])
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), np.ascontiguousarray(array))
+        with open(os.path.join(path, "router.json"), 'w') as f:
+            json.dump({
+                "models": models,
+                "scorer_models": list(self.scorer["models"]),
+                "model_cols": list(self.model_cols),
+                "input_col": self.input_col,
+                "model_dim": self.model_dim,
+            }, f)
+
+    @classmethod
+    def load(cls, path: str, models, embedder: Union[Embedder, Callable] = None, mmap: bool = True, objective: RoutingObjective = None, **kwargs):
+        with open(os.path.join(path, "router.json"), 'r') as f:
+            state = json.load(f)
+        mmap_mode = "r" if mmap else None
+        arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+            for name in ("components", "means", "model_embeds", "dist_means", "dist_stds")
+        }
+        router = cls.__new__(cls)
+        NamedRouter.__init__(router, models, **kwargs)
+        router.objective = objective
+        router.input_col = state["input_col"]
+        router.model_cols = state["model_cols"]
+        router.embedder = as_embedder(embedder)
+        router.model_dim = state["model_dim"]
+        router.pcas = {}
+        router.components = dict(zip(state["models"], arrays["components"]))
+        router.means = dict(zip(state["models"], arrays["means"]))
+        router.model_embeds = dict(zip(state["models"], arrays["model_embeds"]))
+        router.model_embed_info = {
+            model: {"mean": mean, "std": std} for model, mean, std in zip(state["models"], arrays["dist_means"], arrays["dist_stds"])
+        }
+        for model in router.model_embeds:
+            if model not in router.models:
+                raise ValueError(f"Model {model} not found in router's models but is in the saved router.")
+        router.model_stats = None
+        if os.path.exists(os.path.join(path, "stat_counts.npy")):
+            counts, means, scatters = (np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode) for name in ("stat_counts", "stat_means", "stat_scatters"))
+            router.model_stats = {
+                model: {"count": int(count), "mean": mean, "scatter": scatter} for model, count, mean, scatter in zip(state["models"], counts, means, scatters)
+            }
+        router.scorer = {
+            "models": state["scorer_models"],
+            **{name: np.load(os.path.join(path, f"scorer_{name}.npy"), mmap_mode=mmap_mode) for name in SCORER_ARRAYS},
+            **router.residual_arrays(state["scorer_models"]),
+        }
+        router.scorer_buffers = threading.local()
+        return router
 
 
 def test():
@@ -81,7 +366,7 @@ def test():
         "FalseModel": false_rankings,
     })
 
-    router = ModelMapRouter([{"name": name, "func": model_fn} for name, model_fn in zip(names, model_fns)], data=data, model_dim=1535)
+    router = ModelMapRouter([{"name": name, "function": model_fn} for name, model_fn in zip(names, model_fns)], data=data, model_dim=1535)
     
     questions = [
         "If John has four apples and Sarah has three apples, then Sarah has more apples than John?\nA: True\nB: False",
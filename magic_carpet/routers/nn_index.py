@@ -0,0 +1,107 @@
+from magic_carpet.common.imports import require
+
+np = require("numpy", "nn")
+faiss = require("faiss", "nn")
+
+INDEX_FACTORIES = {
+    "flat": "Flat",
+    "ivf": "IVF{nlist},Flat",
+    "hnsw": "HNSW{hnsw_m}",
+    "pq": "PQ{pq_m}x{pq_nbits}",
+    "ivfpq": "IVF{nlist},PQ{pq_m}x{pq_nbits}",
+}
+
+INDEX_DEFAULTS = {
+    "nlist": 1024,
+    "hnsw_m": 32,
+    "pq_m": 16,
+    "pq_nbits": 8,
+}
+
+def build_index(d: int, index_type: str = "flat", metric: int = faiss.METRIC_INNER_PRODUCT, **params) -> faiss.Index:
+    # index_type is one of INDEX_FACTORIES or any raw faiss index_factory string
+    factory = INDEX_FACTORIES.get(index_type, index_type)
+    factory = factory.format(**{**INDEX_DEFAULTS, **params})
+    index = faiss.index_factory(d, factory, metric)
+    set_search_params(index, **params)
+    return index
+
+def set_search_params(index: faiss.Index, nprobe: int = None, ef_search: int = None, **kwargs):
+    parameters = faiss.ParameterSpace()
+    if nprobe is not None and faiss.try_extract_index_ivf(index) is not None:
+        parameters.set_index_parameter(index, "nprobe", nprobe)
+    if ef_search is not None and hasattr(faiss.downcast_index(index), "hnsw"):
+        parameters.set_index_parameter(index, "efSearch", ef_search)
+
+def fit_index(index: faiss.Index, vectors: np.ndarray, max_train_size: int = None) -> faiss.Index:
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if not index.is_trained:
+        train = vectors
+        if (max_train_size is not None) and (len(vectors) > max_train_size):
+            train = vectors[np.random.default_rng(0).choice(len(vectors), max_train_size, replace=False)]
+        index.train(train)
+    index.add(vectors)
+    return index
+
+def default_train_size(index: faiss.Index) -> int:
+    # faiss k-means uses at most 256 points per centroid, so a larger training sample only costs memory
+    centroids = 1
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        centroids = max(centroids, ivf.nlist)
+    pq = getattr(faiss.downcast_index(ivf if ivf is not None else index), "pq", None)
+    if pq is not None:
+        centroids = max(centroids, pq.ksub)
+    return 256 * centroids
+
+def fit_index_chunks(index: faiss.Index, chunks, max_train_size: int = None) -> faiss.Index:
+    # an untrained index buffers chunks until max_train_size vectors (default_train_size when unset) are available to
+    # train on, then only adds, so at most about one training sample is ever held in memory
+    if max_train_size is None and not index.is_trained:
+        max_train_size = default_train_size(index)
+    pending, count = [], 0
+    for vectors in chunks:
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if index.is_trained:
+            index.add(vectors)
+            continue
+        pending.append(vectors)
+        count += len(vectors)
+        if (max_train_size is not None) and (count >= max_train_size):
+            fit_index(index, np.concatenate(pending), max_train_size=max_train_size)
+            pending = []
+    if len(pending) > 0:
+        fit_index(index, np.concatenate(pending), max_train_size=max_train_size)
+    return index
+
+def search_shards(shards: tuple, vectors: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    # each shard's ids continue where the previous shard's end; results are merged into one best-first top k
+    if len(shards) == 1:
+        return shards[0].search(vectors, k)
+    all_scores, all_ids, offset = [], [], 0
+    for shard in shards:
+        scores, ids = shard.search(vectors, k)
+        all_scores.append(scores)
+        all_ids.append(np.where(ids >= 0, ids + offset, -1))
+        offset += shard.ntotal
+    scores, ids = np.concatenate(all_scores, axis=1), np.concatenate(all_ids, axis=1)
+    # missing results are padded with the worst possible score, so they sort last either way
+    order = np.argsort(-scores if shards[0].metric_type == faiss.METRIC_INNER_PRODUCT else scores, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+def shard_vectors(index: faiss.Index) -> np.ndarray:
+    return index.reconstruct_n(0, index.ntotal)
+
+def clone_index(index: faiss.Index) -> faiss.Index:
+    return faiss.clone_index(index)
+
+def write_index(index: faiss.Index, path: str):
+    faiss.write_index(index, path)
+
+def read_index(path: str, mmap: bool = True) -> faiss.Index:
+    if mmap:
+        try:
+            return faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            pass
+    return faiss.read_index(path)
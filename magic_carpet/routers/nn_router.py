@@ -1,57 +1,223 @@
-from typing import Callable
-import pandas as pd
-from openai import OpenAI
-from magic_carpet.routers.router import NamedRouter
-import faiss
-import numpy as np
+import itertools
+import json
 import os
+from typing import Callable, Union
+from magic_carpet.common.imports import require
+
+np = require("numpy", "nn")
+pd = require("pandas", "nn")
 
+from magic_carpet.embedders import CorpusEmbedder, Embedder, as_embedder, openai_embedder
+from magic_carpet.routers.objective import RoutingObjective
+from magic_carpet.routers.nn_index import build_index, clone_index, fit_index_chunks, read_index, search_shards, set_search_params, shard_vectors, write_index
+from magic_carpet.routers.online import OnlineRouter
+from magic_carpet.routers.router import NamedRouter
+from magic_carpet.routers.training_store import TrainingStore, as_store
 
-def openai_embedder(df, model="text-embedding-ada-002", api_key=os.getenv("OPENAI_API_KEY"), **kwargs):
-    client = OpenAI(
-        # This is the default and can be omitted
-        api_key=api_key,
-    )
-    # convert df to list of strings assuming that df is just a series of Strings 
-    return [d.embedding for d in client.embeddings.create(input = df.values.tolist(), model=model).data]
 
-class NNRouter(NamedRouter):
+class NNRouter(OnlineRouter, NamedRouter):
+    accepts_embeddings = True
+    # updates go to a small flat delta index searched next to the main one, and are merged in once it holds this many rows
+    delta_size = 16384
+
     def __init__(
             self, 
-            data: pd.DataFrame, 
+            models,
+            data: Union[pd.DataFrame, str, TrainingStore], 
             input_col: str = "prompt", 
             model_cols: list[str] = None, 
             minimize: bool = True, 
-            embedder: Callable = openai_embedder, 
+            embedder: Union[Embedder, Callable] = None, 
             k: int = 10, 
             embedder_kwargs: dict = {}, 
+            weighted: bool = False,
+            index_type: str = "flat",
+            index_params: dict = {},
+            objective: RoutingObjective = None,
+            chunk_size: int = 8192,
+            embeddings_path: str = None,
+            embeddings_params: dict = {},
             **kwargs
         ):
-        super().__init__(**kwargs)
-        self.data = data
+        super().__init__(models, **kwargs)
+        self.objective = objective
+        # only the index and best_model codes stay resident, the training data is streamed once and not kept
+        store = as_store(data, input_col=input_col, model_cols=model_cols)
         self.input_col = input_col
-        self.model_cols = [col for col in data.columns if col != input_col] if model_cols is None else model_cols
+        self.model_cols = store.model_cols
         for col in self.model_cols:
-            if col not in self:
+            if col not in self.models:
                 raise ValueError(f"Model {col} not found in router's models but is in the data.")
         self.minimize = minimize
-        if minimize:
-            self.data["best_model"] = self.data[model_cols].idxmin(axis=1)
-        else:
-            self.data["best_model"] = self.data[model_cols].idxmax(axis=1)
+        # sorted ids keep bincount tie-breaking identical to pandas mode()
+        self.model_ids = np.array(sorted(self.model_cols), dtype=object)
+        self.weighted = weighted
 
-        self.embedder = embedder
+        self.embedder = as_embedder(embedder)
         self.k = k
-        vectors = np.array(self.embedder(self.data[input_col], **embedder_kwargs)).astype(np.float32)
-        self.d = vectors.shape[1]
-        self.index = faiss.IndexFlatIP(self.d)
-        self.index.add(vectors)
+        self.index_type = index_type
+        self.index_params = index_params
+        codes = []
+        if embeddings_path is None:
+            def vectors():
+                for prompts, scores in store.chunks(chunk_size):
+                    codes.append(self.label(scores))
+                    yield self.embedder(prompts, **embedder_kwargs)
+            chunks = vectors()
+        else:
+            # embeddings are checkpointed to disk as they arrive and the index is fit from the finished matrix
+            def prompts():
+                for prompts, scores in store.chunks(chunk_size):
+                    codes.append(self.label(scores))
+                    yield prompts
+            corpus = CorpusEmbedder(self.embedder, embeddings_path, **embeddings_params)
+            matrix = corpus.embed(prompts(), len(store), **embedder_kwargs)
+            chunks = (np.asarray(matrix[start:start + chunk_size]) for start in range(0, len(matrix), chunk_size))
+        first = next(chunks, None)
+        if first is None:
+            raise ValueError("Cannot build a router from empty training data.")
+        self.d = first.shape[1]
+        self.index = fit_index_chunks(build_index(self.d, index_type, **index_params), itertools.chain([first], chunks), max_train_size=index_params.get("max_train_size"))
+        self.best_model_codes = np.concatenate(codes)
+        self.index_path = None
+
+    def label(self, scores) -> np.ndarray:
+        scores = self.score_matrix(scores)
+        best = np.nanargmin(scores, axis=1) if self.minimize else np.nanargmax(scores, axis=1)
+        codes = {model: code for code, model in enumerate(self.model_ids)}
+        return np.array([codes[self.model_cols[i]] for i in best], dtype=np.int64)
+
+    def add_examples(self, prompts: list[str], scores, **kwargs):
+        self.update(prompts, scores, wait=True, **kwargs)
+
+    @property
+    def index(self):
+        return self.shards[0]
+
+    @index.setter
+    def index(self, index):
+        self.shards = (index,)
+
+    def refit(self, vectors: np.ndarray, scores: np.ndarray):
+        # searches read self.shards once, so they see either the old (main, delta) pair or the new one; codes are swapped
+        # first because they only ever gain rows, so a search against either pair always finds its labels
+        codes = self.label(scores)
+        index, *delta = self.shards
+        delta = clone_index(delta[0]) if len(delta) > 0 else build_index(self.d, "flat", metric=index.metric_type)
+        delta.add(np.ascontiguousarray(vectors, dtype=np.float32))
+        self.best_model_codes = np.concatenate([self.best_model_codes, codes])
+        if delta.ntotal < self.delta_size:
+            self.shards = (index, delta)
+            return
+        # the merge copies the main index, which happens once per delta_size updated rows rather than on every update
+        if self.index_path is not None:
+            # memory-mapped indices are read-only, so detach into memory
+            index = read_index(self.index_path, mmap=False)
+        else:
+            index = clone_index(index)
+        set_search_params(index, **self.index_params)
+        index.add(shard_vectors(delta))
+        self.shards = (index,)
+        self.index_path = None
+
+    def set_search_params(self, **params):
+        set_search_params(self.index, **params)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        index, *delta = self.shards
+        write_index(index, os.path.join(path, "index.faiss"))
+        if len(delta) > 0:
+            write_index(delta[0], os.path.join(path, "delta.faiss"))
+        elif os.path.exists(os.path.join(path, "delta.faiss")):
+            os.remove(os.path.join(path, "delta.faiss"))
+        np.save(os.path.join(path, "best_model_codes.npy"), np.asarray(self.best_model_codes))
+        with open(os.path.join(path, "router.json"), 'w') as f:
+            json.dump({
+                "model_ids": self.model_ids.tolist(),
+                "model_cols": list(self.model_cols),
+                "input_col": self.input_col,
+                "minimize": self.minimize,
+                "weighted": self.weighted,
+                "k": self.k,
+                "d": self.d,
+                "index_type": self.index_type,
+                "index_params": self.index_params,
+            }, f)
+
+    @classmethod
+    def load(cls, path: str, models, embedder: Union[Embedder, Callable] = None, mmap: bool = True, objective: RoutingObjective = None, **kwargs):
+        with open(os.path.join(path, "router.json"), 'r') as f:
+            state = json.load(f)
+        router = cls.__new__(cls)
+        NamedRouter.__init__(router, models, **kwargs)
+        for col in state["model_cols"]:
+            if col not in router.models:
+                raise ValueError(f"Model {col} not found in router's models but is in the saved router.")
+        router.objective = objective
+        router.input_col = state["input_col"]
+        router.model_cols = state["model_cols"]
+        router.minimize = state["minimize"]
+        router.model_ids = np.array(state["model_ids"], dtype=object)
+        router.best_model_codes = np.load(os.path.join(path, "best_model_codes.npy"), mmap_mode="r" if mmap else None)
+        router.weighted = state["weighted"]
+        router.embedder = as_embedder(embedder)
+        router.k = state["k"]
+        router.d = state["d"]
+        router.index_type = state["index_type"]
+        router.index_params = state["index_params"]
+        router.index = read_index(os.path.join(path, "index.faiss"), mmap=mmap)
+        router.index_path = os.path.join(path, "index.faiss") if mmap else None
+        set_search_params(router.index, **router.index_params)
+        if os.path.exists(os.path.join(path, "delta.faiss")):
+            router.shards = (router.index, read_index(os.path.join(path, "delta.faiss"), mmap=False))
+        return router
 
     def route(self, input: str, **kwargs):
-        input_embedding = np.array(self.embedder(pd.Series(input), **kwargs)).astype(np.float32)
-        _, indices = self.index.search(input_embedding, self.k)
-        nn_df = self.data.iloc[indices[0]]
-        return self[nn_df.best_model.mode()[0]], {"nn_idxs": indices[0], "model_counts": nn_df.best_model.value_counts().to_dict()}
+        return self.route_batch([input], **kwargs)[0]
+
+    def candidates(self, selection, metadata: dict) -> list:
+        ranking = metadata.get("objective", metadata.get("model_votes", metadata.get("model_counts", {})))
+        return [selection] + [self[model] for model in ranking if self[model] is not selection]
+
+    def vote(self, scores: np.ndarray, indices: np.ndarray, weighted: bool = None):
+        weighted = self.weighted if weighted is None else weighted
+        n, num_models = indices.shape[0], len(self.model_ids)
+        valid = indices >= 0
+        codes = self.best_model_codes[indices[valid]]
+        flat = codes + num_models * np.nonzero(valid)[0]
+        counts = np.bincount(flat, minlength=n * num_models).reshape(n, num_models)
+        if not weighted:
+            return counts, counts
+        votes = np.bincount(flat, weights=np.maximum(scores[valid], 0), minlength=n * num_models).reshape(n, num_models)
+        return counts, votes
+
+    def route_batch(self, inputs: list[str], weighted: bool = None, embeddings: np.ndarray = None, **kwargs):
+        # callers that already embedded the inputs with this router's embedder pass the vectors as embeddings
+        input_embeddings = self.embedder(list(inputs), **kwargs) if embeddings is None else np.asarray(embeddings, dtype=np.float32).reshape(len(inputs), -1)
+        scores, indices = search_shards(self.shards, input_embeddings, self.k)
+        counts, votes = self.vote(scores, indices, weighted=weighted)
+        breakdowns = None
+        if self.objective is None:
+            best = votes.argmax(axis=1)
+        else:
+            # vote shares are the quality term, so latency and cost weights are relative to a full neighbourhood
+            quality = votes / np.maximum(votes.sum(axis=1, keepdims=True), 1e-12)
+            best, breakdowns = self.objective.select(quality, self.model_ids)
+        selections = []
+        for i in range(len(indices)):
+            order = np.argsort(-counts[i], kind="stable")
+            metadata = {
+                "nn_idxs": indices[i],
+                "nn_scores": scores[i],
+                "model_counts": {self.model_ids[j]: int(counts[i, j]) for j in order if counts[i, j] > 0}
+            }
+            if votes is not counts:
+                metadata["model_votes"] = {self.model_ids[j]: float(votes[i, j]) for j in np.argsort(-votes[i], kind="stable") if votes[i, j] > 0}
+            if breakdowns is not None:
+                metadata["objective"] = breakdowns[i]
+            selections.append((self[self.model_ids[best[i]]], metadata))
+        return selections
 
 
 
@@ -75,7 +241,7 @@ def test():
         "FalseModel": false_rankings,
     })
 
-    router = NNRouter([{"name": name, "func": model_fn} for name, model_fn in zip(names, model_fns)], data=data, k=3)
+    router = NNRouter([{"name": name, "function": model_fn} for name, model_fn in zip(names, model_fns)], data=data, k=3)
     
     questions = [
         "If John has four apples and Sarah has three apples, then Sarah has more apples than John?\nA: True\nB: False",
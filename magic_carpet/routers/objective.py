@@ -0,0 +1,84 @@
+import threading
+from magic_carpet.common.imports import require
+from magic_carpet.routers.profiles import ModelProfile
+
+np = require("numpy", "nn")
+
+class RoutingObjective:
+    def __init__(
+            self,
+            profiles: dict = None,
+            quality_weight: float = 1.0,
+            latency_weight: float = 0.0,
+            cost_weight: float = 0.0,
+            latency_quantile: float = 0.5,
+            latency_slo: float = None,
+            slo_quantile: float = 0.95,
+            learn: bool = True,
+            window: int = 256,
+            **kwargs
+        ):
+        self.window = window
+        self.profiles = {}
+        for model, profile in ({} if profiles is None else profiles).items():
+            self.profiles[str(model)] = profile if isinstance(profile, ModelProfile) else ModelProfile(window=window, **profile)
+        self.quality_weight = quality_weight
+        self.latency_weight = latency_weight
+        self.cost_weight = cost_weight
+        self.latency_quantile = latency_quantile
+        self.latency_slo = latency_slo
+        self.slo_quantile = slo_quantile
+        self.learn = learn
+        self._lock = threading.Lock()
+
+    def profile(self, model) -> ModelProfile:
+        model = str(model)
+        if model not in self.profiles:
+            with self._lock:
+                self.profiles.setdefault(model, ModelProfile(window=self.window))
+        return self.profiles[model]
+
+    def observe(self, model, latency: float):
+        if self.learn:
+            self.profile(model).observe(latency)
+
+    def costs(self, models: list) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        profiles = [self.profile(model) for model in models]
+        # unprofiled models are not penalised, so they get tried and learned
+        latency = np.nan_to_num(np.array([profile.latency(self.latency_quantile) for profile in profiles]), nan=0.0)
+        slo_latency = np.nan_to_num(np.array([profile.latency(self.slo_quantile) for profile in profiles]), nan=0.0)
+        cost = np.array([profile.cost for profile in profiles], dtype=np.float64)
+        return latency, slo_latency, cost
+
+    def score(self, quality: np.ndarray, models: list) -> tuple[np.ndarray, np.ndarray, dict]:
+        # quality is (n, len(models)), higher is better
+        quality = np.asarray(quality, dtype=np.float64)
+        latency, slo_latency, cost = self.costs(models)
+        scores = self.quality_weight * quality - self.latency_weight * latency - self.cost_weight * cost
+        feasible = np.ones(len(models), dtype=bool)
+        if self.latency_slo is not None:
+            feasible = slo_latency <= self.latency_slo
+            if not feasible.any():
+                # nothing meets the SLO, fall back to the fastest models
+                feasible = slo_latency == slo_latency.min()
+            scores = np.where(feasible, scores, -np.inf)
+        return scores, feasible, {"latency": latency, "slo_latency": slo_latency, "cost": cost}
+
+    def select(self, quality: np.ndarray, models: list) -> tuple[np.ndarray, list[dict]]:
+        quality = np.asarray(quality, dtype=np.float64)
+        scores, feasible, parts = self.score(quality, models)
+        best = scores.argmax(axis=1)
+        breakdowns = []
+        for i in range(len(quality)):
+            order = np.argsort(-scores[i], kind="stable")
+            breakdowns.append({
+                str(models[j]): {
+                    "score": float(scores[i, j]),
+                    "quality": float(quality[i, j]),
+                    "latency": float(parts["latency"][j]),
+                    "cost": float(parts["cost"][j]),
+                    "feasible": bool(feasible[j]),
+                }
+                for j in order
+            })
+        return best, breakdowns
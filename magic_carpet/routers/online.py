@@ -0,0 +1,45 @@
+import threading
+from concurrent.futures import Future
+from magic_carpet.common.batcher import DynamicBatcher
+from magic_carpet.common.imports import require
+
+np = require("numpy", "nn")
+
+class OnlineRouter:
+    # update() queues labelled outcomes for a background thread that folds them into a new routing state and swaps it in
+    update_batch_size = 64
+    update_wait = 0.0
+    _updater = None
+    _updater_lock = threading.Lock()
+
+    def update(self, prompts: list[str], scores, wait: bool = False, **kwargs) -> Future:
+        # scores holds one row per prompt with a column per model in model_cols
+        prompts = list(prompts)
+        scores = self.score_matrix(scores)
+        if len(scores) != len(prompts):
+            raise ValueError(f"Got {len(prompts)} prompts but {len(scores)} rows of scores.")
+        if self._updater is None:
+            with self._updater_lock:
+                if self._updater is None:
+                    self._updater = DynamicBatcher(self.apply_updates, max_batch_size=self.update_batch_size, max_wait=self.update_wait, name=f"{self.__class__.__name__}.update")
+        future = self._updater.submit((prompts, scores, kwargs))
+        if wait:
+            future.result()
+        return future
+
+    def apply_updates(self, updates: list) -> list:
+        # every update queued since the last refresh is embedded and applied as one refit
+        count = len(updates)
+        updates = [update for update in updates if len(update[0]) > 0]
+        if len(updates) > 0:
+            vectors = np.concatenate([self.embedder(prompts, **kwargs) for prompts, _, kwargs in updates])
+            self.refit(vectors, np.concatenate([scores for _, scores, _ in updates]))
+        return [None] * count
+
+    def score_matrix(self, scores) -> np.ndarray:
+        if hasattr(scores, "columns"):
+            scores = scores[self.model_cols]
+        return np.asarray(scores, dtype=np.float64).reshape(-1, len(self.model_cols))
+
+    def refit(self, vectors: np.ndarray, scores: np.ndarray):
+        raise NotImplementedError
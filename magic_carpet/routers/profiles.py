@@ -0,0 +1,35 @@
+import math
+import threading
+from collections import deque
+
+def quantile(values: list, q: float) -> float:
+    # linear interpolation between order statistics, as numpy.quantile does by default
+    values = sorted(values)
+    position = q * (len(values) - 1)
+    lower = math.floor(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+class ModelProfile:
+    # static latency/cost figures, overridden by a rolling window of observed latencies once any arrive
+    def __init__(self, p50: float = None, p95: float = None, cost: float = 0.0, window: int = 256, **kwargs):
+        self.p50 = p50
+        self.p95 = p95
+        self.cost = cost
+        self.observations = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, latency: float):
+        with self._lock:
+            self.observations.append(latency)
+
+    def latency(self, q: float = 0.5) -> float:
+        with self._lock:
+            observations = list(self.observations)
+        if len(observations) > 0:
+            return float(quantile(observations, q))
+        static = (self.p95, self.p50) if q >= 0.75 else (self.p50, self.p95)
+        return next((value for value in static if value is not None), float("nan"))
+
+    def to_dict(self) -> dict:
+        return {"p50": self.latency(0.5), "p95": self.latency(0.95), "cost": self.cost, "observations": len(self.observations)}
@@ -1,5 +1,9 @@
+import time
 from abc import ABC, abstractmethod
 from typing import Callable, Tuple, Union
+from magic_carpet.common.executor import Call, Executor, acall, get_executor
+from magic_carpet.common.metrics import METRICS
+from magic_carpet.models.batched_model import BatchedModel
 from magic_carpet.models.model import Model, NamedModel
 from magic_carpet.models.model_containers import ModelContainer, ModelList, NamedModelDict 
 
@@ -12,41 +16,165 @@ class BaseRouter(ABC):
         raise NotImplementedError
 
 class Router(Model, BaseRouter):
-    def __init__(self, models, container_type: type = ModelList, **kwargs):
+    objective = None
+    execution = None
+    # routers whose route_batch takes precomputed input vectors as embeddings=
+    accepts_embeddings = False
+
+    def __init__(self, models, container_type: type = ModelList, execution=None, **kwargs):
         if not isinstance(models, ModelContainer):
             models = container_type(models=models, **kwargs)
         self.models = models
+        self.execution = execution
+
+    def __getitem__(self, key):
+        return self.models[key]
 
     def has_model(self, model: Union[Model, Callable]):
-        return self.models.has_item(model)
+        return self.models.has(model)
     
     def add_model(self, model: Union[Model, Callable]):
-        return self.models.add_item(model)
+        return self.models.add(model)
 
     def run(self, *args, return_metadata: bool = False, metadata_only: bool = False, **kwargs):
-        selection = self.route(*args, **kwargs)
-        metadata = None
-        if isinstance(selection, Tuple):
-            selection, metadata = selection
-                
+        with METRICS.span("route", self):
+            selection, metadata = self.split_selection(self.route(*args, **kwargs))
         if metadata_only:
             return metadata
         
         if not self.has_model(selection):
             raise ValueError(f"Selection {selection} not in models.")
         
-        output = self.execute(selection, **metadata.get("exec_params", {}))
+        with METRICS.span("execute", self):
+            output = self.dispatch(selection, metadata, args)
         if return_metadata:
             return output, metadata
         
         return output
 
-    def execute(self, selection, **kwargs):
-        return selection(**kwargs)
+    async def arun(self, *args, return_metadata: bool = False, metadata_only: bool = False, **kwargs):
+        with METRICS.span("route", self):
+            selection, metadata = self.split_selection(await self.aroute(*args, **kwargs))
+        if metadata_only:
+            return metadata
+        
+        if not self.has_model(selection):
+            raise ValueError(f"Selection {selection} not in models.")
+        
+        with METRICS.span("execute", self):
+            output = await self.adispatch(selection, metadata, args)
+        if return_metadata:
+            return output, metadata
+        
+        return output
+
+    def split_selection(self, selection):
+        metadata = {}
+        if isinstance(selection, Tuple):
+            selection, metadata = selection
+        if metadata is None:
+            metadata = {}
+        return selection, metadata
+
+    def exec_args(self, args: tuple, metadata: dict):
+        # routers that supply exec_params fully specify the model call, otherwise the inputs are forwarded
+        if "exec_params" in metadata:
+            return ()
+        return args
+
+    def candidates(self, selection, metadata: dict) -> list:
+        # models to hedge or fail over to, best first, starting with the selection
+        return [selection]
+
+    def dispatch(self, selection, metadata: dict, args: tuple):
+        args, kwargs = self.exec_args(args, metadata), metadata.get("exec_params", {})
+        if self.execution is None:
+            return self.execute(selection, *args, **kwargs)
+        output, metadata["execution"] = self.execution.run(self.candidates(selection, metadata), lambda model: self.execute(model, *args, **kwargs))
+        return output
+
+    async def adispatch(self, selection, metadata: dict, args: tuple):
+        args, kwargs = self.exec_args(args, metadata), metadata.get("exec_params", {})
+        if self.execution is None:
+            return await self.aexecute(selection, *args, **kwargs)
+        output, metadata["execution"] = await self.execution.arun(self.candidates(selection, metadata), lambda model: self.aexecute(model, *args, **kwargs))
+        return output
+
+    def execute(self, selection, *args, **kwargs):
+        if self.objective is None or not self.objective.learn:
+            return selection(*args, **kwargs)
+        # observed latencies feed the routing objective's per-model profiles
+        start = time.perf_counter()
+        output = selection(*args, **kwargs)
+        self.objective.observe(selection, time.perf_counter() - start)
+        return output
+
+    async def aexecute(self, selection, *args, **kwargs):
+        start = time.perf_counter()
+        if isinstance(selection, Model):
+            output = await selection.arun(*args, **kwargs)
+        else:
+            output = await acall(selection, *args, **kwargs)
+        if self.objective is not None:
+            self.objective.observe(selection, time.perf_counter() - start)
+        return output
     
+    def run_batch(self, inputs: list, return_metadata: bool = False, metadata_only: bool = False, executor: Union[Executor, str] = None, **kwargs):
+        with METRICS.span("route", self):
+            selections = [self.split_selection(selection) for selection in self.route_batch(inputs, **kwargs)]
+        METRICS.batch("route", self, len(inputs))
+        if metadata_only:
+            return [metadata for _, metadata in selections]
+
+        outputs = self.execute_selections(inputs, selections, executor=executor)
+        if return_metadata:
+            return outputs, [metadata for _, metadata in selections]
+        return outputs
+
+    def execute_selections(self, inputs: list, selections: list, executor: Union[Executor, str] = None) -> list:
+        # inputs routed to the same model are dispatched together as one batch call
+        groups = {}
+        for i, (selection, metadata) in enumerate(selections):
+            if not self.has_model(selection):
+                raise ValueError(f"Selection {selection} not in models.")
+            groups.setdefault((id(selection), "exec_params" in metadata), (selection, []))[1].append(i)
+
+        if self.execution is not None:
+            # timeouts, hedges and retries are decided per request, so each input is dispatched through the policy on its own
+            calls = [Call(self.dispatch, (selection, metadata, (input,)), key=id(selection)) for input, (selection, metadata) in zip(inputs, selections)]
+            return get_executor(executor).map(calls)
+
+        calls = []
+        for (key, has_exec_params), (selection, idxs) in groups.items():
+            if has_exec_params:
+                # explicit exec_params cannot be merged into one batch call
+                calls.append(Call(lambda selection, idxs: [self.execute(selection, **selections[i][1]["exec_params"]) for i in idxs], (selection, idxs), key=key))
+            else:
+                calls.append(Call(self.execute_batch, (selection, [inputs[i] for i in idxs]), key=key))
+
+        outputs = [None] * len(inputs)
+        for (_, idxs), group_outputs in zip(groups.values(), get_executor(executor).map(calls)):
+            for i, output in zip(idxs, group_outputs):
+                outputs[i] = output
+        return outputs
+
+    def execute_batch(self, selection, inputs: list, **kwargs):
+        METRICS.batch("execute", selection, len(inputs))
+        if isinstance(selection, BatchedModel) and len(kwargs) == 0:
+            return selection.map(inputs)
+        if isinstance(selection, Model):
+            return selection.run_batch(inputs, **kwargs)
+        return [selection(input, **kwargs) for input in inputs]
+
     def route(self, *args, **kwargs):
         raise NotImplementedError
 
+    def route_batch(self, inputs: list, **kwargs) -> list:
+        return [self.route(input, **kwargs) for input in inputs]
+
+    async def aroute(self, *args, **kwargs):
+        return await acall(self.route, *args, **kwargs)
+
 class NamedRouter(NamedModel, Router):
     def __init__(self, *args, name: str = None, description: str = None, **kwargs):
         Router.__init__(self, *args, container_type=NamedModelDict, **kwargs)
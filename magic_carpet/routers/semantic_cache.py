@@ -0,0 +1,256 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Union
+from magic_carpet.common.cache import MISSING
+from magic_carpet.common.executor import Executor, acall
+from magic_carpet.common.imports import require
+from magic_carpet.common.metrics import METRICS
+
+np = require("numpy", "nn")
+faiss = require("faiss", "nn")
+
+from magic_carpet.embedders import Embedder, as_embedder
+from magic_carpet.routers.router import NamedRouter
+
+class SemanticCache:
+    # one inner-product index per scope over unit vectors, so scores are cosine similarities
+    def __init__(self, threshold: float = 0.95, max_entries: int = 10000, ttl: float = None, **kwargs):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.indices = {}
+        self.entries = OrderedDict()
+        self.ids = itertools.count()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def normalize(self, vectors) -> np.ndarray:
+        vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    def index(self, scope, d: int):
+        if scope not in self.indices:
+            self.indices[scope] = faiss.IndexIDMap2(faiss.IndexFlatIP(d))
+        return self.indices[scope]
+
+    def lookup(self, vector, scope=None):
+        return self.lookup_batch([vector], [scope])[0]
+
+    def lookup_batch(self, vectors, scopes: list = None) -> list:
+        # returns (response, info) for hits and (MISSING, info) for misses, where info has the best similarity seen
+        vectors = self.normalize(vectors)
+        scopes = [None] * len(vectors) if scopes is None else list(scopes)
+        results = [(MISSING, {"hit": False, "similarity": None}) for _ in range(len(vectors))]
+        now = time.time()
+        with self._lock:
+            for scope in set(scopes):
+                if scope not in self.indices or self.indices[scope].ntotal == 0:
+                    continue
+                idxs = [i for i, s in enumerate(scopes) if s == scope]
+                similarities, ids = self.indices[scope].search(vectors[idxs], 1)
+                for i, similarity, id in zip(idxs, similarities[:, 0], ids[:, 0]):
+                    entry = self.entries.get(int(id))
+                    if entry is None or similarity < self.threshold:
+                        results[i] = (MISSING, {"hit": False, "similarity": float(similarity) if id >= 0 else None})
+                    elif self.ttl is not None and entry["created"] + self.ttl < now:
+                        self.remove([int(id)])
+                    else:
+                        self.entries.move_to_end(int(id))
+                        results[i] = (entry["response"], {"hit": True, "similarity": float(similarity), "model": entry["model"], "prompt": entry["prompt"]})
+            hits = sum(response is not MISSING for response, _ in results)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def add(self, vector, response, scope=None, model: str = None, prompt: str = None):
+        self.add_batch([vector], [response], [scope], [model], [prompt])
+
+    def add_batch(self, vectors, responses: list, scopes: list = None, models: list = None, prompts: list = None):
+        vectors = self.normalize(vectors)
+        n = len(vectors)
+        scopes = [None] * n if scopes is None else list(scopes)
+        models = [None] * n if models is None else list(models)
+        prompts = [None] * n if prompts is None else list(prompts)
+        now = time.time()
+        with self._lock:
+            ids = np.array([next(self.ids) for _ in range(n)], dtype=np.int64)
+            for id, response, scope, model, prompt in zip(ids, responses, scopes, models, prompts):
+                self.entries[int(id)] = {"response": response, "scope": scope, "model": model, "prompt": prompt, "created": now}
+            for scope in set(scopes):
+                idxs = [i for i, s in enumerate(scopes) if s == scope]
+                self.index(scope, vectors.shape[1]).add_with_ids(vectors[idxs], ids[idxs])
+            if self.max_entries is not None and len(self.entries) > self.max_entries:
+                # least recently hit entries go first
+                overflow = list(itertools.islice(self.entries, len(self.entries) - self.max_entries))
+                self.remove(overflow)
+                self.evictions += len(overflow)
+
+    def remove(self, ids: list):
+        with self._lock:
+            by_scope = {}
+            for id in ids:
+                entry = self.entries.pop(id, None)
+                if entry is not None:
+                    by_scope.setdefault(entry["scope"], []).append(id)
+            for scope, scope_ids in by_scope.items():
+                self.indices[scope].remove_ids(np.array(scope_ids, dtype=np.int64))
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.indices.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self),
+            "scopes": len(self.indices),
+        }
+
+class SemanticCacheRouter(NamedRouter):
+    # scope="router" answers near-duplicates before routing, scope="model" routes first and only reuses the selected model's answers
+    def __init__(
+            self,
+            router: NamedRouter,
+            cache: SemanticCache = None,
+            embedder: Union[Embedder, Callable] = None,
+            scope: str = "router",
+            name: str = None,
+            description: str = None,
+            **kwargs
+        ):
+        if scope not in ("router", "model"):
+            raise ValueError(f"Scope must be 'router' or 'model', got {scope}.")
+        if embedder is None and getattr(router, "embedder", None) is None:
+            raise ValueError(f"Router {router} has no embedder, pass one explicitly.")
+        self.router = router
+        self.cache = SemanticCache(**kwargs) if cache is None else cache
+        self.embedder = router.embedder if embedder is None else as_embedder(embedder)
+        self.scope = scope
+        # a router using the same embedder routes from the cache's vectors instead of embedding each miss again
+        self.share_embeddings = router.accepts_embeddings and self.embedder is getattr(router, "embedder", None)
+        NamedRouter.__init__(self, router.models, name=name if name is not None else f"SemanticCacheRouter({router.name})", description=description)
+
+    def route(self, *args, **kwargs):
+        return self.router.route(*args, **kwargs)
+
+    def route_batch(self, inputs: list, **kwargs) -> list:
+        return self.router.route_batch(inputs, **kwargs)
+
+    def route_kwargs(self, vectors: np.ndarray) -> dict:
+        return {"embeddings": vectors} if self.share_embeddings else {}
+
+    def scope_of(self, selection):
+        return str(selection) if self.scope == "model" else None
+
+    def hit(self, response, info: dict, return_metadata: bool):
+        if return_metadata:
+            return response, {"semantic_cache": info}
+        return response
+
+    def run(self, input, return_metadata: bool = False, metadata_only: bool = False, **kwargs):
+        if metadata_only:
+            return self.router.run(input, metadata_only=True, **kwargs)
+        vector = self.embedder([input])[0]
+        if self.scope == "router":
+            response, info = self.cache.lookup(vector)
+            if response is not MISSING:
+                return self.hit(response, info, return_metadata)
+        with METRICS.span("route", self.router):
+            selection, metadata = self.router.split_selection(self.router.route(input, **self.route_kwargs(vector[None]), **kwargs))
+        if not self.router.has_model(selection):
+            raise ValueError(f"Selection {selection} not in models.")
+        if self.scope == "model":
+            response, info = self.cache.lookup(vector, self.scope_of(selection))
+            if response is not MISSING:
+                return (response, {**metadata, "semantic_cache": info}) if return_metadata else response
+        with METRICS.span("execute", self.router):
+            output = self.router.dispatch(selection, metadata, (input,))
+        self.cache.add(vector, output, self.scope_of(selection), model=str(selection), prompt=input)
+        metadata["semantic_cache"] = info
+        if return_metadata:
+            return output, metadata
+        return output
+
+    async def arun(self, input, return_metadata: bool = False, metadata_only: bool = False, **kwargs):
+        if metadata_only:
+            return await self.router.arun(input, metadata_only=True, **kwargs)
+        vector = (await acall(self.embedder, [input]))[0]
+        if self.scope == "router":
+            response, info = self.cache.lookup(vector)
+            if response is not MISSING:
+                return self.hit(response, info, return_metadata)
+        with METRICS.span("route", self.router):
+            selection, metadata = self.router.split_selection(await self.router.aroute(input, **self.route_kwargs(vector[None]), **kwargs))
+        if not self.router.has_model(selection):
+            raise ValueError(f"Selection {selection} not in models.")
+        if self.scope == "model":
+            response, info = self.cache.lookup(vector, self.scope_of(selection))
+            if response is not MISSING:
+                return (response, {**metadata, "semantic_cache": info}) if return_metadata else response
+        with METRICS.span("execute", self.router):
+            output = await self.router.adispatch(selection, metadata, (input,))
+        self.cache.add(vector, output, self.scope_of(selection), model=str(selection), prompt=input)
+        metadata["semantic_cache"] = info
+        if return_metadata:
+            return output, metadata
+        return output
+
+    def run_batch(self, inputs: list, return_metadata: bool = False, metadata_only: bool = False, executor: Union[Executor, str] = None, **kwargs):
+        if metadata_only:
+            return self.router.run_batch(inputs, metadata_only=True, **kwargs)
+        inputs = list(inputs)
+        vectors = self.embedder(inputs)
+        outputs, metadatas, infos = [None] * len(inputs), [None] * len(inputs), [None] * len(inputs)
+        pending = list(range(len(inputs)))
+        if self.scope == "router":
+            pending = []
+            for i, (response, info) in enumerate(self.cache.lookup_batch(vectors)):
+                if response is MISSING:
+                    pending.append(i)
+                    infos[i] = info
+                else:
+                    outputs[i], metadatas[i] = response, {"semantic_cache": info}
+        if len(pending) > 0:
+            with METRICS.span("route", self.router):
+                selections = [self.router.split_selection(selection) for selection in self.router.route_batch([inputs[i] for i in pending], **self.route_kwargs(vectors[pending]), **kwargs)]
+            if self.scope == "model":
+                lookups = self.cache.lookup_batch(vectors[pending], [self.scope_of(selection) for selection, _ in selections])
+            else:
+                lookups = [(MISSING, infos[i]) for i in pending]
+            misses = []
+            for i, (selection, metadata), (response, info) in zip(pending, selections, lookups):
+                if not self.router.has_model(selection):
+                    raise ValueError(f"Selection {selection} not in models.")
+                metadata["semantic_cache"] = info
+                metadatas[i] = metadata
+                if response is MISSING:
+                    misses.append((i, selection, metadata))
+                else:
+                    outputs[i] = response
+            if len(misses) > 0:
+                miss_outputs = self.router.execute_selections([inputs[i] for i, _, _ in misses], [(selection, metadata) for _, selection, metadata in misses], executor=executor)
+                for (i, _, _), output in zip(misses, miss_outputs):
+                    outputs[i] = output
+                self.cache.add_batch(
+                    vectors[[i for i, _, _ in misses]],
+                    miss_outputs,
+                    [self.scope_of(selection) for _, selection, _ in misses],
+                    [str(selection) for _, selection, _ in misses],
+                    [inputs[i] for i, _, _ in misses],
+                )
+        if return_metadata:
+            return outputs, metadatas
+        return outputs
@@ -0,0 +1,233 @@
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Union
+from magic_carpet.models.model import NamedModel
+from magic_carpet.routers.router import NamedRouter
+
+def serve_worker(router_type: type, path: str, model_names: list[str], embedder, load_kwargs: dict, requests, responses, worker_id: int):
+    # worker models are name-only placeholders, the parent process executes the real ones
+    try:
+        router = router_type.load(path, [NamedModel(name=name) for name in model_names], embedder=embedder, mmap=True, **load_kwargs)
+    except BaseException as e:
+        responses.put((None, worker_id, False, e))
+        return
+    responses.put((None, worker_id, True, os.getpid()))
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+        request_id, inputs, kwargs = message
+        try:
+            selections = [router.split_selection(selection) for selection in router.route_batch(inputs, **kwargs)]
+            responses.put((request_id, worker_id, True, [(str(selection), metadata) for selection, metadata in selections]))
+        except BaseException as e:
+            responses.put((request_id, worker_id, False, e))
+
+class RouterPool:
+    # worker processes that attach read-only to a saved router's memory-mapped index and arrays. Each worker has its own
+    # request queue, so a worker that dies fails only the requests it was given and is started again in its place
+    check_interval = 1.0
+
+    def __init__(
+            self,
+            path: str,
+            router_type: type,
+            embedder: Callable = None,
+            num_workers: int = None,
+            models: list[str] = None,
+            context: Union[str, multiprocessing.context.BaseContext] = None,
+            load_kwargs: dict = None,
+            cleanup: bool = False,
+            startup_timeout: float = 60.0,
+            **kwargs
+        ):
+        if models is None:
+            with open(os.path.join(path, "router.json"), 'r') as f:
+                models = json.load(f)["model_cols"]
+        self.path = path
+        self.router_type = router_type
+        self.num_workers = os.cpu_count() if num_workers is None else num_workers
+        if self.num_workers < 1:
+            raise ValueError(f"num_workers must be at least 1, got {self.num_workers}.")
+        self.cleanup = cleanup
+        self.context = multiprocessing.get_context(context) if context is None or isinstance(context, str) else context
+        self.worker_args = (router_type, path, list(models), embedder, load_kwargs or {})
+        self.responses = self.context.Queue()
+        self.queues, self.workers = {}, {}
+        self.pending = {}
+        self.assigned = {}
+        self.pids = {}
+        self.restarts = 0
+        self.closing = False
+        self.ids = itertools.count()
+        # every started process gets a fresh id, so messages from a replaced worker can never be mistaken for its successor's
+        self.worker_ids = itertools.count()
+        self._lock = threading.Lock()
+        for _ in range(self.num_workers):
+            self.start_worker()
+        deadline = time.monotonic() + startup_timeout
+        for _ in range(self.num_workers):
+            try:
+                _, worker_id, ok, payload = self.responses.get(timeout=max(deadline - time.monotonic(), 0.0))
+            except queue.Empty:
+                self.terminate()
+                dead = [i for i, worker in self.workers.items() if worker.exitcode is not None]
+                raise TimeoutError(f"Router workers did not start within {startup_timeout}s (exited: {dead}).")
+            if not ok:
+                self.terminate()
+                raise payload
+            self.pids[worker_id] = payload
+        self._collector = threading.Thread(target=self.collect, daemon=True)
+        self._collector.start()
+
+    def start_worker(self):
+        worker_id = next(self.worker_ids)
+        requests = self.context.Queue()
+        worker = self.context.Process(target=serve_worker, args=(*self.worker_args, requests, self.responses, worker_id), daemon=True)
+        worker.start()
+        with self._lock:
+            self.queues[worker_id], self.workers[worker_id] = requests, worker
+            self.assigned[worker_id] = set()
+
+    @classmethod
+    def from_router(cls, router: NamedRouter, path: str = None, **kwargs) -> "RouterPool":
+        # builds once in this process, then every worker maps the same files
+        cleanup = path is None
+        path = tempfile.mkdtemp(prefix="magic_carpet_router_") if path is None else path
+        router.save(path)
+        return cls(path, type(router), embedder=router.embedder, cleanup=cleanup, **kwargs)
+
+    def collect(self):
+        next_check = time.monotonic() + self.check_interval
+        while True:
+            try:
+                message = self.responses.get(timeout=self.check_interval)
+            except queue.Empty:
+                message = None
+            # workers are checked on a timer, not only when idle, so a death is noticed while others keep responding
+            if time.monotonic() >= next_check:
+                self.check_workers()
+                next_check = time.monotonic() + self.check_interval
+            if message is None:
+                continue
+            request_id, worker_id, ok, payload = message
+            if worker_id is None:
+                break
+            if request_id is None:
+                self.worker_started(worker_id, ok, payload)
+                continue
+            with self._lock:
+                future = self.pending.pop(request_id, None)
+                self.assigned.get(worker_id, set()).discard(request_id)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(payload)
+            else:
+                future.set_exception(payload)
+
+    def worker_started(self, worker_id: int, ok: bool, payload):
+        if ok:
+            with self._lock:
+                if worker_id in self.workers:
+                    self.pids[worker_id] = payload
+            return
+        self.drop_worker(worker_id, payload)
+
+    def check_workers(self):
+        if self.closing:
+            return
+        for worker_id, worker in list(self.workers.items()):
+            if worker.exitcode is None:
+                continue
+            # only a worker that had loaded the router is replaced, one that failed to load would fail again. The
+            # replacement starts first so that new requests always have a worker to go to
+            if worker_id in self.pids:
+                self.start_worker()
+                self.restarts += 1
+            self.drop_worker(worker_id, RuntimeError(f"Router worker {worker_id} exited with code {worker.exitcode} before serving the request."))
+
+    def drop_worker(self, worker_id: int, error: BaseException):
+        with self._lock:
+            self.workers.pop(worker_id, None)
+            self.queues.pop(worker_id, None)
+            self.pids.pop(worker_id, None)
+            futures = [self.pending.pop(request_id, None) for request_id in self.assigned.pop(worker_id, set())]
+        for future in futures:
+            if future is not None:
+                future.set_exception(error)
+
+    def submit(self, inputs: list, **kwargs) -> Future:
+        # requests go to the worker with the fewest outstanding ones
+        future = Future()
+        request_id = next(self.ids)
+        with self._lock:
+            if len(self.workers) == 0:
+                raise RuntimeError("RouterPool has no running workers.")
+            worker_id = min(self.assigned, key=lambda worker_id: len(self.assigned[worker_id]))
+            self.pending[request_id] = future
+            self.assigned[worker_id].add(request_id)
+            requests = self.queues[worker_id]
+        requests.put((request_id, list(inputs), kwargs))
+        return future
+
+    def route_batch(self, inputs: list, **kwargs) -> list:
+        # large batches are split so that every worker routes a share of them
+        inputs = list(inputs)
+        size = max(-(-len(inputs) // max(len(self.workers), 1)), 1)
+        futures = [self.submit(inputs[start:start + size], **kwargs) for start in range(0, len(inputs), size)]
+        return [selection for future in futures for selection in future.result()]
+
+    def route(self, input, **kwargs):
+        return self.route_batch([input], **kwargs)[0]
+
+    def terminate(self):
+        self.closing = True
+        for worker in list(self.workers.values()):
+            worker.terminate()
+
+    def close(self, timeout: float = 5.0):
+        self.closing = True
+        for requests in list(self.queues.values()):
+            requests.put(None)
+        for worker in list(self.workers.values()):
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+        self.responses.put((None, None, None, None))
+        self._collector.join(timeout)
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        for future in pending.values():
+            future.set_exception(RuntimeError("RouterPool was closed before the request was served."))
+        if self.cleanup:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ServedRouter(NamedRouter):
+    # routes through a RouterPool's worker processes and executes the selected model in this process
+    def __init__(self, models, pool: RouterPool, **kwargs):
+        super().__init__(models, **kwargs)
+        self.pool = pool
+
+    def route(self, input, **kwargs):
+        return self.route_batch([input], **kwargs)[0]
+
+    def route_batch(self, inputs: list, **kwargs):
+        return [(self[name], metadata) for name, metadata in self.pool.route_batch(inputs, **kwargs)]
+
+    def candidates(self, selection, metadata: dict) -> list:
+        return self.pool.router_type.candidates(self, selection, metadata)
@@ -0,0 +1,74 @@
+import os
+from typing import Iterator, Union
+from magic_carpet.common.imports import require
+
+np = require("numpy", "nn")
+
+class TrainingStore:
+    # read-only access to router training data as (prompts, scores) chunks, scores having one column per model in model_cols
+    def __init__(self, input_col: str = "prompt", model_cols: list[str] = None, **kwargs):
+        self.input_col = input_col
+        self.model_cols = model_cols
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def chunks(self, chunk_size: int = 8192) -> Iterator[tuple[list[str], np.ndarray]]:
+        raise NotImplementedError
+
+class FrameStore(TrainingStore):
+    # slices the caller's DataFrame chunk by chunk, so it is never mutated and never copied whole
+    def __init__(self, frame, input_col: str = "prompt", model_cols: list[str] = None, **kwargs):
+        TrainingStore.__init__(self, input_col, [col for col in frame.columns if col != input_col] if model_cols is None else model_cols)
+        self.frame = frame
+
+    def __len__(self):
+        return len(self.frame)
+
+    def chunks(self, chunk_size: int = 8192):
+        for start in range(0, len(self.frame), chunk_size):
+            chunk = self.frame.iloc[start:start + chunk_size]
+            yield chunk[self.input_col].tolist(), chunk[self.model_cols].to_numpy(dtype=np.float64)
+
+class ParquetStore(TrainingStore):
+    # streams record batches of only the prompt and model columns
+    def __init__(self, path: str, input_col: str = "prompt", model_cols: list[str] = None, **kwargs):
+        self.file = require("pyarrow.parquet", "parquet").ParquetFile(path)
+        names = self.file.schema_arrow.names
+        TrainingStore.__init__(self, input_col, [col for col in names if col != input_col] if model_cols is None else model_cols)
+        self.path = path
+
+    def __len__(self):
+        return self.file.metadata.num_rows
+
+    def chunks(self, chunk_size: int = 8192):
+        for batch in self.file.iter_batches(batch_size=chunk_size, columns=[self.input_col, *self.model_cols]):
+            scores = np.stack([batch.column(col).to_numpy(zero_copy_only=False) for col in self.model_cols], axis=1).astype(np.float64)
+            yield batch.column(self.input_col).to_pylist(), scores
+
+class NumpyStore(TrainingStore):
+    # prompts and an (N, models) score matrix, given as arrays or .npy paths that are memory-mapped
+    def __init__(self, prompts: Union[str, np.ndarray], scores: Union[str, np.ndarray], model_cols: list[str], **kwargs):
+        TrainingStore.__init__(self, None, list(model_cols))
+        self.prompts = np.load(prompts, mmap_mode="r") if isinstance(prompts, (str, os.PathLike)) else prompts
+        self.scores = np.load(scores, mmap_mode="r") if isinstance(scores, (str, os.PathLike)) else scores
+        if self.scores.shape != (len(self.prompts), len(self.model_cols)):
+            raise ValueError(f"Scores have shape {self.scores.shape}, expected {(len(self.prompts), len(self.model_cols))}.")
+
+    def __len__(self):
+        return len(self.prompts)
+
+    def chunks(self, chunk_size: int = 8192):
+        for start in range(0, len(self.prompts), chunk_size):
+            yield [str(prompt) for prompt in self.prompts[start:start + chunk_size]], np.asarray(self.scores[start:start + chunk_size], dtype=np.float64)
+
+def as_store(data, input_col: str = "prompt", model_cols: list[str] = None) -> TrainingStore:
+    if isinstance(data, TrainingStore):
+        return data
+    if isinstance(data, (str, os.PathLike)):
+        if str(data).endswith(".parquet"):
+            return ParquetStore(data, input_col=input_col, model_cols=model_cols)
+        raise ValueError(f"Cannot read training data from {data}, expected a .parquet file.")
+    if hasattr(data, "columns"):
+        return FrameStore(data, input_col=input_col, model_cols=model_cols)
+    raise ValueError(f"Cannot use {type(data)} as training data, expected a DataFrame, a .parquet path or a TrainingStore.")
@@ -1,65 +1,305 @@
 from collections import defaultdict
-from typing import Callable, Tuple, Union
-import numpy as np
+from typing import Callable, Iterable, Iterator, Tuple, Union
+import json
 
+from magic_carpet.common.executor import AsyncioExecutor, Call, Executor, get_executor
 from magic_carpet.evaluators.eval_containers import KeyedEvalContainer, EvalList
 from magic_carpet.evaluators.evaluator import Evaluator
+from magic_carpet.models.batched_model import BatchedModel
 from magic_carpet.models.model import Model
 from magic_carpet.models.model_containers import KeyedModelContainer, ModelList
 
-def generate(requests: list[dict], model_container: KeyedModelContainer, eval_container: KeyedEvalContainer, batch_generation: bool = False):
-    for req in requests:
-        if not isinstance(req, dict):
-            raise TypeError(f"Request {req} is not a dict.")
-        
-        if not "models" in req:
-            raise ValueError(f"Request {req} does not contain a model.")
-        for model_id in req["models"]:
-            if not (model_id in model_container):
-                raise ValueError(f"Request {req} contains a model {model_id} not found in model_container.")
-        
-        if not "inputs" in req:
-            raise ValueError(f"Request {req} does not contain inputs.")
-        if not isinstance(req["inputs"], list):
-            raise TypeError(f"Request {req} must have a list of inputs.")
-        if len(req["inputs"]) > 0 and (not isinstance(req["inputs"][0], str)):
-            raise TypeError(f"Request {req} must have a list of strings as inputs.")
-        
-        if not "evaluators" in req:
-            req["evaluators"] = []
+def validate_request(req: dict, model_container: KeyedModelContainer, eval_container: KeyedEvalContainer):
+    if not isinstance(req, dict):
+        raise TypeError(f"Request {req} is not a dict.")
+    
+    if not "models" in req:
+        raise ValueError(f"Request {req} does not contain a model.")
+    for model_id in req["models"]:
+        if not (model_id in model_container):
+            raise ValueError(f"Request {req} contains a model {model_id} not found in model_container.")
+    
+    if not "inputs" in req:
+        raise ValueError(f"Request {req} does not contain inputs.")
+    if not isinstance(req["inputs"], list):
+        raise TypeError(f"Request {req} must have a list of inputs.")
+    if len(req["inputs"]) > 0 and (not isinstance(req["inputs"][0], str)):
+        raise TypeError(f"Request {req} must have a list of strings as inputs.")
+    
+    if not "evaluators" in req:
+        req["evaluators"] = []
+    for eval_id in req["evaluators"]:
+        if not (eval_id in eval_container):
+            raise ValueError(f"Request {req} contains an evaluator {eval_id} not found in eval_container.")
+
+def model_pairs(req: dict) -> list[tuple]:
+    return [(model_id, input) for input in req["inputs"] for model_id in req["models"]]
+
+def unique_items(items: list, key: Callable = None, deduplicate: bool = True) -> Tuple[list, list[int]]:
+    # keeps the first occurrence of each key; slots[i] is the position of items[i] among the unique items
+    unique, index, slots = [], {}, []
+    for item in items:
+        k = (key(item) if key is not None else item) if deduplicate else len(unique)
+        if k not in index:
+            index[k] = len(unique)
+            unique.append(item)
+        slots.append(index[k])
+    return unique, slots
+
+def model_calls(pairs: list[tuple], model_container: KeyedModelContainer, batch_generation: bool = False, asynchronous: bool = False) -> Tuple[list[Call], list]:
+    # with batch_generation each model gets one call covering all of its inputs across requests
+    function = (lambda model_id: model_container[model_id].arun) if asynchronous else (lambda model_id: model_container[model_id])
+    if not batch_generation:
+        return [Call(function(model_id), (input,), key=model_id) for model_id, input in pairs], list(range(len(pairs)))
+    batches = defaultdict(list)
+    for i, (model_id, _) in enumerate(pairs):
+        batches[model_id].append(i)
+    calls, plan = [], []
+    for model_id, idxs in batches.items():
+        model = model_container[model_id]
+        calls.append(Call(model.map if isinstance(model, BatchedModel) else function(model_id), ([pairs[i][1] for i in idxs],), key=model_id))
+        plan.append(idxs)
+    return calls, plan
+
+def collect_responses(req: dict, responses: list, deduplicate: bool = True) -> list[tuple]:
+    # one (input, {model_id: response}) entry per input position, so repeated inputs keep all of their samples;
+    # when calls are deduplicated the repeats got the same responses and share the first entry
+    responses = iter(responses)
+    entries, seen = [], set()
+    for input in req["inputs"]:
+        model_responses = {model_id: next(responses) for model_id in req["models"]}
+        if deduplicate:
+            if input in seen:
+                continue
+            seen.add(input)
+        entries.append((input, model_responses))
+    return entries
+
+def eval_triples(req: dict, entries: list[tuple]) -> list[tuple]:
+    return [
+        (eval_id, input, responses[model_id])
+        for input, responses in entries
+        for model_id in responses
+        for eval_id in req["evaluators"]
+    ]
+
+def score_calls(triples: list[tuple], eval_container: KeyedEvalContainer, asynchronous: bool = False) -> Tuple[list[Call], list]:
+    # batch-capable evaluators get one evaluate_batch call covering all of their (input, response) pairs
+    calls, plan, batches = [], [], defaultdict(list)
+    for i, (eval_id, input, response) in enumerate(triples):
+        evaluator = eval_container[eval_id]
+        if evaluator.batched:
+            batches[eval_id].append(i)
+        else:
+            calls.append(Call(evaluator.aevaluate if asynchronous else evaluator, (input, response), key=eval_id))
+            plan.append(i)
+    for eval_id, idxs in batches.items():
+        calls.append(Call(eval_container[eval_id].evaluate_batch, ([triples[i][1] for i in idxs], [triples[i][2] for i in idxs]), key=eval_id))
+        plan.append(idxs)
+    return calls, plan
+
+def triple_key(triple: tuple):
+    # unhashable responses only match themselves, which still covers a response shared by several requests
+    eval_id, input, response = triple
+    try:
+        hash(response)
+    except TypeError:
+        return (eval_id, input, id(response))
+    return triple
+
+def scatter_results(plan: list, results: list, n: int) -> list:
+    scattered = [None] * n
+    for target, result in zip(plan, results):
+        if isinstance(target, list):
+            result = list(result)
+            if len(result) != len(target):
+                raise ValueError(f"Batch call returned {len(result)} results for {len(target)} items.")
+            for i, item in zip(target, result):
+                scattered[i] = item
+        else:
+            scattered[target] = result
+    return scattered
+
+def collect_generations(req: dict, entries: list[tuple], results: list, generations: dict = None) -> dict:
+    generations = defaultdict(list) if generations is None else generations
+    results = iter(results)
+    for input, responses in entries:
+        for model_id in responses:
+            scores = [{"name": str(eval_id), "score": next(results)} for eval_id in req["evaluators"]]
+            generations[input].append({
+                "model": str(model_id),
+                "response": responses[model_id],
+                "scores": scores
+            })
+    return generations
+
+def collect_columns(requests: list[dict], all_responses: list[list], all_scores: list[list], deduplicate: bool = True) -> dict:
+    # one row per input; without deduplication an input whose (input, model) cell is already taken gets another row
+    import numpy as np
+    inputs, rows, models, evaluators = [], {}, {}, {}
+    cells, idxs, values = {}, [], []
+    for req, entries, scores in zip(requests, all_responses, all_scores):
         for eval_id in req["evaluators"]:
-            if not (eval_id in eval_container):
-                raise ValueError(f"Request {req} contains an evaluator {eval_id} not found in eval_container.")
+            evaluators.setdefault(eval_id, len(evaluators))
+        scores = iter(scores)
+        for input, model_responses in entries:
+            for model_id in model_responses:
+                models.setdefault(model_id, len(models))
+            row = next((row for row in rows.get(input, []) if deduplicate or not any((row, models[model_id]) in cells for model_id in model_responses)), None)
+            if row is None:
+                row = len(inputs)
+                inputs.append(input)
+                rows.setdefault(input, []).append(row)
+            for model_id, response in model_responses.items():
+                cells[(row, models[model_id])] = response
+                for eval_id in req["evaluators"]:
+                    idxs.append((row, models[model_id], evaluators[eval_id]))
+                    values.append(next(scores))
+
+    responses = np.full((len(inputs), len(models)), None, dtype=object)
+    for (row, col), response in cells.items():
+        responses[row, col] = response
+
+    try:
+        values = np.asarray(values, dtype=np.float64)
+        scores = np.full((len(inputs), len(models), len(evaluators)), np.nan)
+    except (TypeError, ValueError):
+        values = np.asarray(values + [None], dtype=object)[:-1]
+        scores = np.full((len(inputs), len(models), len(evaluators)), None, dtype=object)
+    if len(idxs) > 0:
+        idxs = np.asarray(idxs)
+        scores[idxs[:, 0], idxs[:, 1], idxs[:, 2]] = values
+    return {
+        "inputs": inputs,
+        "models": [str(model_id) for model_id in models],
+        "evaluators": [str(eval_id) for eval_id in evaluators],
+        "responses": responses,
+        "scores": scores
+    }
+
+def columns_to_frame(columns: dict):
+    import numpy as np
+    import pandas as pd
+    num_inputs, num_models, num_evaluators = columns["scores"].shape
+    return pd.DataFrame({
+        "input": np.repeat(np.asarray(columns["inputs"], dtype=object), num_models * num_evaluators),
+        "model": np.tile(np.repeat(np.asarray(columns["models"], dtype=object), num_evaluators), num_inputs),
+        "evaluator": np.tile(np.asarray(columns["evaluators"], dtype=object), num_inputs * num_models),
+        "score": columns["scores"].reshape(-1)
+    }).dropna(subset=["score"]).reset_index(drop=True)
+
+def execute_requests(requests: list[dict], model_container: KeyedModelContainer, eval_container: KeyedEvalContainer, batch_generation: bool = False, executor: Executor = None, deduplicate: bool = True) -> Tuple[list[list], list[list]]:
+    # all requests are compiled into one plan of unique (model, input) calls and then one of unique (evaluator, input,
+    # response) calls; each plan runs once and its results are fanned back out to every request that asked for them
+    executor = get_executor(executor)
+    pairs = [model_pairs(req) for req in requests]
+    unique, slots = unique_items([pair for req_pairs in pairs for pair in req_pairs], deduplicate=deduplicate)
+    calls, plan = model_calls(unique, model_container, batch_generation)
+    results = scatter_results(plan, executor.map(calls), len(unique))
+    slots = iter(slots)
+    all_responses = [collect_responses(req, [results[next(slots)] for _ in req_pairs], deduplicate=deduplicate) for req, req_pairs in zip(requests, pairs)]
 
+    triples = [eval_triples(req, entries) for req, entries in zip(requests, all_responses)]
+    unique, slots = unique_items([triple for req_triples in triples for triple in req_triples], key=triple_key, deduplicate=deduplicate)
+    calls, plan = score_calls(unique, eval_container)
+    scores = scatter_results(plan, executor.map(calls), len(unique))
+    slots = iter(slots)
+    return all_responses, [[scores[next(slots)] for _ in req_triples] for req_triples in triples]
+
+async def aexecute_requests(requests: list[dict], model_container: KeyedModelContainer, eval_container: KeyedEvalContainer, batch_generation: bool = False, executor: AsyncioExecutor = None, deduplicate: bool = True) -> Tuple[list[list], list[list]]:
+    executor = AsyncioExecutor() if executor is None else executor
+    pairs = [model_pairs(req) for req in requests]
+    unique, slots = unique_items([pair for req_pairs in pairs for pair in req_pairs], deduplicate=deduplicate)
+    calls, plan = model_calls(unique, model_container, batch_generation, asynchronous=True)
+    results = scatter_results(plan, await executor.amap(calls), len(unique))
+    slots = iter(slots)
+    all_responses = [collect_responses(req, [results[next(slots)] for _ in req_pairs], deduplicate=deduplicate) for req, req_pairs in zip(requests, pairs)]
+
+    triples = [eval_triples(req, entries) for req, entries in zip(requests, all_responses)]
+    unique, slots = unique_items([triple for req_triples in triples for triple in req_triples], key=triple_key, deduplicate=deduplicate)
+    calls, plan = score_calls(unique, eval_container, asynchronous=True)
+    scores = scatter_results(plan, await executor.amap(calls), len(unique))
+    slots = iter(slots)
+    return all_responses, [[scores[next(slots)] for _ in req_triples] for req_triples in triples]
+
+def run_requests(requests: list[dict], model_container: KeyedModelContainer, eval_container: KeyedEvalContainer, batch_generation: bool = False, executor: Executor = None, generations: dict = None, deduplicate: bool = True) -> dict:
+    all_responses, all_scores = execute_requests(requests, model_container, eval_container, batch_generation=batch_generation, executor=executor, deduplicate=deduplicate)
+    generations = defaultdict(list) if generations is None else generations
+    for req, entries, scores in zip(requests, all_responses, all_scores):
+        collect_generations(req, entries, scores, generations)
+    return generations
+
+def generate(requests: list[dict], model_container: KeyedModelContainer, eval_container: KeyedEvalContainer, batch_generation: bool = False, executor: Union[Executor, str] = None, columnar: bool = False, deduplicate: bool = True):
+    for req in requests:
+        validate_request(req, model_container, eval_container)
+
+    all_responses, all_scores = execute_requests(requests, model_container, eval_container, batch_generation=batch_generation, executor=executor, deduplicate=deduplicate)
+    if columnar:
+        return collect_columns(requests, all_responses, all_scores, deduplicate=deduplicate)
     generations = defaultdict(list)
+    for req, entries, scores in zip(requests, all_responses, all_scores):
+        collect_generations(req, entries, scores, generations)
+    return [{"input": k, "generations": v} for k, v in generations.items()]
+
+async def agenerate(requests: list[dict], model_container: KeyedModelContainer, eval_container: KeyedEvalContainer, batch_generation: bool = False, executor: AsyncioExecutor = None, columnar: bool = False, deduplicate: bool = True):
     for req in requests:
-        inputs = req["inputs"]
-        if batch_generation:
-            responses = model_container(inputs, keys=req["models"])
-        else:
-            responses = defaultdict(list)
-            for input in inputs:
-                model_responses = model_container(input, keys=req["models"])
-                for model_id in model_responses:
-                    responses[model_id].append(model_responses[model_id])
-                    
-        responses_per_input = defaultdict(dict)
-        for model_id, responses in responses.items():
-            for input, response in zip(inputs, responses):
-                responses_per_input[input][model_id] = response
-        
-        for input, responses in responses_per_input.items():
-            for model_id in responses:
-                response = responses[model_id]
-                scores = [{"name": str(eval_id), "score": score} for eval_id, score in eval_container(input, response, keys=req["evaluators"]).items()]
-                generations[input].append({
-                    "model": str(model_id),
-                    "response": response,
-                    "scores": scores
-                })
+        validate_request(req, model_container, eval_container)
 
+    all_responses, all_scores = await aexecute_requests(requests, model_container, eval_container, batch_generation=batch_generation, executor=executor, deduplicate=deduplicate)
+    if columnar:
+        return collect_columns(requests, all_responses, all_scores, deduplicate=deduplicate)
+    generations = defaultdict(list)
+    for req, entries, scores in zip(requests, all_responses, all_scores):
+        collect_generations(req, entries, scores, generations)
     return [{"input": k, "generations": v} for k, v in generations.items()]
 
+def read_requests(file_path: str) -> Iterator[dict]:
+    with open(file_path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def window_requests(requests: Iterable[dict], window: int) -> Iterator[list[dict]]:
+    # requests larger than the window are split by inputs so that each window holds at most `window` inputs
+    chunk, size = [], 0
+    for req in requests:
+        inputs = req["inputs"]
+        start = 0
+        while start < len(inputs):
+            take = window - size
+            chunk.append({**req, "inputs": inputs[start:start + take]})
+            size += len(chunk[-1]["inputs"])
+            start += take
+            if size >= window:
+                yield chunk
+                chunk, size = [], 0
+    if chunk:
+        yield chunk
+
+def generate_stream(requests: Iterable[dict], model_container: KeyedModelContainer, eval_container: KeyedEvalContainer, batch_generation: bool = False, executor: Union[Executor, str] = None, window: int = 64, output_path: str = None, deduplicate: bool = True) -> Iterator[dict]:
+    if window < 1:
+        raise ValueError(f"Window must be at least 1, got {window}.")
+    executor = get_executor(executor)
+
+    def validated(requests):
+        for req in requests:
+            validate_request(req, model_container, eval_container)
+            yield req
+
+    output = open(output_path, 'w') if output_path is not None else None
+    try:
+        for chunk in window_requests(validated(requests), window):
+            generations = run_requests(chunk, model_container, eval_container, batch_generation=batch_generation, executor=executor, deduplicate=deduplicate)
+            for k, v in generations.items():
+                record = {"input": k, "generations": v}
+                if output is not None:
+                    output.write(json.dumps(record) + "\n")
+                    output.flush()
+                yield record
+    finally:
+        if output is not None:
+            output.close()
+
 def make_request(inputs: list[str], models: list[Union[Model, Callable]], evaluators: list[Union[Evaluator, Callable]] = [], model_container: KeyedModelContainer = None, eval_container: KeyedEvalContainer = None):
     if model_container is None:
         model_container = ModelList(models)
@@ -68,10 +308,10 @@ def make_request(inputs: list[str], models: list[Union[Model, Callable]], evalua
 
     for model in models:
         if not model_container.has(model):
-            model_container.add(model)
+            model_container.add_object(model)
     for evaluator in evaluators:
         if not eval_container.has(evaluator):
-            eval_container.add(evaluator)
+            eval_container.add_object(evaluator)
 
     request = {
         "models": [model_container.get_key(model) for model in models],
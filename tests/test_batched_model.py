@@ -0,0 +1,18 @@
+import pickle
+from magic_carpet.models import NamedBatchedModel
+from magic_carpet.utils import generate, make_requests
+
+def double(inputs):
+    return [input * 2 for input in inputs]
+
+def test_batched_model_round_trips_through_pickle():
+    model = NamedBatchedModel(name="double", function=double, max_batch_size=4)
+    copy = pickle.loads(pickle.dumps(model))
+    assert copy("ab") == "abab"
+    assert copy.map(["a", "b", "c", "d", "e"]) == ["aa", "bb", "cc", "dd", "ee"]
+    assert model("c") == "cc"
+
+def test_batched_model_runs_in_process_executor():
+    model = NamedBatchedModel(name="double", function=double)
+    generations = generate(*make_requests([(["a", "b"], [model], [])]), executor="process")
+    assert [record["generations"][0]["response"] for record in generations] == ["aa", "bb"]
@@ -0,0 +1,72 @@
+import time
+from collections import Counter
+from magic_carpet.common.cache import MISSING, ResponseCache
+from magic_carpet.models import CachedModel
+
+def disk_keys(cache: ResponseCache) -> list:
+    return sorted(row[0] for row in cache._db.execute("SELECT key FROM responses"))
+
+def test_memory_tier_is_lru():
+    cache = ResponseCache(max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING and cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+def test_disk_eviction_counts_memory_hits_as_uses(tmp_path):
+    cache = ResponseCache(path=str(tmp_path / "cache.db"), max_entries=10, max_disk_entries=3)
+    for key in "abc":
+        cache.set(key, key)
+        time.sleep(0.01)
+    # "a" is only ever read from memory, which still makes it the most recently used row on disk
+    assert cache.get("a") == "a" and cache.memory_hits == 1
+    cache.set("d", "d")
+    assert disk_keys(cache) == ["a", "c", "d"]
+    assert cache.stats()["evictions"] == 1
+    cache.close()
+
+def test_access_times_are_written_in_batches(tmp_path):
+    cache = ResponseCache(path=str(tmp_path / "cache.db"), max_entries=1, flush_every=3)
+    for key in "abc":
+        cache.set(key, key)
+    accessed = lambda: dict(cache._db.execute("SELECT key, accessed FROM responses").fetchall())
+    before = accessed()
+    time.sleep(0.01)
+    cache.get("a")
+    cache.get("b")
+    cache.get("a")
+    # hits on two keys are still pending, a hit on a third flushes all of them in one write
+    assert accessed() == before and len(cache._touched) == 2
+    cache.get("c")
+    assert len(cache._touched) == 0 and all(accessed()[key] > before[key] for key in "abc")
+    cache.close()
+
+def test_disk_entries_outlive_the_process_and_expire(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path=path, ttl=0.05)
+    cache.set("a", {"value": 1})
+    cache.close()
+    reopened = ResponseCache(path=path, ttl=0.05)
+    assert len(reopened) == 1 and reopened.get("a") == {"value": 1} and reopened.disk_hits == 1
+    time.sleep(0.06)
+    assert reopened.get("a") is MISSING and len(reopened) == 0
+    reopened.close()
+
+def counting_model(calls: Counter):
+    def echo(input):
+        calls[input] += 1
+        return input.upper()
+    return echo
+
+def test_cached_model_persists_responses(tmp_path):
+    calls = Counter()
+    path = str(tmp_path / "responses.db")
+    model = CachedModel(counting_model(calls), name="echo", path=path)
+    assert model("a") == "A" and model("a") == "A"
+    assert calls["a"] == 1 and model.cache.stats()["hits"] == 1
+    model.cache.close()
+    reloaded = CachedModel(counting_model(calls), name="echo", path=path)
+    assert reloaded("a") == "A" and calls["a"] == 1
+    reloaded.cache.close()
@@ -0,0 +1,27 @@
+import numpy as np
+from magic_carpet.common.cache import ResponseCache
+from magic_carpet.embedders import CachedEmbedder, Embedder
+
+class ConstantEmbedder(Embedder):
+    def __init__(self, value: float, d: int):
+        self.value = value
+        self.d = d
+        self._calls = 0
+
+    def embed(self, inputs: list[str], **kwargs):
+        self._calls += 1
+        return np.full((len(inputs), self.d), self.value, dtype=np.float32)
+
+def test_cached_embedder_reuses_vectors():
+    embedder = ConstantEmbedder(1.0, 4)
+    cached = CachedEmbedder(embedder)
+    cached(["a", "b"])
+    vectors = cached(["b", "a", "a"])
+    assert embedder._calls == 1 and vectors.shape == (3, 4)
+
+def test_embedders_sharing_a_cache_keep_separate_vectors(tmp_path):
+    cache = ResponseCache(path=str(tmp_path / "embeddings.db"))
+    small, large = CachedEmbedder(ConstantEmbedder(1.0, 4), cache=cache), CachedEmbedder(ConstantEmbedder(2.0, 8), cache=cache)
+    assert small(["a"]).shape == (1, 4)
+    assert large(["a"]).shape == (1, 8) and (large(["a"]) == 2.0).all()
+    assert small(["a"]).shape == (1, 4)
@@ -0,0 +1,99 @@
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+import pytest
+
+pytest.importorskip("requests")
+from magic_carpet.carpet_client import CarpetClient
+
+class StubServer:
+    # records every decoded upload; the first `failures` posts are answered with 503
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.uploads = []
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                with stub.lock:
+                    fail = stub.failures > 0
+                    stub.failures -= int(fail)
+                if not fail:
+                    if self.headers.get("Content-Encoding") == "gzip":
+                        body = gzip.decompress(body)
+                    with stub.lock:
+                        stub.uploads.append({"path": self.path, "encoding": self.headers.get("Content-Encoding"), "records": json.loads(body)})
+                self.send_response(503 if fail else 200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def params(self) -> list[dict]:
+        return [{k: v[0] for k, v in parse_qs(urlparse(upload["path"]).query).items()} for upload in self.uploads]
+
+@pytest.fixture
+def jsonl(tmp_path):
+    path = tmp_path / "generations.jsonl"
+    with open(path, "w") as f:
+        for i in range(1000):
+            f.write(json.dumps({"input": str(i), "generations": []}) + "\n")
+    return str(path)
+
+def test_jsonl_is_uploaded_in_gzip_chunks(jsonl):
+    stub = StubServer()
+    with CarpetClient(stub.url, "key") as client:
+        responses = client.load_generations(jsonl, "dataset", max_chunk_records=300)
+    stub.server.shutdown()
+    assert [response.status_code for response in responses] == [200] * 4
+    assert all(upload["encoding"] == "gzip" for upload in stub.uploads)
+    assert sorted(len(upload["records"]) for upload in stub.uploads) == [100, 300, 300, 300]
+    # chunks may arrive out of order, the indices and the total on the last one put them back together
+    by_chunk = {int(params["chunk"]): upload for params, upload in zip(stub.params(), stub.uploads)}
+    assert [params.get("chunks") for params in stub.params() if params["chunk"] == "3"] == ["4"]
+    assert [record["input"] for i in sorted(by_chunk) for record in by_chunk[i]["records"]] == [str(i) for i in range(1000)]
+
+def test_failed_chunks_are_retried(jsonl):
+    stub = StubServer(failures=2)
+    with CarpetClient(stub.url, "key", backoff=0.01) as client:
+        responses = client.upload_generations(jsonl, "dataset", max_chunk_records=500, max_concurrency=1)
+    stub.server.shutdown()
+    assert [response.status_code for response in responses] == [200, 200]
+    assert sum(len(upload["records"]) for upload in stub.uploads) == 1000
+
+def test_jsonl_path_objects_are_read_as_files(jsonl):
+    stub = StubServer()
+    with CarpetClient(stub.url, "key") as client:
+        responses = client.load_generations(Path(jsonl), "dataset", max_chunk_records=600)
+    stub.server.shutdown()
+    assert len(responses) == 2
+    assert sum(len(upload["records"]) for upload in stub.uploads) == 1000
+
+def test_records_are_chunked_by_size():
+    stub = StubServer()
+    with CarpetClient(stub.url, "key", compress=False) as client:
+        responses = client.upload_generations(({"input": i} for i in range(50)), "dataset", max_chunk_bytes=200)
+    stub.server.shutdown()
+    assert len(responses) == len(stub.uploads) > 1
+    assert all(upload["encoding"] is None for upload in stub.uploads)
+    assert sum(len(upload["records"]) for upload in stub.uploads) == 50
+
+def test_single_json_document_returns_one_response(tmp_path):
+    stub = StubServer()
+    path = tmp_path / "generations.json"
+    path.write_text(json.dumps([{"input": "a", "generations": []}]))
+    with CarpetClient(stub.url, "key") as client:
+        response = client.load_generations(str(path), "dataset")
+    stub.server.shutdown()
+    assert response.status_code == 200
+    assert stub.uploads[0]["records"] == [{"input": "a", "generations": []}]
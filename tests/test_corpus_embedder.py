@@ -0,0 +1,48 @@
+import json
+import os
+from functools import partial
+import numpy as np
+import pytest
+from magic_carpet.embedders import CachedEmbedder, CorpusEmbedder, Embedder, OpenAIEmbedder, openai_embedder
+from magic_carpet.embedders.embedder import embedder_fingerprint
+
+class CountingEmbedder(Embedder):
+    def __init__(self, d: int = 4):
+        self.d = d
+        # private, so the counter is not part of the embedder's fingerprint
+        self._calls = 0
+
+    def embed(self, inputs: list[str], **kwargs):
+        self._calls += 1
+        return np.array([[len(input)] * self.d for input in inputs], dtype=np.float32)
+
+def test_fingerprint_describes_nested_embedders_and_partials():
+    assert embedder_fingerprint(CachedEmbedder(OpenAIEmbedder("a"))) != embedder_fingerprint(CachedEmbedder(OpenAIEmbedder("b")))
+    assert embedder_fingerprint(Embedder(partial(openai_embedder, model="a"))) != embedder_fingerprint(Embedder(partial(openai_embedder, model="b")))
+    # credentials are not part of the configuration
+    assert embedder_fingerprint(OpenAIEmbedder("a", api_key="x")) == embedder_fingerprint(OpenAIEmbedder("a", api_key="y"))
+
+def test_resume_embeds_only_missing_and_changed_rows(tmp_path):
+    prompts = [f"prompt {i}" for i in range(10)]
+    embedder = CountingEmbedder()
+    first = CorpusEmbedder(embedder, str(tmp_path), chunk_size=4).embed([prompts], len(prompts))
+    assert embedder._calls == 3
+    prompts[5] = "an edited prompt"
+    second = CorpusEmbedder(embedder, str(tmp_path), chunk_size=4).embed([prompts], len(prompts))
+    assert embedder._calls == 4
+    assert second[5, 0] == len("an edited prompt") and np.array_equal(second[:5], first[:5])
+
+def test_resume_rejects_vectors_of_another_dimension(tmp_path):
+    prompts = [f"prompt {i}" for i in range(4)]
+    CorpusEmbedder(CountingEmbedder(4), str(tmp_path), chunk_size=2).embed([prompts], len(prompts))
+    # a corpus whose stored fingerprint matches but whose vectors do not, e.g. an embedder changed behind the same config
+    embedder = CountingEmbedder(8)
+    meta_path = os.path.join(str(tmp_path), "corpus.json")
+    with open(meta_path, 'r') as f:
+        meta = json.load(f)
+    meta["embedder"] = embedder_fingerprint(embedder)
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+    prompts[0] = "changed"
+    with pytest.raises(ValueError, match="dimensional"):
+        CorpusEmbedder(embedder, str(tmp_path), chunk_size=2, max_retries=0).embed([prompts], len(prompts))
@@ -0,0 +1,137 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+import pytest
+from magic_carpet.routers.execution import CircuitBreaker, CircuitOpenError, ExecutionPolicy
+
+class StubModels:
+    # models by name: a float sleeps that long before answering, an int fails that many times first, "error" always fails
+    def __init__(self, behaviours: dict, release: threading.Event = None):
+        self.behaviours = behaviours
+        self.calls = Counter()
+        self.release = release
+        self._lock = threading.Lock()
+
+    def behaviour(self, model):
+        with self._lock:
+            self.calls[model] += 1
+            calls = self.calls[model]
+        behaviour = self.behaviours[model]
+        if behaviour == "error":
+            raise ValueError(f"{model} failed")
+        if behaviour == "block":
+            self.release.wait(10)
+        elif isinstance(behaviour, int) and calls <= behaviour:
+            raise ValueError(f"{model} failed call {calls}")
+        return behaviour
+
+    def __call__(self, model):
+        behaviour = self.behaviour(model)
+        if isinstance(behaviour, float):
+            time.sleep(behaviour)
+        return model
+
+    async def acall(self, model):
+        behaviour = self.behaviour(model)
+        if isinstance(behaviour, float):
+            await asyncio.sleep(behaviour)
+        return model
+
+def statuses(metadata: dict) -> list:
+    return [(attempt["model"], attempt["status"]) for attempt in metadata["attempts"]]
+
+def test_slow_primary_is_hedged():
+    models = StubModels({"slow": 1.0, "fast": 0.0})
+    policy = ExecutionPolicy(hedge_delay=0.05)
+    started = time.monotonic()
+    output, metadata = policy.run(["slow", "fast"], models)
+    assert output == "fast" and metadata["hedged"]
+    assert time.monotonic() - started < 0.5
+    assert statuses(metadata) == [("fast", "ok"), ("slow", "cancelled")]
+
+def test_hedges_are_capped_by_max_hedges():
+    models = StubModels({"a": 0.5, "b": 0.5, "c": 0.5, "d": 0.0})
+    policy = ExecutionPolicy(hedge_delay=0.02, max_hedges=2)
+    output, metadata = policy.run(["a", "b", "c", "d"], models)
+    # a, then hedges to b and c; d is only reached by failover once those have answered
+    assert output in ("a", "b", "c") and metadata["hedged"]
+    assert models.calls["d"] == 0
+
+def test_timeout_fails_over_even_without_hedging():
+    models = StubModels({"slow": 1.0, "fast": 0.0})
+    policy = ExecutionPolicy(timeout={"slow": 0.05}, max_hedges=0)
+    output, metadata = policy.run(["slow", "fast"], models)
+    assert output == "fast" and not metadata["hedged"]
+    assert statuses(metadata) == [("slow", "timeout"), ("fast", "ok")]
+
+def test_errors_fail_over_with_max_hedges_zero():
+    models = StubModels({"broken": "error", "backup": 0.0})
+    output, metadata = ExecutionPolicy(max_hedges=0).run(["broken", "backup"], models)
+    assert output == "backup"
+    assert statuses(metadata) == [("broken", "error"), ("backup", "ok")]
+
+def test_failures_are_retried_with_backoff():
+    models = StubModels({"flaky": 2})
+    policy = ExecutionPolicy(retries=2, backoff=0.02, backoff_multiplier=2.0)
+    started = time.monotonic()
+    output, metadata = policy.run(["flaky"], models)
+    assert output == "flaky"
+    assert [attempt["attempt"] for attempt in metadata["attempts"]] == [1, 2, 3]
+    # jittered backoffs of at least half of 0.02 and 0.04
+    assert time.monotonic() - started >= 0.03
+
+def test_retries_are_bounded():
+    models = StubModels({"flaky": 5})
+    with pytest.raises(ValueError):
+        ExecutionPolicy(retries=1, backoff=0.0).run(["flaky"], models)
+    assert models.calls["flaky"] == 2
+
+def test_circuit_opens_then_lets_one_trial_through():
+    models = StubModels({"broken": "error", "backup": 0.0})
+    policy = ExecutionPolicy(failure_threshold=2, reset_timeout=0.2)
+    for _ in range(2):
+        policy.run(["broken", "backup"], models)
+    assert policy.breaker("broken").state == "open"
+    output, metadata = policy.run(["broken", "backup"], models)
+    assert output == "backup" and statuses(metadata)[0] == ("broken", "circuit_open")
+    assert models.calls["broken"] == 2
+    time.sleep(0.25)
+    assert policy.breaker("broken").state == "half_open"
+    # the trial fails, so the circuit opens again straight away
+    policy.run(["broken", "backup"], models)
+    assert models.calls["broken"] == 3 and policy.breaker("broken").state == "open"
+    with pytest.raises(CircuitOpenError):
+        policy.run(["broken"], models)
+
+def test_circuit_closes_after_a_successful_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow() and not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+def test_saturated_model_fails_over_immediately():
+    release = threading.Event()
+    models = StubModels({"hung": "block", "backup": 0.0}, release=release)
+    policy = ExecutionPolicy(timeout={"hung": 0.05}, max_workers=1)
+    try:
+        # the first request times out on the hung model, which keeps its only slot
+        assert policy.run(["hung", "backup"], models)[0] == "backup"
+        started = time.monotonic()
+        output, metadata = policy.run(["hung", "backup"], models)
+        assert output == "backup" and statuses(metadata)[0] == ("hung", "saturated")
+        assert time.monotonic() - started < 0.05
+        assert policy.stats()["hung"]["in_flight"] == 1
+    finally:
+        release.set()
+
+def test_async_run_hedges_and_fails_over():
+    models = StubModels({"slow": 1.0, "broken": "error", "fast": 0.0})
+    policy = ExecutionPolicy(hedge_delay=0.05)
+    output, metadata = asyncio.run(policy.arun(["slow", "fast"], models.acall))
+    assert output == "fast" and metadata["hedged"]
+    output, metadata = asyncio.run(ExecutionPolicy(max_hedges=0).arun(["broken", "fast"], models.acall))
+    assert statuses(metadata) == [("broken", "error"), ("fast", "ok")]
@@ -0,0 +1,38 @@
+import subprocess
+import sys
+import textwrap
+
+BLOCK_NUMPY = textwrap.dedent("""
+    import sys
+    class Block:
+        def find_spec(self, name, path=None, target=None):
+            if name.split(".")[0] == "numpy":
+                raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    sys.meta_path.insert(0, Block())
+""")
+
+def run_without_numpy(code: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, "-c", BLOCK_NUMPY + textwrap.dedent(code)], capture_output=True, text=True)
+
+def test_execution_policy_needs_no_numpy():
+    result = run_without_numpy("""
+        from magic_carpet.routers import ExecutionPolicy
+        from magic_carpet.routers.profiles import ModelProfile
+        profile = ModelProfile()
+        for latency in (1.0, 2.0, 3.0, 4.0, 10.0):
+            profile.observe(latency)
+        print(ExecutionPolicy.__name__, profile.latency(0.5))
+    """)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split() == ["ExecutionPolicy", "3.0"]
+
+def test_missing_numpy_names_the_extra():
+    result = run_without_numpy("""
+        import magic_carpet.routers as routers
+        for name in ("NNRouter", "ModelMapRouter"):
+            try:
+                getattr(routers, name)
+            except ImportError as e:
+                print(e)
+    """)
+    assert "magic-carpet[nn]" in result.stdout and "magic-carpet[map]" in result.stdout
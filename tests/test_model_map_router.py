@@ -0,0 +1,88 @@
+import numpy as np
+from magic_carpet.routers.model_map_router import ModelMapRouter
+
+def fitted_scorer(rng, d: int = 384, r: int = 8) -> ModelMapRouter:
+    # a router with hand-built model maps; "a" has its mean at its embedding so inputs can sit right on its map
+    router = ModelMapRouter.__new__(ModelMapRouter)
+    router.components = {model: np.linalg.qr(rng.normal(size=(d, r)))[0].T.astype(np.float32) for model in "ab"}
+    router.model_embeds = {model: rng.normal(size=d).astype(np.float32) for model in "ab"}
+    router.means = {"a": router.model_embeds["a"].copy(), "b": rng.normal(size=d).astype(np.float32)}
+    router.model_embed_info = {model: {"mean": 0.0, "std": 1.0} for model in "ab"}
+    router.build_scorer()
+    return router
+
+def direct_distances(router: ModelMapRouter, model: str, vectors: np.ndarray) -> np.ndarray:
+    components = router.components[model].astype(np.float64)
+    points = vectors.astype(np.float64)
+    residuals = router.model_embeds[model] - points + ((points - router.means[model]) @ components.T) @ components
+    return np.sqrt((residuals ** 2).sum(axis=1))
+
+def test_model_scores_match_direct_residuals():
+    rng = np.random.default_rng(0)
+    router = fitted_scorer(rng)
+    vectors = rng.normal(size=(32, 384)).astype(np.float32)
+    models, z_scores = router.model_scores(vectors)
+    for index, model in enumerate(models):
+        np.testing.assert_allclose(z_scores[:, index], direct_distances(router, model, vectors), rtol=1e-4)
+
+def test_model_scores_resolve_tiny_residuals():
+    rng = np.random.default_rng(0)
+    router = fitted_scorer(rng)
+    # inputs on model a's map, off it by ~1e-5, where the float32 expansion alone cancels to noise
+    components = router.components["a"]
+    vectors = (router.model_embeds["a"] + 3 * rng.normal(size=(16, 8)) @ components + 1e-6 * rng.normal(size=(16, 384))).astype(np.float32)
+    models, z_scores = router.model_scores(vectors)
+    np.testing.assert_allclose(z_scores[:, models.index("a")], direct_distances(router, "a", vectors), rtol=1e-3)
+
+def test_loaded_router_routes_inputs_on_a_model_map(tmp_path):
+    import pandas as pd
+    from magic_carpet.embedders import HashEmbedder
+    prompts = [f"question {i} about topic {i % 5}" for i in range(40)]
+    data = pd.DataFrame({"prompt": prompts, "A": [i % 2 for i in range(40)], "B": [(i + 1) % 2 for i in range(40)]})
+    models = [{"name": "A", "function": lambda x: "A"}, {"name": "B", "function": lambda x: "B"}]
+    router = ModelMapRouter(models, data=data, embedder=HashEmbedder(d=16), model_dim=12)
+    router.save(str(tmp_path))
+    loaded = ModelMapRouter.load(str(tmp_path), models, embedder=HashEmbedder(d=16))
+    # a model's mean sits within cancellation_tolerance of its map, so this takes the float64 path
+    vectors = np.stack([router.means["A"], router.means["B"]])
+    np.testing.assert_allclose(loaded.model_scores(vectors)[1], router.model_scores(vectors)[1], rtol=1e-5)
+    selections = loaded.route_batch(["x", "y"], embeddings=vectors)
+    assert [model.name for model, _ in selections] == [model.name for model, _ in router.route_batch(["x", "y"], embeddings=vectors)]
+
+def test_streamed_model_maps_match_an_in_memory_fit():
+    import pandas as pd
+    from magic_carpet.embedders import Embedder
+    rng = np.random.default_rng(1)
+    vectors = {}
+    class RandomEmbedder(Embedder):
+        def embed(self, inputs, **kwargs):
+            return np.stack([vectors.setdefault(input, rng.normal(size=32).astype(np.float32)) for input in inputs])
+    prompts = [f"prompt {i}" for i in range(3000)]
+    scores = rng.random((3000, 3))
+    data = pd.DataFrame({"prompt": prompts, "a": scores[:, 0], "b": scores[:, 1], "c": scores[:, 2]})
+    models = [{"name": name, "function": lambda x: x} for name in "abc"]
+    router = ModelMapRouter(models, data=data, embedder=RandomEmbedder(), model_dim=24, chunk_size=500)
+    # the reference fits each model's PCA from all of its rows at once
+    reference = ModelMapRouter.__new__(ModelMapRouter)
+    reference.model_dim, reference.pcas, reference.components, reference.means = 24, {}, {}, {}
+    reference.model_embeds, reference.model_embed_info, reference.model_stats = {}, {}, {}
+    best = np.array(list("abc"), dtype=object)[scores.argmin(axis=1)]
+    embedded = RandomEmbedder()(prompts)
+    for model in "abc":
+        reference.fit_model_map(model, embedded[best == model])
+    reference.build_scorer()
+    queries = RandomEmbedder()([f"query {i}" for i in range(200)])
+    np.testing.assert_allclose(router.model_scores(queries)[1], reference.model_scores(queries)[1], atol=1e-4)
+
+def test_sample_rows_is_bounded_and_uniform():
+    from magic_carpet.routers.model_map_router import sample_rows
+    counts = np.zeros(1000)
+    for seed in range(500):
+        rng, sample, seen = np.random.default_rng(seed), None, 0
+        for rows in np.array_split(np.arange(1000)[:, None], 7):
+            sample = sample_rows(sample, seen, rows, 100, rng)
+            seen += len(rows)
+        assert len(sample) == 100 and len(np.unique(sample)) == 100
+        counts[sample[:, 0]] += 1
+    # every row is kept with probability 100 / 1000
+    assert abs(counts[:500].mean() - 50) < 3 and abs(counts[500:].mean() - 50) < 3
@@ -0,0 +1,19 @@
+import warnings
+from magic_carpet.evaluators import NamedEvaluator
+from magic_carpet.models import NamedModel
+
+def echo(input):
+    return input
+
+def length(input, response):
+    return len(response)
+
+def test_named_model_and_evaluator_compare_with_other_types():
+    model, evaluator = NamedModel(name="echo", function=echo), NamedEvaluator(name="length", function=length)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert model != "echo" and not (model == "echo")
+        assert evaluator != "length" and not (evaluator == "length")
+    assert model == NamedModel(name="echo", function=echo)
+    assert evaluator == NamedEvaluator(name="length", function=length)
+    assert model != NamedModel(name="other", function=echo)
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("faiss")
+from magic_carpet.embedders import Embedder
+from magic_carpet.routers.nn_router import NNRouter
+
+class TableEmbedder(Embedder):
+    # a fixed random unit vector per prompt, so neighbours never tie
+    def __init__(self, d: int = 16):
+        self.d = d
+        self._vectors = {}
+
+    def embed(self, inputs: list[str], **kwargs):
+        rng = np.random.default_rng(len(self._vectors))
+        for input in inputs:
+            if input not in self._vectors:
+                vector = rng.normal(size=self.d)
+                self._vectors[input] = vector / np.linalg.norm(vector)
+        return np.stack([self._vectors[input] for input in inputs])
+
+MODELS = [{"name": name, "function": lambda x: x} for name in ("a", "b")]
+
+def frame(prompts: list[str], rng) -> pd.DataFrame:
+    scores = rng.random((len(prompts), 2))
+    return pd.DataFrame({"prompt": prompts, "a": scores[:, 0], "b": scores[:, 1]})
+
+def selections(router: NNRouter, inputs: list[str]) -> list:
+    return [(str(model), metadata["model_counts"]) for model, metadata in router.route_batch(inputs)]
+
+def test_updates_route_like_a_full_rebuild():
+    rng = np.random.default_rng(0)
+    embedder = TableEmbedder()
+    base, extra = frame([f"p{i}" for i in range(200)], rng), frame([f"q{i}" for i in range(60)], rng)
+    router = NNRouter(MODELS, data=base, embedder=embedder, k=5)
+    router.delta_size = 50
+    router.update(extra["prompt"][:30], extra[["a", "b"]][:30], wait=True)
+    # below delta_size the updates sit in a delta index next to the main one
+    assert len(router.shards) == 2 and router.shards[1].ntotal == 30
+    router.update(extra["prompt"][30:], extra[["a", "b"]][30:], wait=True)
+    assert len(router.shards) == 1 and router.index.ntotal == 260
+    rebuilt = NNRouter(MODELS, data=pd.concat([base, extra]), embedder=embedder, k=5)
+    queries = [f"query {i}" for i in range(40)]
+    assert selections(router, queries) == selections(rebuilt, queries)
+
+def test_save_and_load_keep_the_delta_index(tmp_path):
+    rng = np.random.default_rng(1)
+    embedder = TableEmbedder()
+    router = NNRouter(MODELS, data=frame([f"p{i}" for i in range(100)], rng), embedder=embedder, k=5)
+    extra = frame([f"q{i}" for i in range(10)], rng)
+    router.add_examples(extra["prompt"], extra[["a", "b"]])
+    router.save(str(tmp_path))
+    loaded = NNRouter.load(str(tmp_path), MODELS, embedder=embedder)
+    assert [shard.ntotal for shard in loaded.shards] == [100, 10]
+    queries = [f"query {i}" for i in range(20)]
+    assert selections(loaded, queries) == selections(router, queries)
+
+def test_memory_mapped_router_detaches_on_merge(tmp_path):
+    rng = np.random.default_rng(2)
+    embedder = TableEmbedder()
+    NNRouter(MODELS, data=frame([f"p{i}" for i in range(100)], rng), embedder=embedder, k=5).save(str(tmp_path))
+    loaded = NNRouter.load(str(tmp_path), MODELS, embedder=embedder, mmap=True)
+    loaded.delta_size = 5
+    extra = frame([f"q{i}" for i in range(5)], rng)
+    loaded.add_examples(extra["prompt"], extra[["a", "b"]])
+    assert loaded.index.ntotal == 105 and loaded.index_path is None
+    assert len(loaded.best_model_codes) == 105
+    # the saved files are untouched by the in-memory merge
+    assert NNRouter.load(str(tmp_path), MODELS, embedder=embedder).index.ntotal == 100
@@ -0,0 +1,80 @@
+import asyncio
+from collections import Counter
+import numpy as np
+import pytest
+from magic_carpet.common.cache import MISSING
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("faiss")
+from magic_carpet.embedders import Embedder, HashEmbedder
+from magic_carpet.routers.nn_router import NNRouter
+from magic_carpet.routers.semantic_cache import SemanticCache, SemanticCacheRouter
+
+class CountingEmbedder(Embedder):
+    def __init__(self):
+        self.embedder = HashEmbedder(d=64)
+        self._inputs = 0
+
+    def embed(self, inputs: list[str], **kwargs):
+        self._inputs += len(inputs)
+        return self.embedder.embed(inputs)
+
+def build(calls: Counter, **kwargs) -> tuple[SemanticCacheRouter, CountingEmbedder]:
+    def model(name):
+        def run(input):
+            calls[name] += 1
+            return f"{name}: {input}"
+        return {"name": name, "function": run}
+    prompts = [f"math question {i}" for i in range(10)] + [f"poem request {i}" for i in range(10)]
+    data = pd.DataFrame({"prompt": prompts, "math": [0] * 10 + [1] * 10, "poet": [1] * 10 + [0] * 10})
+    embedder = CountingEmbedder()
+    router = NNRouter([model("math"), model("poet")], data=data, embedder=embedder, k=3)
+    embedder._inputs = 0
+    return SemanticCacheRouter(router, **kwargs), embedder
+
+def test_repeated_prompts_are_answered_from_the_cache():
+    calls = Counter()
+    cached, embedder = build(calls, threshold=0.99)
+    first, metadata = cached("math question 3", return_metadata=True)
+    assert not metadata["semantic_cache"]["hit"]
+    second, metadata = cached("math question 3", return_metadata=True)
+    assert second == first and metadata["semantic_cache"]["hit"] and metadata["semantic_cache"]["model"] == "math"
+    assert calls["math"] == 1
+    # the miss was routed from the cache's vector, so each call embedded its input once
+    assert embedder._inputs == 2
+    assert cached.cache.stats()["hits"] == 1 and cached.cache.stats()["misses"] == 1
+
+def test_batches_embed_each_input_once():
+    calls = Counter()
+    cached, embedder = build(calls, threshold=0.99)
+    inputs = ["math question 1", "poem request 2", "math question 1"]
+    outputs = cached.run_batch(inputs)
+    assert outputs[0] == "math: math question 1" and outputs[1] == "poet: poem request 2"
+    assert embedder._inputs == 3
+    assert cached.run_batch(inputs) == outputs and calls == Counter({"math": 2, "poet": 1})
+
+def test_model_scope_reuses_only_the_selected_models_answers():
+    calls = Counter()
+    cached, _ = build(calls, threshold=0.5, scope="model")
+    cached("math question 4")
+    # routed to the other model, so the similar cached math answer is not reused
+    assert cached("poem request 4").startswith("poet")
+    assert cached("math question 4") == "math: math question 4"
+    assert calls == Counter({"math": 1, "poet": 1})
+
+def test_async_run_hits_the_cache():
+    calls = Counter()
+    cached, _ = build(calls, threshold=0.99)
+    first = asyncio.run(cached.arun("poem request 7"))
+    assert asyncio.run(cached.arun("poem request 7")) == first and calls["poet"] == 1
+
+def test_least_recently_hit_entries_are_evicted():
+    cache = SemanticCache(threshold=0.99, max_entries=2)
+    vectors = np.eye(3, dtype=np.float32)
+    cache.add(vectors[0], "a")
+    cache.add(vectors[1], "b")
+    assert cache.lookup(vectors[0])[0] == "a"
+    cache.add(vectors[2], "c")
+    assert cache.lookup(vectors[1])[0] is MISSING
+    assert cache.lookup(vectors[0])[0] == "a" and cache.lookup(vectors[2])[0] == "c"
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,55 @@
+import os
+import signal
+import time
+import numpy as np
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("sklearn")
+from magic_carpet.embedders import HashEmbedder
+from magic_carpet.routers.model_map_router import ModelMapRouter
+from magic_carpet.routers.serving import RouterPool
+
+@pytest.fixture
+def router():
+    prompts = [f"question {i} about topic {i % 5}" for i in range(40)]
+    data = pd.DataFrame({"prompt": prompts, "A": [i % 2 for i in range(40)], "B": [(i + 1) % 2 for i in range(40)]})
+    models = [{"name": "A", "function": lambda x: "A"}, {"name": "B", "function": lambda x: "B"}]
+    return ModelMapRouter(models, data=data, embedder=HashEmbedder(d=16), model_dim=12)
+
+def test_pool_routes_like_the_router(router, tmp_path):
+    inputs = [f"question {i}" for i in range(20)]
+    expected = [str(model) for model, _ in router.route_batch(inputs)]
+    with RouterPool.from_router(router, str(tmp_path), num_workers=2) as pool:
+        assert [name for name, _ in pool.route_batch(inputs)] == expected
+
+def test_pool_replaces_a_worker_that_dies(router, tmp_path):
+    with RouterPool.from_router(router, str(tmp_path), num_workers=2) as pool:
+        pool.check_interval = 0.1
+        pool.route_batch(["warm up"] * 4)
+        worker_id, pid = next(iter(pool.pids.items()))
+        os.kill(pid, signal.SIGKILL)
+        deadline = time.monotonic() + 10
+        while (worker_id in pool.workers or len(pool.pids) < 2) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert pool.restarts == 1 and len(pool.workers) == 2
+        # the surviving and the replacement worker both keep serving
+        assert len(pool.route_batch([f"question {i}" for i in range(10)])) == 10
+
+def test_a_dead_worker_fails_only_its_own_requests(router, tmp_path):
+    with RouterPool.from_router(router, str(tmp_path), num_workers=2) as pool:
+        pool.check_interval = 0.1
+        worker_id, pid = next(iter(pool.pids.items()))
+        # a stopped worker holds on to the requests it is given until it is killed
+        os.kill(pid, signal.SIGSTOP)
+        futures = [pool.submit([f"question {i}"]) for i in range(4)]
+        assert len(pool.assigned[worker_id]) == 2
+        os.kill(pid, signal.SIGKILL)
+        failed = served = 0
+        for future in futures:
+            try:
+                future.result(timeout=10)
+                served += 1
+            except RuntimeError:
+                failed += 1
+        assert failed == 2 and served == 2
@@ -0,0 +1,68 @@
+import asyncio
+from collections import Counter
+import pytest
+from magic_carpet.utils import agenerate, generate, make_requests
+
+def counting_model(name: str, calls: Counter):
+    samples = Counter()
+    def model(input):
+        calls[name] += 1
+        samples[input] += 1
+        # every call returns a distinct sample, so repeated calls are visible in the output
+        return f"{name}:{input}:{samples[input]}"
+    return model
+
+def counting_evaluator(name: str, calls: Counter):
+    def evaluator(input, response):
+        calls[name] += 1
+        return len(response)
+    return evaluator
+
+def overlapping_requests(calls: Counter):
+    m1, m2 = counting_model("m1", calls), counting_model("m2", calls)
+    length = counting_evaluator("length", calls)
+    return make_requests([
+        (["a", "a", "b"], [m1, m2], [length]),
+        (["a", "c"], [m1], [length]),
+    ])
+
+def test_generate_deduplicates_model_and_evaluator_calls():
+    calls = Counter()
+    requests, model_container, eval_container = overlapping_requests(calls)
+    generations = generate(requests, model_container, eval_container)
+    # distinct (model, input) pairs: m1 on a, b, c and m2 on a, b
+    assert calls["m1"] == 3 and calls["m2"] == 2
+    assert calls["length"] == 5
+    # the repeated "a" in the first request shares one entry, the second request still gets its own copy
+    by_input = {record["input"]: record["generations"] for record in generations}
+    assert [g["response"] for g in by_input["a"]] == ["m1:a:1", "m2:a:1", "m1:a:1"]
+    assert all(g["scores"][0]["score"] == len(g["response"]) for g in by_input["a"])
+
+def test_generate_without_deduplication_keeps_every_sample():
+    calls = Counter()
+    requests, model_container, eval_container = overlapping_requests(calls)
+    generations = generate(requests, model_container, eval_container, deduplicate=False)
+    assert calls["m1"] == 5 and calls["m2"] == 3
+    assert calls["length"] == 8
+    by_input = {record["input"]: record["generations"] for record in generations}
+    assert sorted(g["response"] for g in by_input["a"]) == ["m1:a:1", "m1:a:2", "m1:a:3", "m2:a:1", "m2:a:2"]
+    assert len(by_input["b"]) == 2 and len(by_input["c"]) == 1
+
+@pytest.mark.parametrize("deduplicate", [True, False])
+def test_agenerate_matches_generate(deduplicate):
+    sync_calls, async_calls = Counter(), Counter()
+    requests, model_container, eval_container = overlapping_requests(sync_calls)
+    expected = generate(requests, model_container, eval_container, deduplicate=deduplicate)
+    requests, model_container, eval_container = overlapping_requests(async_calls)
+    assert asyncio.run(agenerate(requests, model_container, eval_container, deduplicate=deduplicate)) == expected
+    assert async_calls == sync_calls
+
+@pytest.mark.parametrize("deduplicate", [True, False])
+def test_columnar_keeps_every_sample(deduplicate):
+    pytest.importorskip("numpy")
+    calls = Counter()
+    requests, model_container, eval_container = overlapping_requests(calls)
+    columns = generate(requests, model_container, eval_container, columnar=True, deduplicate=deduplicate)
+    responses = [response for response in columns["responses"].reshape(-1) if response is not None]
+    assert len(responses) == calls["m1"] + calls["m2"]
+    assert columns["inputs"].count("a") == (1 if deduplicate else 3)